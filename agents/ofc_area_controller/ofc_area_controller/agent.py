@@ -19,6 +19,7 @@ __docformat__ = 'reStructuredText'
 
 import sys
 import logging
+import time
 from collections import defaultdict
 from datetime import timedelta
 
@@ -28,6 +29,8 @@ from volttron.platform.vip.agent import Agent, Core, RPC
 from volttron.platform.scheduling import periodic
 from volttron.platform.agent.utils import format_timestamp, get_aware_utc_now
 
+from ofc_area_controller.priority import PriorityLanes, ROUTINE, URGENT
+
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
@@ -73,6 +76,12 @@ class OFCController(Agent):
         config (dict): The agent's configuration settings.
         control_ct (int): A counter for control actions.
         counter (int): A general-purpose counter for operations.
+        cycle (int): Number of the current control cycle, sent with every area request.
+        lanes (PriorityLanes): Queues actuations by priority class, None to actuate inside do_control.
+        cadence_config (dict): Occupancy-adaptive request rate settings ("vacancy_timeout", "vacant_interval"),
+            empty to request every area every cycle.
+        last_occupied (dict): Time each area was last seen occupied, in epoch seconds.
+        last_requested (dict): Time a control request was last published for each area, in epoch seconds.
     """
 
     def __init__(self, config, **kwargs):
@@ -88,6 +97,12 @@ class OFCController(Agent):
         self.config = config
         self.control_ct = 0
         self.counter = 0
+        self.cycle = 0
+        priority_config = config.get("priority", {})
+        self.lanes = PriorityLanes(priority_config.get("weights")) if priority_config.get("enabled") else None
+        self.cadence_config = config.get("cadence", {})
+        self.last_occupied = {}
+        self.last_requested = {}
         self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"], pattern="config")
         self.vip.config.subscribe(self.add_area, actions=["NEW", "UPDATE"], pattern="areas/*")
         self.vip.config.subscribe(self.remove_area, actions="DELETE", pattern="areas/*")
@@ -104,6 +119,10 @@ class OFCController(Agent):
         """
         _log.info(f"In onstart self.config: {self.config} sender: {sender} kwargs: {kwargs}")
         self.periodic_f = self.core.schedule(periodic(10), self.start_control_loop)
+        if self.lanes:
+            self.core.spawn(self.lanes.run)
+        if self.cadence_config:
+            self.vip.pubsub.subscribe('pubsub', "devices/", self._handle_device_publish)
         _log.info(f"Finished onstart self.config: {self.config} sender: {sender} kwargs: {kwargs}")
 
     def configure(self, config_name, action, contents):
@@ -127,7 +146,7 @@ class OFCController(Agent):
         """
         _log.info(f"In add_area with config_name: {config_name} action: {action}, contents: {contents}")
         try:
-            endpoints = TYPE_TO_ENDPOINT_MAP.copy()
+            endpoints = {device_type: [] for device_type in TYPE_TO_ENDPOINT_MAP}
             devices = contents.get("Devices", [])
             for device in devices:
                 device_type = device.get("Type")
@@ -140,6 +159,8 @@ class OFCController(Agent):
                 "endpoints": endpoints,
                 "control_options": contents.get("Control Options")
             }
+            # Areas count as occupied until their sensors say otherwise
+            self.last_occupied.setdefault(config_name, time.time())
         except Exception as e:
             _log.error(f"Error in add_area: {e}")
         _log.info(f"Finished add_area")
@@ -156,6 +177,8 @@ class OFCController(Agent):
         existing_area = self.areas.get(config_name)
         if existing_area:
             del self.areas[config_name]
+            self.last_occupied.pop(config_name, None)
+            self.last_requested.pop(config_name, None)
         _log.info(f"Finished remove_area")
 
     @RPC.export
@@ -167,6 +190,15 @@ class OFCController(Agent):
         """
         return self.areas
 
+    @RPC.export
+    def get_lane_stats(self):
+        """
+        RPC method to retrieve the queue depth and wait times of each priority lane.
+
+        :return: Dictionary of lane statistics keyed by lane, or None if priority lanes are disabled.
+        """
+        return self.lanes.stats() if self.lanes else None
+
     def get_topic_data_from_historian(self, topic):
         """
         Fetches historical data for a given topic from the platform historian.
@@ -223,16 +255,80 @@ class OFCController(Agent):
     def start_control_loop(self):
         """
         Start the control loop which periodically publishes control messages to endpoints.
+
+        Each message carries the cycle number and the number of areas in the cycle so control algorithms can tell
+        when they have seen every request of a cycle.  With an occupancy-adaptive cadence, areas that have been
+        vacant for longer than the vacancy timeout are only included once every vacant interval.
         """
         try:
-            headers = {"from": self.core.identity}
-            for area_name, config in self.areas.items():
-                msg = {"area": area_name, "endpoints": config.get("endpoints")}
-                _log.info(f"Publishing control message for area {area_name}: {msg}")
-                self.vip.pubsub.publish('pubsub', "agent/ofc_generic_control_algorithm", headers, msg)
+            now = time.time()
+            vacant_interval = self.cadence_config.get("vacant_interval", 300)
+            areas = [area_name for area_name in self.areas
+                     if not self.is_vacant(area_name, now)
+                     or now - self.last_requested.get(area_name, 0) >= vacant_interval]
+            self.publish_requests(areas)
         except Exception as e:
             _log.error(f"Error in start_control_loop: {e}")
 
+    def publish_requests(self, areas, priority=None):
+        """
+        Publish one control cycle with a request for each of the given areas.
+
+        :param areas: Names of the areas to request control for.
+        :param priority: Priority class for every request, defaults to each area's "Priority" control option.
+        """
+        headers = {"from": self.core.identity}
+        self.cycle += 1
+        now = time.time()
+        for area_name in areas:
+            config = self.areas[area_name]
+            control_options = config.get("control_options") or {}
+            msg = {"area": area_name, "endpoints": config.get("endpoints"),
+                   "control_options": config.get("control_options"), "cycle": self.cycle,
+                   "cycle_size": len(areas), "priority": priority or control_options.get("Priority", ROUTINE)}
+            _log.info(f"Publishing control message for area {area_name}: {msg}")
+            self.vip.pubsub.publish('pubsub', "agent/ofc_generic_control_algorithm", headers, msg)
+            self.last_requested[area_name] = now
+
+    def is_vacant(self, area_name, now=None):
+        """
+        Check whether an area has been unoccupied for longer than the vacancy timeout.
+
+        :param area_name: Name of the area.
+        :param now: Current time in epoch seconds, defaults to ``time.time()``.
+        :return: True if the area is vacant, always False without an occupancy-adaptive cadence or for areas
+            without occupancy sensors.
+        """
+        if not self.cadence_config or not self.areas.get(area_name, {}).get("endpoints", {}).get("Occupancy"):
+            return False
+        now = time.time() if now is None else now
+        return now - self.last_occupied.get(area_name, now) >= self.cadence_config.get("vacancy_timeout", 900)
+
+    def _handle_device_publish(self, peer, sender, bus, topic, headers, message):
+        """
+        Track occupancy from device scrapes and request control at once for vacant areas that become occupied.
+
+        :param topic: Topic of the form ``devices/<device path>/all``.
+        :param headers: Headers associated with the message.
+        :param message: List of the point values and their metadata.
+        """
+        if not topic.endswith("/all") or not message:
+            return
+        device = topic[len("devices/"):-len("/all")]
+        now = time.time()
+        occupied = {f"{device}/{point}" for point, value in message[0].items() if value}
+        if not occupied:
+            return
+        returning = []
+        for area_name, config in self.areas.items():
+            if occupied.intersection(config["endpoints"].get("Occupancy", [])):
+                if self.is_vacant(area_name, now):
+                    returning.append(area_name)
+                self.last_occupied[area_name] = now
+        if returning:
+            _log.info(f"Occupancy detected in vacant areas {returning}, requesting control")
+            self.publish_requests(returning, priority=URGENT)
+
     def schedule_and_actuate(self, endpoint, value):
         """
         Schedules and performs actuation for a given endpoint with the specified value.
@@ -266,16 +362,34 @@ class OFCController(Agent):
             _log.error(f"Error actuating endpoint {endpoint}: {e}")
 
     @RPC.export
-    def do_control(self, area_name, light_level, facade_state):
+    def do_control(self, area_name, light_level, facade_state, priority=ROUTINE):
         """
         Perform control actions for a specified area by adjusting light level and façade state.
 
+        With priority lanes enabled the actuation is queued in the lane for its priority class and this method
+        returns immediately.
+
         :param area_name: Name of the area to control.
         :param light_level: Desired light level for the area.
         :param facade_state: Desired façade state for the area.
+        :param priority: Priority class of the control, e.g. "urgent" for event triggered controls.
         """
         _log.info(
-            f"Entered do_control with area: {area_name}, light_level: {light_level}, facade_state: {facade_state}")
+            f"Entered do_control with area: {area_name}, light_level: {light_level}, facade_state: {facade_state}, "
+            f"priority: {priority}")
+        if self.lanes:
+            self.lanes.submit(priority, self.actuate_area, area_name, light_level, facade_state)
+        else:
+            self.actuate_area(area_name, light_level, facade_state)
+
+    def actuate_area(self, area_name, light_level, facade_state):
+        """
+        Actuate the light and façade endpoints of an area.
+
+        :param area_name: Name of the area to control.
+        :param light_level: Desired light level for the area.
+        :param facade_state: Desired façade state for the area.
+        """
         area = self.areas.get(area_name)
         if not area:
             _log.error(f"Area {area_name} not found in areas: {self.areas.keys()}")
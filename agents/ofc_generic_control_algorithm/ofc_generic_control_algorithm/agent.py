@@ -20,10 +20,20 @@ __docformat__ = 'reStructuredText'
 import sys
 import logging
 import datetime
+import time
+from collections import deque
 # Volttron
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC, PubSub
 from volttron.platform.messaging import headers as headers_mod
+from volttron.platform.scheduling import periodic
+
+from ofc_generic_control_algorithm.hysteresis import AreaStateMachine
+from ofc_generic_control_algorithm.optimizer import GridSearchOptimizer, GRID_SEARCH_ALGORITHM
+from ofc_generic_control_algorithm.partition import AreaPartitioner
+from ofc_generic_control_algorithm.priority import PriorityLanes, ROUTINE, URGENT
+from ofc_generic_control_algorithm.resample import Resampler, to_epoch
+from ofc_generic_control_algorithm.solar import SolarTables
 
 
 utils.setup_logging()
@@ -31,6 +41,12 @@ _log = logging.getLogger(__name__)
 
 __version__ = "0.1"
 
+POOL_TOPIC_PREFIX = "ofc/control_algorithm_pool"
+DEFAULT_RULE_ID = -1
+DEFAULT_REQUEST_BUDGET = 10
+DEFAULT_EVENT_DEBOUNCE = 2
+
+
 def ofc_generic_control_algorithm(config_path, **kwargs):
     """
     Load configuration from the given config path and instantiate an OFCGenericControlAlgorithm agent.
@@ -62,6 +78,26 @@ class OFCGenericControlAlgorithm(Agent):
         control_ct (int): Counter for tracking control actions.
         counter (int): General-purpose counter for operations.
         algorithm_params (dict): Parameters defining the control algorithm logic.
+        partitioner (AreaPartitioner): Shares areas with other agents in the same pool, None when not partitioned.
+        analysis_config (dict): How analysis records are published ("format", "batch", "flush_interval").
+        analysis_batches (dict): Analysis records waiting to be published, keyed by area controller.
+        optimizer (GridSearchOptimizer): Optimizer for areas using the "OFC Grid Search" algorithm, None until
+            the "optimizer" config is stored.
+        solar_tables (SolarTables): Memory-mapped solar position tables, None when not configured.
+        last_decisions (dict): Last states calculated from complete input data, keyed by area.
+        resampler (Resampler): Aligns input series to a common time grid, None to average the raw samples.
+        stats (dict): Counters of handled requests, abandoned historian queries, fallbacks, skipped areas,
+            inputs without fresh data and event triggers.
+        event_config (dict): Event-driven evaluation settings ("enabled", "debounce").
+        area_requests (dict): Latest periodic request of each area, keyed by area, replayed on event triggers.
+        endpoint_areas (dict): Areas and input types fed by each endpoint topic.
+        event_samples (dict): Latest published (timestamp, value) of each endpoint topic.
+        pending_triggers (dict): Areas with a scheduled event evaluation, mapped to the trigger details.
+        trigger_latencies (deque): Details of the most recent event triggers, including their reaction latency.
+        lanes (PriorityLanes): Queues area requests by priority class, None to handle them in arrival order.
+        hysteresis_config (dict): Deadbands per input type ("deadband") and minimum dwell times per output type
+            ("min_dwell"), empty to apply every decision as calculated.
+        state_machines (dict): Applied states and dwell timers of each area, keyed by area.
     """
 
     def __init__(self, config, **kwargs):
@@ -77,17 +113,193 @@ class OFCGenericControlAlgorithm(Agent):
         self.config = config
         self.control_ct = 0
         self.counter = 0
+        self.algorithm_params = []
+        self.partitioner = None
+        self.pool_topic = None
+        self.analysis_config = config.get("analysis", {})
+        self.analysis_batches = {}
+        self.optimizer = None
+        self.solar_tables = None
+        self.last_decisions = {}
+        resample_config = config.get("resample")
+        self.resampler = Resampler(**resample_config) if resample_config else None
+        self.stats = {"requests": 0, "historian_timeouts": 0, "fallbacks": 0, "skipped": 0, "stale_inputs": 0,
+                      "triggers": 0, "suppressed_transitions": 0}
+        self.event_config = config.get("events", {})
+        self.area_requests = {}
+        self.endpoint_areas = {}
+        self.event_samples = {}
+        self.pending_triggers = {}
+        self.trigger_latencies = deque(maxlen=100)
+        priority_config = config.get("priority", {})
+        self.lanes = PriorityLanes(priority_config.get("weights")) if priority_config.get("enabled") else None
+        self.hysteresis_config = config.get("hysteresis", {})
+        self.state_machines = {}
         self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"], pattern="config")
+        self.vip.config.subscribe(self.configure_optimizer, actions=["NEW", "UPDATE"], pattern="optimizer")
 
     @Core.receiver('onstart')
     def onstart(self, sender, **kwargs):
         """
-        Core receiver that is triggered when the agent starts. Placeholder for future startup actions.
+        Core receiver that is triggered when the agent starts. Joins the agent pool if partitioning is enabled.
 
         :param sender: The source of the event.
         :param kwargs: Additional arguments.
         """
-        pass
+        partition_config = self.config.get("partition", {})
+        if partition_config.get("enabled"):
+            self.start_partitioning(partition_config)
+        if self.analysis_config.get("batch"):
+            flush_interval = self.analysis_config.get("flush_interval", 30)
+            self.core.schedule(periodic(flush_interval), self.flush_stale_analysis_batches)
+        solar_config = self.config.get("solar_tables")
+        if solar_config:
+            self.load_solar_tables(solar_config)
+        if self.event_config.get("enabled"):
+            self.vip.pubsub.subscribe('pubsub', "devices/", self._handle_device_publish)
+        if self.lanes:
+            self.core.spawn(self.lanes.run)
+
+    @Core.receiver('onstop')
+    def onstop(self, sender, **kwargs):
+        """
+        Core receiver that is triggered when the agent stops. Publishes pending analysis batches and tells the
+        pool to hand over this agent's areas.
+
+        :param sender: The source of the event.
+        :param kwargs: Additional arguments.
+        """
+        for controller in list(self.analysis_batches):
+            self.flush_analysis_batch(controller)
+        if self.partitioner:
+            self.publish_membership("leave")
+
+    def load_solar_tables(self, solar_config):
+        """
+        Memory-map the solar position tables, building them first if they do not exist yet.
+
+        :param solar_config: Dictionary with "path", "year", "latitude", "longitude", "orientations" and the
+            optional "step_minutes".
+        """
+        try:
+            self.solar_tables = SolarTables.load_or_build(
+                solar_config["path"], solar_config["year"], solar_config["latitude"], solar_config["longitude"],
+                solar_config["orientations"], solar_config.get("step_minutes", 5))
+            _log.info(f"Loaded solar tables from {solar_config['path']}")
+        except Exception as e:
+            _log.error(f"Failed to load solar tables: {e}")
+
+    def solar_inputs(self, control_options, timestamp=None):
+        """
+        Look up the sun's position for an area.
+
+        :param control_options: The area's "Control Options", whose "Façade Orientation" names an orientation in
+            the solar tables.
+        :param timestamp: Time to look up, defaults to now.
+        :return: Dictionary with the "Solar Altitude" and, for areas with a known orientation, "Solar Incidence"
+            inputs.  Empty when no solar tables are loaded.
+        """
+        if not self.solar_tables:
+            return {}
+        timestamp = time.time() if timestamp is None else timestamp
+        orientation = control_options.get("Façade Orientation")
+        if orientation not in self.solar_tables.incidence:
+            orientation = None
+        position = self.solar_tables.lookup(timestamp, orientation)
+        inputs = {"Solar Altitude": position["altitude"]}
+        if orientation is not None:
+            inputs["Solar Incidence"] = position["incidence"]
+        return inputs
+
+    def start_partitioning(self, partition_config):
+        """
+        Join a pool of control algorithm agents that split the areas between them.
+
+        Every agent in the pool still receives every area request but only handles the areas it owns.
+        Members announce themselves on ``ofc/control_algorithm_pool/<pool>`` and ownership is rebalanced
+        whenever a member joins, leaves or stops sending heartbeats.
+
+        :param partition_config: Dictionary with the optional keys "pool", "heartbeat_interval" and "member_timeout".
+        """
+        pool = partition_config.get("pool", "default")
+        heartbeat_interval = partition_config.get("heartbeat_interval", 5)
+        member_timeout = partition_config.get("member_timeout", 3 * heartbeat_interval)
+        self.pool_topic = f"{POOL_TOPIC_PREFIX}/{pool}"
+        self.partitioner = AreaPartitioner(self.core.identity, member_timeout=member_timeout)
+        _log.info(f"Joining control algorithm pool {pool} as {self.core.identity}")
+        self.vip.pubsub.subscribe('pubsub', self.pool_topic, self._handle_pool_membership)
+        self.publish_membership("join")
+        self.core.schedule(periodic(heartbeat_interval), self.publish_membership, "heartbeat")
+
+    def publish_membership(self, action):
+        """
+        Publish a membership message for this agent to the pool.
+
+        :param action: One of "join", "heartbeat" or "leave".
+        """
+        msg = {"member": self.core.identity, "action": action}
+        self.vip.pubsub.publish('pubsub', self.pool_topic, {"from": self.core.identity}, msg)
+
+    def _handle_pool_membership(self, peer, sender, bus, topic, headers, message):
+        """
+        Track the other members of the pool.
+
+        :param peer: The peer that sent the message.
+        :param sender: The sender of the message.
+        :param bus: The message bus.
+        :param topic: The topic of the message.
+        :param headers: Headers associated with the message.
+        :param message: The message payload.
+        """
+        member = message.get("member")
+        if not member or member == self.core.identity:
+            return
+        action = message.get("action")
+        if action == "leave":
+            self.partitioner.leave(member)
+            return
+        is_new = self.partitioner.heartbeat(member)
+        if is_new and action == "join":
+            # Let the new member learn about us without waiting for the next heartbeat
+            self.publish_membership("heartbeat")
+
+    @RPC.export
+    def get_stats(self):
+        """
+        RPC method to retrieve the agent's request counters.
+
+        :return: Dictionary of counters.
+        """
+        return dict(self.stats)
+
+    @RPC.export
+    def get_trigger_latencies(self):
+        """
+        RPC method to retrieve the most recent event triggers.
+
+        :return: List of dictionaries with the area, topic, value and reaction latency in seconds of each trigger.
+        """
+        return list(self.trigger_latencies)
+
+    @RPC.export
+    def get_lane_stats(self):
+        """
+        RPC method to retrieve the queue depth and wait times of each priority lane.
+
+        :return: Dictionary of lane statistics keyed by lane, or None if priority lanes are disabled.
+        """
+        return self.lanes.stats() if self.lanes else None
+
+    @RPC.export
+    def get_partition(self):
+        """
+        RPC method to retrieve the members of this agent's pool.
+
+        :return: Dictionary with the pool members, or None if partitioning is disabled.
+        """
+        if not self.partitioner:
+            return None
+        return {"member": self.core.identity, "members": self.partitioner.live_members()}
 
     def configure(self, config_name, action, contents):
         """
@@ -100,6 +312,53 @@ class OFCGenericControlAlgorithm(Agent):
         _log.info(f"In configure with config_name: {config_name} action: {action}, contents: {contents}")
         self.algorithm_params = contents
 
+    def configure_optimizer(self, config_name, action, contents):
+        """
+        Handles updates to the grid search optimizer parameters, precomputing its response tables.
+
+        :param config_name: Name of the configuration file.
+        :param action: The type of action (e.g., "NEW", "UPDATE").
+        :param contents: The optimizer parameters.
+        """
+        _log.info(f"In configure_optimizer with config_name: {config_name} action: {action}, contents: {contents}")
+        try:
+            self.optimizer = GridSearchOptimizer(contents)
+        except Exception as e:
+            _log.error(f"Invalid optimizer config: {e}")
+
+    def calculate_area_state(self, input_data, control_options, area=None):
+        """
+        Calculate the output states with the algorithm selected by the area's control options.
+
+        Areas listing "OFC Grid Search" in their "Algorithms" use the grid search optimizer once it is configured,
+        all other areas use the threshold rules in calculate_state.  With hysteresis configured the decision goes
+        through the area's state machine, which applies the deadbands and minimum dwell times.
+
+        :param input_data: The average input data for each input type.
+        :param control_options: The area's "Control Options", may be empty.
+        :param area: Name of the area, needed for hysteresis.
+        :return: A dictionary with the desired states for the outputs (Light, Façade State).
+        """
+        if self.optimizer and GRID_SEARCH_ALGORITHM in control_options.get("Algorithms", []):
+            states = self.optimizer.calculate_state(input_data)
+            latched = states
+        else:
+            states = self.calculate_state(input_data)
+            latched = None
+        if not self.hysteresis_config or area is None:
+            return states
+
+        machine = self.state_machines.get(area)
+        if machine is None:
+            machine = self.state_machines[area] = AreaStateMachine(self.hysteresis_config.get("min_dwell"))
+        if latched is None:
+            latched = self.calculate_state(input_data, machine.active_rules(), self.hysteresis_config.get("deadband"))
+        states, suppressed = machine.apply(states, latched, time.time())
+        if suppressed:
+            self.stats["suppressed_transitions"] += len(suppressed)
+            _log.info(f"Suppressed {suppressed} transitions for area {area}")
+        return states
+
     def get_topic_data_from_historian(self, topic):
         """
         Fetch historical data for a given topic from the platform historian.
@@ -109,13 +368,7 @@ class OFCGenericControlAlgorithm(Agent):
         """
         _log.info(f"In get_topic_data_from_historian with topic: {topic}")
         try:
-            data = self.vip.rpc.call(
-                'platform.historian',
-                'query',
-                topic=topic,
-                count=10,  # Maximum number of data points to return
-                order="LAST_TO_FIRST"
-            ).get(timeout=10)  # Timeout in seconds
+            data = self.query_historian(topic).get(timeout=10)  # Timeout in seconds
 
             if data:
                 _log.info(f"Received data: {data}")
@@ -126,31 +379,79 @@ class OFCGenericControlAlgorithm(Agent):
         except Exception as e:
             _log.info(f"Failed to fetch data: {str(e)}")
 
-    def get_all_input_data(self, inputs):
+    def query_historian(self, topic):
+        """
+        Start a query for the latest data of a topic without waiting for the result.
+
+        :param topic: The topic to query.
+        :return: The pending RPC result.
+        """
+        return self.vip.rpc.call(
+            'platform.historian',
+            'query',
+            topic=topic,
+            count=10,  # Maximum number of data points to return
+            order="LAST_TO_FIRST"
+        )
+
+    def get_all_input_data(self, inputs, deadline=None, missing=None):
         """
         Fetches all input data for the given inputs (topics).
 
+        With a deadline all queries are sent at once and any query that has not answered by the deadline is
+        abandoned.
+
         :param inputs: A dictionary mapping input types to a list of topics.
+        :param deadline: Time (as returned by time.time()) by which all data must have arrived, or None to query
+            the topics one at a time.
+        :param missing: Optional list that the topics whose queries failed or were abandoned are appended to.
         :return: A dictionary with the collected data for each input type.
         """
         result = {input_type: {topic: [] for topic in topics} for input_type, topics in inputs.items()}
 
-        for input_type, list_of_topics in inputs.items():
-            for topic in list_of_topics:
-                data = self.get_topic_data_from_historian(topic)
-                if data:
-                    result[input_type][topic] = data.get("values")
+        if deadline is None:
+            for input_type, list_of_topics in inputs.items():
+                for topic in list_of_topics:
+                    data = self.get_topic_data_from_historian(topic)
+                    if data:
+                        result[input_type][topic] = data.get("values")
+            return result
+
+        pending = [(input_type, topic, self.query_historian(topic))
+                   for input_type, list_of_topics in inputs.items() for topic in list_of_topics]
+        for input_type, topic, query in pending:
+            try:
+                data = query.get(timeout=max(deadline - time.time(), 0))
+            except Exception as e:
+                _log.warning(f"Abandoned historian query for {topic}: {e!r}")
+                if missing is not None:
+                    missing.append(topic)
+                continue
+            if data:
+                result[input_type][topic] = data.get("values")
 
         return result
 
-    def process_input_data(self, input_data):
+    def process_input_data(self, input_data, now=None):
         """
         Process and calculate the average values for each input type.
 
+        When resampling is configured the series are first aligned to a common time grid ending at ``now`` and
+        samples older than the configured maximum age are ignored.
+
         :param input_data: The input data collected for different types.
+        :param now: Current time in epoch seconds, defaults to ``time.time()``.
         :return: A dictionary with the average value for each input type.
         """
         _log.info(f"In process_input_data with input_data: {input_data}")
+        if self.resampler:
+            stale = []
+            averages = self.resampler.aggregate(input_data, time.time() if now is None else now, stale)
+            if stale:
+                self.stats["stale_inputs"] += len(stale)
+                _log.warning(f"No fresh data for inputs {stale}")
+            return averages
+
         averages = {}
         for input_type, input_type_data_all in input_data.items():
             # Collect all values from lists under the current category
@@ -162,21 +463,28 @@ class OFCGenericControlAlgorithm(Agent):
                 averages[input_type] = 0  # Default to 0 if no valid data
         return averages
 
-    def calculate_state(self, input_data):
+    def calculate_state(self, input_data, active_rules=None, deadband=None):
         """
         Calculate the output control states based on input data and algorithm configuration.
 
         :param input_data: The average input data for each input type.
-        :return: A dictionary with the desired states for the outputs (Light, Façade State).
+        :param active_rules: Optional set of the indices of the rules that are currently applied.
+        :param deadband: Optional dictionary of how far below its threshold each input type may drop before an
+            active rule stops matching.
+        :return: A dictionary with the desired states for the outputs (Light, Façade State).  Each state also
+            carries the index of the rule that set it, or -1 for the default.
         """
-        states = {"Light": {"value": 0.1, "reason": "Default"}, "Façade State": {"value": 0, "reason": "Default"}}
+        states = {"Light": {"value": 0.1, "reason": "Default", "rule": DEFAULT_RULE_ID},
+                  "Façade State": {"value": 0, "reason": "Default", "rule": DEFAULT_RULE_ID}}
 
-        for config in self.algorithm_params:
+        for rule_id, config in enumerate(self.algorithm_params):
             conditions_met = True
             conditions = ""
             for inputs in config.get("Inputs", []):
                 input_type = inputs.get("Type")
                 threshold = inputs.get("Threshold")
+                if active_rules and deadband and rule_id in active_rules:
+                    threshold -= deadband.get(input_type, 0)
                 if input_type in input_data:
                     input_value = input_data.get(input_type)
                     if input_value < threshold:
@@ -196,6 +504,7 @@ class OFCGenericControlAlgorithm(Agent):
                 for output in outputs:
                     states[output.get("Type")]["value"] = output.get("Setting")
                     states[output.get("Type")]["reason"] = conditions
+                    states[output.get("Type")]["rule"] = rule_id
 
         return states
 
@@ -212,40 +521,333 @@ class OFCGenericControlAlgorithm(Agent):
         :param message: The message payload.
         """
         _log.info(f"_handle_area_control_request message: {message}")
+        if self.event_config.get("enabled"):
+            self.remember_area_request(sender, message)
+        priority = message.get("priority", ROUTINE)
+        batch = self.analysis_config.get("batch")
+        if self.lanes:
+            # Lanes only pass positional arguments: batch, samples and priority
+            self.lanes.submit(priority, self.control_area, sender, message, batch, None, priority)
+        else:
+            self.control_area(sender, message, batch=batch, priority=priority)
+
+    def control_area(self, sender, message, batch=False, samples=None, priority=ROUTINE):
+        """
+        Calculate the control states for an area, publish the analysis and send them to the area controller.
+
+        :param sender: Identity of the area controller that requested the control.
+        :param message: The area request.
+        :param batch: True to add the analysis to the controller's batch instead of publishing it.
+        :param samples: Optional dictionary of (timestamp, value) samples by topic that are newer than the
+            historian's data.
+        :param priority: Priority class of the request, passed on to the area controller when not routine.
+        :return: The states sent to the area controller, or None if the area was not controlled.
+        """
         area = message.get("area")
+        if self.partitioner and not self.partitioner.owns(area):
+            _log.debug(f"Skipping area {area} owned by {self.partitioner.owner(area)}")
+            if batch:
+                self.collect_analysis(sender, message)
+            return None
+        self.stats["requests"] += 1
         endpoints = message.get("endpoints")
-        input_data = self.get_all_input_data(endpoints)
+        deadline = time.time() + self.config.get("request_budget", DEFAULT_REQUEST_BUDGET)
+        missing = []
+        input_data = self.get_all_input_data(endpoints, deadline=deadline, missing=missing)
         _log.info(f"Input data after get_all_input_data: {input_data}")
-        input_data = self.process_input_data(input_data)
-        _log.info(f"Input data after process_input_data: {input_data}")
-        states = self.calculate_state(input_data)
+
+        stale = bool(missing)
+        if stale:
+            self.stats["historian_timeouts"] += len(missing)
+            states = self.last_decisions.get(area)
+            if states is None:
+                self.stats["skipped"] += 1
+                _log.warning(f"Skipping area {area}, no data for {missing} and no previous decision to fall back to")
+                if batch:
+                    self.collect_analysis(sender, message)
+                return None
+            self.stats["fallbacks"] += 1
+            _log.warning(f"Falling back to the last decision for area {area}, no data for {missing}")
+        else:
+            if samples:
+                self.merge_event_samples(input_data, samples)
+            input_data = self.process_input_data(input_data)
+            control_options = message.get("control_options") or {}
+            input_data.update(self.solar_inputs(control_options))
+            _log.info(f"Input data after process_input_data: {input_data}")
+            states = self.calculate_area_state(input_data, control_options, area)
+            self.last_decisions[area] = states
         _log.info(f"Calculated states: {states}")
 
-        # Prepare to publish the results
-        topic = "analysis/ofc_analysis/{id}".format(id=self.core.identity)
+        if batch:
+            self.collect_analysis(sender, message, self.analysis_record(area, states, stale))
+        else:
+            self.publish_analysis(area, states, stale)
+
+        light_level = states["Light"]["value"]
+        facade_state = states["Façade State"]["value"]
+        _log.info(f"Calling RPC method do_control on sender {sender}")
+        if priority == ROUTINE:
+            self.vip.rpc.call(sender, "do_control", area, light_level, facade_state)
+        else:
+            self.vip.rpc.call(sender, "do_control", area, light_level, facade_state, priority=priority)
+        return states
+
+    @staticmethod
+    def merge_event_samples(input_data, samples):
+        """
+        Put published samples that the historian has not stored yet in front of the historian data.
+
+        :param input_data: The input data collected by get_all_input_data, updated in place.
+        :param samples: Dictionary of (timestamp, value) samples by topic.
+        """
+        for topic_data in input_data.values():
+            for topic, values in topic_data.items():
+                sample = samples.get(topic)
+                if sample is None:
+                    continue
+                # Historian data is ordered newest first
+                if not values or to_epoch(sample[0]) > to_epoch(values[0][0]):
+                    topic_data[topic] = [sample] + list(values or [])
+
+    def remember_area_request(self, sender, message):
+        """
+        Keep the latest request of an area so event triggers can evaluate it between periodic requests.
+
+        :param sender: Identity of the area controller.
+        :param message: The area request.
+        """
+        area = message.get("area")
+        previous = self.area_requests.get(area)
+        self.area_requests[area] = (sender, message)
+        if previous and previous[1].get("endpoints") == message.get("endpoints"):
+            return
+        self.endpoint_areas = {}
+        for area_name, (_, request) in self.area_requests.items():
+            for input_type, topics in (request.get("endpoints") or {}).items():
+                for topic in topics:
+                    self.endpoint_areas.setdefault(topic, []).append((area_name, input_type))
+
+    def rule_thresholds(self, input_type):
+        """
+        :param input_type: Input type, e.g. "Glare".
+        :return: Set of the thresholds the rules compare the input type against, without rule inputs that have none.
+        """
+        return {rule_input.get("Threshold") for rule in self.algorithm_params
+                for rule_input in rule.get("Inputs", [])
+                if rule_input.get("Type") == input_type and rule_input.get("Threshold") is not None}
+
+    def _handle_device_publish(self, peer, sender, bus, topic, headers, message):
+        """
+        Handle a device scrape published by the platform driver and trigger an evaluation of every area with an
+        input that crossed a rule threshold.  Values that are not numbers, such as a driver's error strings, are
+        ignored.
+
+        Crossings are detected between single raw samples, while calculate_state decides on the average of the
+        recent samples, so a noisy sample hovering around a threshold can trigger an evaluation that does not change
+        the area's state.  The debounce interval and the pending trigger of each area limit how often that happens.
+
+        :param topic: Topic of the form ``devices/<device path>/all``.
+        :param headers: Headers associated with the message, the "Date" header is the scrape time.
+        :param message: List of the point values and their metadata.
+        """
+        if not topic.endswith("/all") or not message:
+            return
+        received = time.time()
+        device = topic[len("devices/"):-len("/all")]
+        try:
+            published = utils.parse_timestamp_string(headers[headers_mod.DATE]).timestamp()
+        except Exception:
+            published = received
+        timestamp = utils.format_timestamp(datetime.datetime.fromtimestamp(published, datetime.timezone.utc))
+
+        for point, value in message[0].items():
+            if not isinstance(value, (int, float)):
+                continue
+            endpoint = f"{device}/{point}"
+            previous = self.event_samples.get(endpoint)
+            self.event_samples[endpoint] = (timestamp, value)
+            if previous is None:
+                continue
+            for area, input_type in self.endpoint_areas.get(endpoint, []):
+                crossed = [threshold for threshold in self.rule_thresholds(input_type)
+                           if (previous[1] < threshold) != (value < threshold)]
+                if crossed:
+                    self.trigger_area(area, endpoint, value, published)
+
+    def trigger_area(self, area, endpoint, value, published):
+        """
+        Schedule an evaluation of an area after the debounce interval, unless one is already pending.
+
+        :param area: Name of the area.
+        :param endpoint: Topic of the input that crossed a threshold.
+        :param value: New value of the input.
+        :param published: Time the value was scraped, in epoch seconds.
+        """
+        if area in self.pending_triggers:
+            return
+        if self.partitioner and not self.partitioner.owns(area):
+            return
+        _log.info(f"{endpoint} crossed a threshold with value {value}, evaluating area {area}")
+        self.pending_triggers[area] = {"area": area, "topic": endpoint, "value": value, "published": published}
+        debounce = self.event_config.get("debounce", DEFAULT_EVENT_DEBOUNCE)
+        when = datetime.datetime.now() + datetime.timedelta(seconds=debounce)
+        if self.lanes:
+            self.core.schedule(when, self.lanes.submit, URGENT, self.evaluate_triggered_area, area)
+        else:
+            self.core.schedule(when, self.evaluate_triggered_area, area)
+
+    def evaluate_triggered_area(self, area):
+        """
+        Evaluate an area whose inputs crossed a threshold, using the latest published samples, and record the
+        reaction latency from the scrape to the control call.
+
+        :param area: Name of the area.
+        """
+        trigger = self.pending_triggers.pop(area, None)
+        request = self.area_requests.get(area)
+        if trigger is None or request is None:
+            return
+        sender, message = request
+        states = self.control_area(sender, message, samples=self.event_samples, priority=URGENT)
+        if states is None:
+            return
+        self.stats["triggers"] += 1
+        trigger["latency"] = time.time() - trigger["published"]
+        self.trigger_latencies.append(trigger)
+        _log.info(f"Event trigger for area {area} reacted in {trigger['latency']:.3f}s")
+
+    def analysis_headers(self):
+        """
+        Build the headers used when publishing analysis messages.
+
+        :return: Dictionary of message headers stamped with the current time.
+        """
         now = utils.format_timestamp(datetime.datetime.utcnow())
-        headers = {
+        return {
             "from": self.core.identity,
             headers_mod.DATE: now,
             headers_mod.TIMESTAMP: now
         }
 
-        light_level = states["Light"]["value"]
-        light_level_reason = states["Light"]["reason"]
-        facade_state = states["Façade State"]["value"]
-        facade_state_reason = states["Façade State"]["reason"]
+    def analysis_record(self, area, states, stale=False):
+        """
+        Build the structured analysis record for an area.
 
-        msg = {
+        :param area: Name of the area.
+        :param states: The states returned by calculate_state.
+        :param stale: True if the states are a previous decision reused because input data was missing.
+        :return: Dictionary with the numeric light level, façade state, the IDs of the rules that set them and the
+            stale flag (1 or 0).
+        """
+        return {
             "area": area,
-            "action": f"Set light level: {light_level}, Façade state: {facade_state}",
-            "reason": f"Light level reason: {light_level_reason}, Façade state reason: {facade_state_reason}"
+            "light_level": states["Light"]["value"],
+            "facade_state": states["Façade State"]["value"],
+            "light_rule": states["Light"].get("rule", DEFAULT_RULE_ID),
+            "facade_rule": states["Façade State"].get("rule", DEFAULT_RULE_ID),
+            "stale": int(stale)
         }
 
-        # Publish the results and invoke RPC to control the area
+    def publish_analysis(self, area, states, stale=False):
+        """
+        Publish the analysis for a single area.
+
+        The "text" format publishes human-readable action and reason strings to ``analysis/ofc_analysis/<id>``.
+        The "structured" format publishes the numeric analysis record to ``analysis/ofc_analysis/<id>/<area>``.
+
+        :param area: Name of the area.
+        :param states: The states returned by calculate_state.
+        :param stale: True if the states are a previous decision reused because input data was missing.
+        """
+        topic = "analysis/ofc_analysis/{id}".format(id=self.core.identity)
+
+        if self.analysis_config.get("format") == "structured":
+            topic = f"{topic}/{area}"
+            msg = self.analysis_record(area, states, stale)
+            del msg["area"]
+        else:
+            light_level = states["Light"]["value"]
+            light_level_reason = states["Light"]["reason"]
+            facade_state = states["Façade State"]["value"]
+            facade_state_reason = states["Façade State"]["reason"]
+
+            msg = {
+                "area": area,
+                "action": f"Set light level: {light_level}, Façade state: {facade_state}",
+                "reason": f"Light level reason: {light_level_reason}, Façade state reason: {facade_state_reason}"
+            }
+            if stale:
+                msg["reason"] = f"Stale, input data unavailable. Previous {msg['reason']}"
+
         _log.info(f"Publishing control message: {msg}")
-        self.vip.pubsub.publish('pubsub', topic, headers, msg)
-        _log.info(f"Calling RPC method do_control on sender {sender}")
-        self.vip.rpc(sender, "do_control", area, light_level, facade_state)
+        self.vip.pubsub.publish('pubsub', topic, self.analysis_headers(), msg)
+
+    def collect_analysis(self, sender, message, record=None):
+        """
+        Add an area's analysis record to the batch for its controller's current control cycle.
+
+        Area controllers tag each request with a "cycle" number and the "cycle_size" of that cycle.  The batch is
+        published once every request of the cycle has been seen, including requests handled by other pool members,
+        or when a request from a newer cycle arrives.
+
+        :param sender: Identity of the area controller that sent the request.
+        :param message: The area control request.
+        :param record: The analysis record, or None if this agent did not evaluate the area.
+        """
+        cycle = message.get("cycle")
+        batch = self.analysis_batches.get(sender)
+        if batch and batch["cycle"] != cycle:
+            self.flush_analysis_batch(sender)
+            batch = None
+        if batch is None:
+            batch = {"cycle": cycle, "seen": 0, "records": [], "started": time.time()}
+            self.analysis_batches[sender] = batch
+
+        if record:
+            batch["records"].append(record)
+        batch["seen"] += 1
+
+        cycle_size = message.get("cycle_size")
+        if cycle_size and batch["seen"] >= cycle_size:
+            self.flush_analysis_batch(sender)
+
+    def flush_analysis_batch(self, sender):
+        """
+        Publish the batched analysis records for a controller as a single columnar record.
+
+        :param sender: Identity of the area controller the batch belongs to.
+        """
+        batch = self.analysis_batches.pop(sender, None)
+        if not batch or not batch["records"]:
+            return
+
+        records = batch["records"]
+        msg = {
+            "batch": {
+                "controller": sender,
+                "cycle": batch["cycle"],
+                "areas": [r["area"] for r in records],
+                "light_level": [r["light_level"] for r in records],
+                "facade_state": [r["facade_state"] for r in records],
+                "light_rule": [r["light_rule"] for r in records],
+                "facade_rule": [r["facade_rule"] for r in records],
+                "stale": [r["stale"] for r in records]
+            }
+        }
+        topic = "analysis/ofc_analysis/{id}".format(id=self.core.identity)
+        _log.info(f"Publishing analysis batch with {len(records)} areas for {sender} cycle {batch['cycle']}")
+        self.vip.pubsub.publish('pubsub', topic, self.analysis_headers(), msg)
+
+    def flush_stale_analysis_batches(self):
+        """
+        Publish batches whose control cycle never completed, e.g. because the controller lost an area mid-cycle.
+        """
+        flush_interval = self.analysis_config.get("flush_interval", 30)
+        now = time.time()
+        for sender, batch in list(self.analysis_batches.items()):
+            if now - batch["started"] >= flush_interval:
+                self.flush_analysis_batch(sender)
 
 
 def main():
@@ -0,0 +1,340 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+Offline replay of control algorithm rule sets against recorded building data.
+
+The rules are evaluated with the same semantics as ``OFCGenericControlAlgorithm.process_input_data`` and
+``OFCGenericControlAlgorithm.calculate_state``, but over whole columns of a building-data CSV at once::
+
+    python -m ofc_generic_control_algorithm.backtest Building_Data_Int-Predictive.csv rule_sets.json \\
+        --column Glare=dgps_0_A --workers 4
+"""
+
+__docformat__ = 'reStructuredText'
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+# Same defaults calculate_state uses when no rule matches
+DEFAULT_STATES = {"Light": 0.1, "Façade State": 0}
+DEFAULT_RULE_ID = -1
+
+
+def evaluate_rules(rules, inputs, length):
+    """
+    Evaluate a rule set for every row of the input columns.
+
+    Rules are applied in order and a later matching rule overrides the outputs of an earlier one.  A rule matches
+    when every one of its inputs that is present in ``inputs`` is at or above its threshold.
+
+    :param rules: List of rules in the control algorithm config format.
+    :param inputs: Dictionary mapping input types to float arrays of averaged input values.
+    :param length: Number of rows.
+    :return: Dictionary mapping output types to a tuple of (setting array, rule id array).
+    """
+    states = {output_type: (np.full(length, value, dtype=np.float64), np.full(length, DEFAULT_RULE_ID, dtype=np.int32))
+              for output_type, value in DEFAULT_STATES.items()}
+
+    for rule_id, rule in enumerate(rules):
+        mask = np.ones(length, dtype=bool)
+        for rule_input in rule.get("Inputs", []):
+            values = inputs.get(rule_input.get("Type"))
+            if values is not None:
+                mask &= values >= rule_input.get("Threshold")
+        for output in rule.get("Outputs", []):
+            settings, rule_ids = states[output.get("Type")]
+            settings[mask] = output.get("Setting")
+            rule_ids[mask] = rule_id
+
+    return states
+
+
+class InputAverager(object):
+    """
+    Trailing mean of the last ``window`` samples of each input, carried across chunks.
+
+    Missing samples (NaN) are skipped and an input with no valid samples in its window averages to 0, matching
+    process_input_data.
+    """
+
+    def __init__(self, window=1):
+        """
+        :param window: Number of samples to average, including the current one.
+        """
+        self.window = window
+        self.tails = {}
+
+    def update(self, inputs):
+        """
+        Average the next chunk of input columns.
+
+        :param inputs: Dictionary mapping input types to float arrays.
+        :return: Dictionary mapping input types to averaged float arrays of the same length.
+        """
+        averaged = {}
+        for input_type, values in inputs.items():
+            tail = self.tails.get(input_type, np.empty(0))
+            values = np.concatenate([tail, values])
+            valid = ~np.isnan(values)
+            sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+            counts = np.concatenate([[0], np.cumsum(valid)])
+            end = np.arange(len(tail) + 1, len(values) + 1)
+            start = np.maximum(end - self.window, 0)
+            window_counts = counts[end] - counts[start]
+            window_sums = sums[end] - sums[start]
+            averaged[input_type] = np.divide(window_sums, window_counts, out=np.zeros(len(end)),
+                                             where=window_counts > 0)
+            self.tails[input_type] = values[-(self.window - 1):] if self.window > 1 else np.empty(0)
+        return averaged
+
+
+class RuleSetReplay(object):
+    """
+    Accumulates the replay metrics of one rule set over a stream of chunks.
+
+    Attributes:
+        rules (list): The rule set being replayed.
+        rows (int): Number of rows replayed so far.
+        actuations (dict): Number of changes of each output.
+        glare_exceedances (int): Rows where glare was at or above the limit and the façade was not protective.
+        light_energy (float): Lighting energy in Wh.
+    """
+
+    def __init__(self, rules, interval_minutes=15.0, glare_limit=0.4, protective_facade_state=1, light_power=1000.0):
+        """
+        :param rules: List of rules in the control algorithm config format.
+        :param interval_minutes: Time between rows of the building data.
+        :param glare_limit: Glare value at or above which a row counts as a glare exceedance.
+        :param protective_facade_state: Lowest façade state that protects against glare.
+        :param light_power: Installed lighting power in W at a light level of 1.0.
+        """
+        self.rules = rules
+        self.interval_hours = interval_minutes / 60.0
+        self.glare_limit = glare_limit
+        self.protective_facade_state = protective_facade_state
+        self.light_power = light_power
+        self.rows = 0
+        self.actuations = {output_type: 0 for output_type in DEFAULT_STATES}
+        self.glare_exceedances = 0
+        self.light_energy = 0.0
+        self.previous = {}
+
+    def update(self, inputs, length):
+        """
+        Replay the rule set over the next chunk of averaged inputs.
+
+        :param inputs: Dictionary mapping input types to averaged float arrays.
+        :param length: Number of rows in the chunk.
+        """
+        if not length:
+            return
+        states = evaluate_rules(self.rules, inputs, length)
+        for output_type, (settings, _) in states.items():
+            previous = self.previous.get(output_type)
+            changes = np.count_nonzero(settings[1:] != settings[:-1])
+            if previous is not None:
+                changes += int(settings[0] != previous)
+            self.actuations[output_type] += int(changes)
+            self.previous[output_type] = settings[-1]
+
+        glare = inputs.get("Glare")
+        if glare is not None:
+            facade_states = states["Façade State"][0]
+            exceeded = (glare >= self.glare_limit) & (facade_states < self.protective_facade_state)
+            self.glare_exceedances += int(np.count_nonzero(exceeded))
+
+        self.light_energy += float(states["Light"][0].sum()) * self.light_power * self.interval_hours
+        self.rows += length
+
+    def report(self):
+        """
+        :return: Dictionary with the replay metrics.
+        """
+        return {
+            "rows": self.rows,
+            "actuations": dict(self.actuations),
+            "glare_exceedances": self.glare_exceedances,
+            "light_energy_wh": self.light_energy
+        }
+
+
+def read_csv_chunks(csv_path, columns, chunk_size=100000, timings=None):
+    """
+    Stream input columns from a building-data CSV in chunks.
+
+    :param csv_path: Path to the CSV file.
+    :param columns: Dictionary mapping input types to CSV column names.
+    :param chunk_size: Number of rows per chunk.
+    :param timings: Optional dictionary whose "parse_seconds" the time spent reading and parsing is added to.
+    :return: Generator of dictionaries mapping input types to float arrays, empty cells are NaN.
+    """
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        missing = [name for name in columns.values() if name not in header]
+        if missing:
+            raise RuntimeError(f"Columns {missing} not found in {csv_path}")
+        indices = {input_type: header.index(name) for input_type, name in columns.items()}
+
+        while True:
+            start = time.perf_counter()
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                break
+            chunk = {input_type: np.array([float(row[idx]) if idx < len(row) and row[idx].strip() else np.nan
+                                           for row in rows])
+                     for input_type, idx in indices.items()}
+            if timings is not None:
+                timings["parse_seconds"] = timings.get("parse_seconds", 0.0) + time.perf_counter() - start
+            yield chunk
+
+
+def replay(chunks, rule_sets, window=1, timings=None, **kwargs):
+    """
+    Replay several rule sets over the same stream of input chunks.
+
+    :param chunks: Iterable of dictionaries mapping input types to float arrays.
+    :param rule_sets: List of rule sets.
+    :param window: Number of samples averaged per input, as process_input_data does with the historian query.
+    :param timings: Optional dictionary whose "evaluate_seconds" the time spent averaging the inputs and evaluating
+        the rule sets is added to.
+    :param kwargs: Metric options passed to RuleSetReplay.
+    :return: List of metric dictionaries, one per rule set.
+    """
+    averager = InputAverager(window)
+    replays = [RuleSetReplay(rules, **kwargs) for rules in rule_sets]
+    evaluate_seconds = 0.0
+    for chunk in chunks:
+        start = time.perf_counter()
+        averaged = averager.update(chunk)
+        length = len(next(iter(averaged.values()))) if averaged else 0
+        for rule_set_replay in replays:
+            rule_set_replay.update(averaged, length)
+        evaluate_seconds += time.perf_counter() - start
+    if timings is not None:
+        timings["evaluate_seconds"] = timings.get("evaluate_seconds", 0.0) + evaluate_seconds
+    return [rule_set_replay.report() for rule_set_replay in replays]
+
+
+def replay_csv(csv_path, rule_sets, columns, chunk_size=100000, timings=None, **kwargs):
+    """
+    Replay several rule sets over a building-data CSV, reading the file once.
+
+    :param csv_path: Path to the CSV file.
+    :param rule_sets: List of rule sets.
+    :param columns: Dictionary mapping input types to CSV column names.
+    :param chunk_size: Number of rows per chunk.
+    :param timings: Optional dictionary that the "parse_seconds" and "evaluate_seconds" of the replay are added to.
+    :param kwargs: Options passed to replay.
+    :return: List of metric dictionaries, one per rule set.
+    """
+    return replay(read_csv_chunks(csv_path, columns, chunk_size, timings), rule_sets, timings=timings, **kwargs)
+
+
+def _timed_replay_csv(*args, **kwargs):
+    timings = {}
+    return replay_csv(*args, timings=timings, **kwargs), timings
+
+
+def sweep(csv_path, rule_sets, columns, workers=1, timings=None, **kwargs):
+    """
+    Replay many candidate rule sets, spreading them over worker processes.
+
+    :param csv_path: Path to the CSV file.
+    :param rule_sets: List of rule sets.
+    :param columns: Dictionary mapping input types to CSV column names.
+    :param workers: Number of worker processes.
+    :param timings: Optional dictionary that the "parse_seconds" and "evaluate_seconds" of every worker are added to.
+    :param kwargs: Options passed to replay_csv.
+    :return: List of metric dictionaries in the same order as ``rule_sets``.
+    """
+    if workers <= 1 or len(rule_sets) <= 1:
+        return replay_csv(csv_path, rule_sets, columns, timings=timings, **kwargs)
+
+    groups = [rule_sets[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_timed_replay_csv, csv_path, group, columns, **kwargs)
+                   for group in groups if group]
+        group_results = []
+        for future in futures:
+            group_result, group_timings = future.result()
+            group_results.append(group_result)
+            if timings is not None:
+                for name, seconds in group_timings.items():
+                    timings[name] = timings.get(name, 0.0) + seconds
+
+    results = [None] * len(rule_sets)
+    for i, group_result in enumerate(group_results):
+        results[i::workers] = group_result
+    return results
+
+
+def main(argv=None):
+    """
+    Command line entry point.  Prints the metrics of each rule set as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Replay control algorithm rule sets against building data.")
+    parser.add_argument("csv", help="Building data CSV")
+    parser.add_argument("rules", help="JSON file with one rule set or a list of rule sets")
+    parser.add_argument("--column", action="append", default=[], metavar="TYPE=COLUMN",
+                        help="Map an input type to a CSV column, e.g. Glare=dgps_0_A")
+    parser.add_argument("--window", type=int, default=1, help="Samples averaged per input")
+    parser.add_argument("--interval-minutes", type=float, default=15.0)
+    parser.add_argument("--glare-limit", type=float, default=0.4)
+    parser.add_argument("--protective-facade-state", type=float, default=1)
+    parser.add_argument("--light-power", type=float, default=1000.0, help="Lighting power in W at full output")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    columns = dict(mapping.split("=", 1) for mapping in args.column)
+    with open(args.rules) as f:
+        rule_sets = json.load(f)
+    if rule_sets and isinstance(rule_sets[0], dict):
+        rule_sets = [rule_sets]
+
+    start = time.perf_counter()
+    timings = {"parse_seconds": 0.0, "evaluate_seconds": 0.0}
+    results = sweep(args.csv, rule_sets, columns, workers=args.workers, chunk_size=args.chunk_size,
+                    timings=timings, window=args.window, interval_minutes=args.interval_minutes,
+                    glare_limit=args.glare_limit, protective_facade_state=args.protective_facade_state,
+                    light_power=args.light_power)
+    elapsed = time.perf_counter() - start
+
+    # Parse and evaluation seconds are summed over the workers, so the evaluation rate is per worker
+    rows = sum(result["rows"] for result in results)
+    evaluate_seconds = timings["evaluate_seconds"]
+    json.dump({"elapsed_seconds": elapsed, "rule_set_rows_per_second": rows / elapsed if elapsed else None,
+               "parse_seconds": timings["parse_seconds"], "evaluate_seconds": evaluate_seconds,
+               "evaluated_rule_set_rows_per_second": rows / evaluate_seconds if evaluate_seconds else None,
+               "results": results}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
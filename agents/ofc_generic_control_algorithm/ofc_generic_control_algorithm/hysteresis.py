@@ -0,0 +1,96 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+__docformat__ = 'reStructuredText'
+
+import logging
+
+_log = logging.getLogger(__name__)
+
+
+class AreaStateMachine(object):
+    """
+    Holds an area's applied output states and keeps each output at its state for a minimum dwell time.
+
+    The rules that set the applied states are latched: calculate_state lowers their thresholds by the configured
+    deadband, so an input hovering around a threshold does not switch the rule on and off every cycle.
+
+    Attributes:
+        min_dwell (dict): Minimum seconds between changes of each output type.
+        states (dict): Applied states in the calculate_state format, None before the first decision.
+        changed_at (dict): Time each output last changed, in epoch seconds.
+        suppressed (dict): Number of suppressed transitions per output type.
+    """
+
+    def __init__(self, min_dwell=None):
+        """
+        :param min_dwell: Dictionary mapping output types to their minimum dwell time in seconds.
+        """
+        self.min_dwell = min_dwell or {}
+        self.states = None
+        self.changed_at = {}
+        self.suppressed = {}
+
+    def active_rules(self):
+        """
+        :return: Set of the rule indices that set the applied states.
+        """
+        if not self.states:
+            return set()
+        return {state.get("rule") for state in self.states.values()}
+
+    def apply(self, raw_states, latched_states, now):
+        """
+        Decide the states to apply from the states calculated with and without latching.
+
+        A transition counts as suppressed when the plain threshold rules would change an output but the deadband or
+        the minimum dwell time keeps it at its applied state.
+
+        :param raw_states: States calculated without deadbands.
+        :param latched_states: States calculated with the deadbands of the active rules.
+        :param now: Current time in epoch seconds.
+        :return: Tuple of (states to apply, list of output types whose transition was suppressed).
+        """
+        if self.states is None:
+            self.states = latched_states
+            self.changed_at = {output_type: now for output_type in latched_states}
+            return latched_states, []
+
+        kept = {}
+        applied = {}
+        suppressed = []
+        for output_type, state in latched_states.items():
+            previous = self.states.get(output_type)
+            held = False
+            if previous is not None and state["value"] != previous["value"]:
+                dwell = self.min_dwell.get(output_type, 0)
+                if now - self.changed_at.get(output_type, now) < dwell:
+                    held = True
+                else:
+                    self.changed_at[output_type] = now
+            if held:
+                kept[output_type] = previous
+                applied[output_type] = dict(previous, reason=f"Held for minimum dwell, {previous['reason']}")
+            else:
+                kept[output_type] = applied[output_type] = state
+            if previous is not None and raw_states[output_type]["value"] != previous["value"] \
+                    and kept[output_type]["value"] == previous["value"]:
+                suppressed.append(output_type)
+                self.suppressed[output_type] = self.suppressed.get(output_type, 0) + 1
+
+        self.states = kept
+        return applied, suppressed
@@ -0,0 +1,144 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+__docformat__ = 'reStructuredText'
+
+import logging
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+GRID_SEARCH_ALGORITHM = "OFC Grid Search"
+# Rule IDs reported for optimizer decisions, threshold rules use their index and -1 for the default
+OPTIMIZED_RULE_ID = -2
+INFEASIBLE_RULE_ID = -3
+
+
+class GridSearchOptimizer(object):
+    """
+    Picks the cheapest (light level, façade state) combination that keeps glare and illuminance within limits.
+
+    Every candidate combination is scored at once against response tables that are precomputed when the optimizer
+    is configured:
+
+    - ``glare_response``: per façade state, the factor applied to the measured glare.
+    - ``daylight_response``: per façade state, the factor applied to the measured illuminance.
+    - ``light_illuminance``: illuminance added by the lights at full output, or one value per light level.
+
+    A candidate is feasible when its predicted glare is at most ``glare_limit`` and its predicted illuminance is at
+    least ``illuminance_target`` (``unoccupied_illuminance_target`` when the area is unoccupied).  The cost of a
+    candidate is ``light_cost * light_level + facade_cost[façade state]``.  If nothing is feasible the candidate
+    with the smallest constraint violation wins.
+
+    Attributes:
+        light_levels (numpy.ndarray): Candidate light levels, shape (L,).
+        facade_states (numpy.ndarray): Candidate façade states, shape (F,).
+        cost (numpy.ndarray): Cost of every candidate, shape (F, L).
+        electric_illuminance (numpy.ndarray): Illuminance from the lights for every light level, shape (L,).
+    """
+
+    def __init__(self, params):
+        """
+        Build the candidate grid and response tables.
+
+        :param params: Dictionary of optimizer parameters, see the class documentation.
+        """
+        self.light_levels = np.asarray(params.get("light_levels", np.linspace(0.0, 1.0, 11)), dtype=np.float64)
+        self.facade_states = np.asarray(params.get("facade_states", [0, 1, 2]), dtype=np.float64)
+        facade_count = len(self.facade_states)
+
+        self.glare_response = self._per_state(params.get("glare_response", 1.0), facade_count, "glare_response")
+        self.daylight_response = self._per_state(params.get("daylight_response", 1.0), facade_count,
+                                                 "daylight_response")
+        facade_cost = self._per_state(params.get("facade_cost", 0.0), facade_count, "facade_cost")
+
+        light_illuminance = np.asarray(params.get("light_illuminance", 500.0), dtype=np.float64)
+        if light_illuminance.ndim == 0:
+            self.electric_illuminance = self.light_levels * light_illuminance
+        elif light_illuminance.shape == self.light_levels.shape:
+            self.electric_illuminance = light_illuminance
+        else:
+            raise ValueError("light_illuminance must be a number or have one value per light level")
+
+        self.glare_limit = params.get("glare_limit", 0.35)
+        self.illuminance_target = params.get("illuminance_target", 500.0)
+        self.unoccupied_illuminance_target = params.get("unoccupied_illuminance_target", 0.0)
+        self.cost = facade_cost[:, None] + params.get("light_cost", 1.0) * self.light_levels[None, :]
+
+    @staticmethod
+    def _per_state(value, facade_count, name):
+        """
+        Broadcast a scalar or per-façade-state parameter to an array with one value per façade state.
+        """
+        array = np.asarray(value, dtype=np.float64)
+        if array.ndim == 0:
+            return np.full(facade_count, float(array))
+        if array.shape != (facade_count,):
+            raise ValueError(f"{name} must be a number or have one value per façade state")
+        return array
+
+    def evaluate_many(self, glare, illuminance, occupancy):
+        """
+        Choose the best candidate for many areas at once.
+
+        :param glare: Measured glare per area, shape (N,).
+        :param illuminance: Measured illuminance per area, shape (N,).
+        :param occupancy: Measured occupancy per area, shape (N,).
+        :return: Tuple of (façade state index, light level index, feasible flag) arrays, each of shape (N,).
+        """
+        glare = np.asarray(glare, dtype=np.float64)[:, None, None]
+        illuminance = np.asarray(illuminance, dtype=np.float64)[:, None, None]
+        occupied = np.asarray(occupancy, dtype=np.float64)[:, None, None] > 0
+        target = np.where(occupied, self.illuminance_target, self.unoccupied_illuminance_target)
+
+        predicted_glare = glare * self.glare_response[None, :, None]
+        predicted_illuminance = illuminance * self.daylight_response[None, :, None] + self.electric_illuminance
+        glare_excess = np.maximum(predicted_glare - self.glare_limit, 0.0)
+        illuminance_shortfall = np.maximum(target - predicted_illuminance, 0.0)
+        feasible = (glare_excess == 0.0) & (illuminance_shortfall == 0.0)
+
+        # Feasible candidates compete on cost, otherwise the smallest relative violation wins
+        violation = glare_excess / max(self.glare_limit, 1e-9) + illuminance_shortfall / np.maximum(target, 1.0)
+        any_feasible = feasible.reshape(len(glare), -1).any(axis=1)[:, None, None]
+        score = np.where(any_feasible, np.where(feasible, self.cost, np.inf), violation + 1e-6 * self.cost)
+
+        best = score.reshape(len(glare), -1).argmin(axis=1)
+        facade_idx, light_idx = np.unravel_index(best, self.cost.shape)
+        return facade_idx, light_idx, any_feasible[:, 0, 0]
+
+    def calculate_state(self, input_data):
+        """
+        Choose the light level and façade state for one area.
+
+        :param input_data: The average input data for each input type, as returned by process_input_data.
+        :return: A dictionary with the desired states for the outputs in the calculate_state format.
+        """
+        glare = input_data.get("Glare", 0)
+        illuminance = input_data.get("Illuminance", 0)
+        occupancy = input_data.get("Occupancy", 1)
+        facade_idx, light_idx, feasible = self.evaluate_many([glare], [illuminance], [occupancy])
+        facade_idx, light_idx, feasible = facade_idx[0], light_idx[0], bool(feasible[0])
+
+        light_level = float(self.light_levels[light_idx])
+        facade_state = self.facade_states[facade_idx]
+        facade_state = int(facade_state) if float(facade_state).is_integer() else float(facade_state)
+        reason = (f"{'Cheapest feasible' if feasible else 'Least violating'} candidate for Glare: {glare}, "
+                  f"Illuminance: {illuminance}, Occupancy: {occupancy}")
+        rule = OPTIMIZED_RULE_ID if feasible else INFEASIBLE_RULE_ID
+        return {"Light": {"value": light_level, "reason": reason, "rule": rule},
+                "Façade State": {"value": facade_state, "reason": reason, "rule": rule}}
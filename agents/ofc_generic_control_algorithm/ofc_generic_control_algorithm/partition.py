@@ -0,0 +1,122 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+__docformat__ = 'reStructuredText'
+
+import hashlib
+import logging
+import time
+
+_log = logging.getLogger(__name__)
+
+
+def rendezvous_weight(member, area):
+    """
+    Compute a stable weight for a (member, area) pair.
+
+    The weight must be identical in every agent process, so Python's salted ``hash`` cannot be used.
+
+    :param member: Identity of the pool member.
+    :param area: Name of the area.
+    :return: Integer weight.
+    """
+    digest = hashlib.md5(f"{member}|{area}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class AreaPartitioner(object):
+    """
+    Assigns each area to exactly one member of a pool of control algorithm agents.
+
+    Ownership uses rendezvous (highest random weight) hashing over the members that have been heard from
+    recently, so when a member joins or leaves only the areas it gains or loses change owner.
+
+    Attributes:
+        member_id (str): Identity of the local member.
+        member_timeout (float): Seconds without a heartbeat before a member is considered gone.
+        members (dict): Mapping of member identity to the time it was last heard from.
+    """
+
+    def __init__(self, member_id, member_timeout=15.0):
+        """
+        Initialize the partitioner with only the local member in the pool.
+
+        :param member_id: Identity of the local member.
+        :param member_timeout: Seconds without a heartbeat before a member is dropped.
+        """
+        self.member_id = member_id
+        self.member_timeout = member_timeout
+        self.members = {member_id: time.time()}
+
+    def heartbeat(self, member_id, now=None):
+        """
+        Record that a member is alive.
+
+        :param member_id: Identity of the member.
+        :param now: Current time in seconds, defaults to ``time.time()``.
+        :return: True if the member was not already part of the pool.
+        """
+        now = time.time() if now is None else now
+        is_new = member_id not in self.live_members(now)
+        self.members[member_id] = now
+        if is_new:
+            _log.info(f"Member {member_id} joined pool, members: {self.live_members(now)}")
+        return is_new
+
+    def leave(self, member_id):
+        """
+        Remove a member that announced it is shutting down.
+
+        :param member_id: Identity of the member.
+        """
+        if member_id != self.member_id and self.members.pop(member_id, None) is not None:
+            _log.info(f"Member {member_id} left pool, members: {self.live_members()}")
+
+    def live_members(self, now=None):
+        """
+        Return the members heard from within ``member_timeout``, pruning the others.
+
+        :param now: Current time in seconds, defaults to ``time.time()``.
+        :return: Sorted list of live member identities.
+        """
+        now = time.time() if now is None else now
+        self.members[self.member_id] = now
+        expired = [m for m, seen in self.members.items() if now - seen > self.member_timeout]
+        for member_id in expired:
+            _log.info(f"Member {member_id} timed out of pool")
+            del self.members[member_id]
+        return sorted(self.members)
+
+    def owner(self, area, now=None):
+        """
+        Return the member responsible for an area.
+
+        :param area: Name of the area.
+        :param now: Current time in seconds, defaults to ``time.time()``.
+        :return: Identity of the owning member.
+        """
+        return max(self.live_members(now), key=lambda member_id: rendezvous_weight(member_id, area))
+
+    def owns(self, area, now=None):
+        """
+        Check whether the local member is responsible for an area.
+
+        :param area: Name of the area.
+        :param now: Current time in seconds, defaults to ``time.time()``.
+        :return: True if the local member owns the area.
+        """
+        return self.owner(area, now) == self.member_id
@@ -0,0 +1,141 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+__docformat__ = 'reStructuredText'
+
+# The area controller and the control algorithm agents each ship this module, since VOLTTRON packages every agent on
+# its own.  agents/ofc_generic_control_algorithm/ofc_generic_control_algorithm/priority.py is the canonical copy:
+# change it and copy it over agents/ofc_area_controller/ofc_area_controller/priority.py, the tests check that the two
+# are identical.
+
+import logging
+import time
+from collections import deque
+
+import gevent.event
+
+_log = logging.getLogger(__name__)
+
+URGENT = "urgent"
+ROUTINE = "routine"
+DEFAULT_WEIGHTS = {URGENT: 4, ROUTINE: 1}
+
+
+class PriorityLanes(object):
+    """
+    Separate work queues per priority class, served by one worker with weighted round robin.
+
+    Each lane may run up to its weight in tasks per round, so under load an urgent lane with weight 4 gets four
+    tasks through for every routine one while the routine lane still makes progress.  Lanes are served in the order
+    of the weights dictionary within a round.
+
+    Attributes:
+        weights (dict): Tasks per round for each lane, in service order.
+        default_lane (str): Lane used for unknown priority classes, the last lane.
+        queues (dict): Pending (enqueue time, function, args) tasks per lane.
+    """
+
+    def __init__(self, weights=None):
+        """
+        :param weights: Dictionary mapping lane names to positive integer weights, defaults to DEFAULT_WEIGHTS.
+        """
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        if not self.weights or any(weight < 1 for weight in self.weights.values()):
+            raise ValueError("Priority lane weights must be at least 1")
+        self.default_lane = list(self.weights)[-1]
+        self.queues = {lane: deque() for lane in self.weights}
+        self.credits = dict(self.weights)
+        self.counters = {lane: {"processed": 0, "max_depth": 0, "total_wait": 0.0, "max_wait": 0.0}
+                         for lane in self.weights}
+        self.ready = gevent.event.Event()
+
+    def lane(self, priority):
+        """
+        :param priority: Requested priority class, or None.
+        :return: Name of the lane serving the priority class.
+        """
+        return priority if priority in self.queues else self.default_lane
+
+    def submit(self, priority, func, *args):
+        """
+        Queue a task in the lane for a priority class.
+
+        :param priority: Priority class, unknown classes go to the default lane.
+        :param func: Function to call.
+        :param args: Arguments to call it with.
+        """
+        lane = self.lane(priority)
+        queue = self.queues[lane]
+        queue.append((time.monotonic(), func, args))
+        counters = self.counters[lane]
+        counters["max_depth"] = max(counters["max_depth"], len(queue))
+        self.ready.set()
+
+    def take(self):
+        """
+        Take the next task according to the lane weights.
+
+        :return: Tuple of (lane, function, args, seconds waited), or None if every lane is empty.
+        """
+        for _ in range(2):
+            for lane, queue in self.queues.items():
+                if queue and self.credits[lane] > 0:
+                    self.credits[lane] -= 1
+                    enqueued, func, args = queue.popleft()
+                    wait = time.monotonic() - enqueued
+                    counters = self.counters[lane]
+                    counters["processed"] += 1
+                    counters["total_wait"] += wait
+                    counters["max_wait"] = max(counters["max_wait"], wait)
+                    return lane, func, args, wait
+            # Every lane with work has used its credits, start a new round
+            self.credits = dict(self.weights)
+        return None
+
+    def run(self):
+        """
+        Serve the lanes forever, meant to run in its own greenlet.
+        """
+        while True:
+            task = self.take()
+            if task is None:
+                self.ready.clear()
+                self.ready.wait()
+                continue
+            lane, func, args, wait = task
+            try:
+                func(*args)
+            except Exception as e:
+                _log.error(f"Error in {lane} task {getattr(func, '__name__', func)} after waiting {wait:.3f}s: {e}")
+
+    def stats(self):
+        """
+        :return: Dictionary of per-lane queue depth, maximum depth, processed tasks and mean and maximum wait in
+            seconds.
+        """
+        stats = {}
+        for lane, queue in self.queues.items():
+            counters = self.counters[lane]
+            processed = counters["processed"]
+            stats[lane] = {
+                "depth": len(queue),
+                "max_depth": counters["max_depth"],
+                "processed": processed,
+                "mean_wait": counters["total_wait"] / processed if processed else 0.0,
+                "max_wait": counters["max_wait"]
+            }
+        return stats
@@ -0,0 +1,182 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+Alignment of input series from sensors that are scraped on different intervals.
+
+Each topic's historian samples are resampled onto a common time grid that ends at the current cycle, so every input
+is averaged over the same instants and samples older than ``max_age`` are ignored instead of silently averaged in.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import datetime
+import logging
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+RESAMPLE_METHODS = ("ffill", "linear")
+
+
+def to_epoch(timestamp):
+    """
+    Convert a historian timestamp to UTC epoch seconds.
+
+    :param timestamp: ISO 8601 string, datetime or number of epoch seconds.  Naive times are taken to be UTC.
+    :return: Epoch seconds as a float.
+    """
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.timestamp()
+
+
+def series_arrays(values):
+    """
+    Convert historian ``[timestamp, value]`` pairs to sorted arrays, dropping missing values.
+
+    :param values: List of (timestamp, value) pairs in any order.
+    :return: Tuple of (epoch seconds, values) float arrays sorted by time.
+    """
+    pairs = [(to_epoch(value[0]), value[1]) for value in values or [] if value[1] is not None]
+    if not pairs:
+        return np.empty(0), np.empty(0)
+    times, samples = np.array(pairs, dtype=np.float64).T
+    order = np.argsort(times, kind="stable")
+    return times[order], samples[order]
+
+
+def resample_series(times, values, grid, method="ffill", max_age=None):
+    """
+    Resample one series onto a time grid.
+
+    With ``ffill`` each grid point takes the latest sample at or before it.  With ``linear`` grid points between two
+    samples are interpolated and points after the last sample fall back to forward fill.  Grid points before the
+    first sample, or whose forward-filled sample is older than ``max_age``, are NaN.
+
+    :param times: Sorted sample times in epoch seconds.
+    :param values: Sample values.
+    :param grid: Grid times in epoch seconds.
+    :param method: "ffill" or "linear".
+    :param max_age: Maximum age in seconds of the sample used for a grid point, None for no limit.
+    :return: Float array of the same length as ``grid``.
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    if len(times) == 0:
+        return np.full(len(grid), np.nan)
+
+    previous = np.searchsorted(times, grid, side="right") - 1
+    before_first = previous < 0
+    previous = np.maximum(previous, 0)
+    resampled = values[previous]
+    age = grid - times[previous]
+
+    if method == "linear":
+        following = np.minimum(previous + 1, len(times) - 1)
+        span = times[following] - times[previous]
+        between = (following > previous) & (span > 0)
+        weight = np.divide(age, span, out=np.zeros(len(grid)), where=between)
+        resampled = np.where(between, resampled + weight * (values[following] - resampled), resampled)
+        # Interpolated points are as fresh as the nearer of their two samples
+        age = np.where(between, np.minimum(age, times[following] - grid), age)
+    elif method != "ffill":
+        raise ValueError(f"Unknown resample method {method}, expected one of {RESAMPLE_METHODS}")
+
+    stale = before_first
+    if max_age is not None:
+        stale = stale | (age > max_age)
+    return np.where(stale, np.nan, resampled)
+
+
+class Resampler(object):
+    """
+    Aligns every topic of every input type onto a common grid and averages them.
+
+    The grid has ``points`` instants ``step`` seconds apart, ending at the current time rounded down to a multiple of
+    ``step`` so that all areas evaluated in the same cycle share one grid.  The work per cycle is fixed by the grid
+    size and the historian query size, however many samples the sensors produced.
+
+    Attributes:
+        step (float): Seconds between grid points.
+        points (int): Number of grid points.
+        method (str): "ffill" or "linear".
+        max_age (float): Maximum sample age in seconds, None for no limit.
+    """
+
+    def __init__(self, step=60, points=5, method="ffill", max_age=None):
+        """
+        :param step: Seconds between grid points.
+        :param points: Number of grid points.
+        :param method: "ffill" or "linear".
+        :param max_age: Maximum sample age in seconds, None for no limit.
+        """
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(f"Unknown resample method {method}, expected one of {RESAMPLE_METHODS}")
+        self.step = step
+        self.points = points
+        self.method = method
+        self.max_age = max_age
+
+    def grid(self, now):
+        """
+        :param now: Current time in epoch seconds.
+        :return: Grid times in epoch seconds, oldest first.
+        """
+        end = (now // self.step) * self.step
+        return end - self.step * np.arange(self.points - 1, -1, -1)
+
+    def align(self, input_data, now):
+        """
+        Resample the historian data of every topic onto the grid.
+
+        :param input_data: The input data collected by get_all_input_data.
+        :param now: Current time in epoch seconds.
+        :return: Dictionary mapping input types to arrays of shape (topics, points), NaN where there is no fresh data.
+        """
+        grid = self.grid(now)
+        aligned = {}
+        for input_type, topics in input_data.items():
+            rows = [resample_series(*series_arrays(values), grid, self.method, self.max_age)
+                    for values in topics.values()]
+            aligned[input_type] = np.array(rows).reshape(len(rows), len(grid))
+        return aligned
+
+    def aggregate(self, input_data, now, stale=None):
+        """
+        Average each input type over all of its topics and grid points.
+
+        :param input_data: The input data collected by get_all_input_data.
+        :param now: Current time in epoch seconds.
+        :param stale: Optional list that input types with topics but without any fresh data are appended to.
+            Input types without topics are not configured for the area and are never stale.
+        :return: A dictionary with the average value for each input type, 0 when there is no fresh data.
+        """
+        averages = {}
+        for input_type, aligned in self.align(input_data, now).items():
+            valid = ~np.isnan(aligned)
+            if valid.any():
+                averages[input_type] = float(aligned[valid].mean())
+            else:
+                averages[input_type] = 0
+                if stale is not None and len(aligned):
+                    stale.append(input_type)
+        return averages
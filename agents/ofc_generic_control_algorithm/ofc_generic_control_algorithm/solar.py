@@ -0,0 +1,209 @@
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+Precomputed solar position and façade incidence tables.
+
+Tables cover one year at a fixed step and are stored as ``.npy`` files so agents can memory-map them at startup
+and look up the sun's position for any timestamp in constant time::
+
+    python -m ofc_generic_control_algorithm.solar /var/lib/ofc/solar 2025 37.87 -122.25 south=180 west=270
+"""
+
+__docformat__ = 'reStructuredText'
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+
+
+def solar_position(times, latitude, longitude):
+    """
+    Compute the sun's position for many instants at once.
+
+    Uses the low precision algorithm of the Astronomical Almanac, which is accurate to about 0.01 degrees
+    between 1950 and 2050 and ignores atmospheric refraction.
+
+    :param times: Array of UTC epoch seconds.
+    :param latitude: Site latitude in degrees, north positive.
+    :param longitude: Site longitude in degrees, east positive.
+    :return: Tuple of (altitude, azimuth) arrays in degrees, azimuth measured clockwise from north.
+    """
+    days = np.asarray(times, dtype=np.float64) / 86400.0 + 2440587.5 - 2451545.0
+    mean_longitude = np.mod(280.460 + 0.9856474 * days, 360.0)
+    mean_anomaly = np.radians(np.mod(357.528 + 0.9856003 * days, 360.0))
+    ecliptic_longitude = np.radians(mean_longitude + 1.915 * np.sin(mean_anomaly)
+                                    + 0.020 * np.sin(2 * mean_anomaly))
+    obliquity = np.radians(23.439 - 0.0000004 * days)
+
+    right_ascension = np.arctan2(np.cos(obliquity) * np.sin(ecliptic_longitude), np.cos(ecliptic_longitude))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(ecliptic_longitude))
+    sidereal_hours = np.mod(18.697374558 + 24.06570982441908 * days, 24.0)
+    hour_angle = np.radians(sidereal_hours * 15.0 + longitude) - right_ascension
+
+    lat = np.radians(latitude)
+    altitude = np.arcsin(np.sin(lat) * np.sin(declination)
+                         + np.cos(lat) * np.cos(declination) * np.cos(hour_angle))
+    azimuth = np.arctan2(-np.sin(hour_angle) * np.cos(declination),
+                         np.sin(declination) * np.cos(lat) - np.cos(declination) * np.sin(lat) * np.cos(hour_angle))
+    return np.degrees(altitude), np.mod(np.degrees(azimuth), 360.0)
+
+
+def facade_incidence(altitude, azimuth, facade_azimuth):
+    """
+    Compute the cosine of the angle between the sun and the normal of a vertical façade.
+
+    :param altitude: Solar altitude in degrees.
+    :param azimuth: Solar azimuth in degrees clockwise from north.
+    :param facade_azimuth: Direction the façade faces in degrees clockwise from north.
+    :return: Array of incidence cosines, 0 when the sun is down or behind the façade.
+    """
+    altitude = np.radians(altitude)
+    cosine = np.cos(altitude) * np.cos(np.radians(azimuth - facade_azimuth))
+    return np.where(altitude > 0, np.maximum(cosine, 0.0), 0.0)
+
+
+def build_tables(directory, year, latitude, longitude, orientations, step_minutes=5):
+    """
+    Compute a year of solar position and façade incidence tables and save them to a directory.
+
+    :param directory: Directory to write the tables to, created if needed.
+    :param year: Calendar year (UTC) covered by the tables.
+    :param latitude: Site latitude in degrees, north positive.
+    :param longitude: Site longitude in degrees, east positive.
+    :param orientations: Dictionary mapping orientation names to façade azimuths in degrees.
+    :param step_minutes: Time between table rows.
+    """
+    start = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    end = datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    step = step_minutes * 60
+    times = np.arange(start, end, step)
+
+    altitude, azimuth = solar_position(times, latitude, longitude)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "altitude.npy"), altitude.astype(np.float32))
+    np.save(os.path.join(directory, "azimuth.npy"), azimuth.astype(np.float32))
+    for name, facade_azimuth in orientations.items():
+        incidence = facade_incidence(altitude, azimuth, facade_azimuth).astype(np.float32)
+        np.save(os.path.join(directory, f"incidence_{name}.npy"), incidence)
+
+    meta = {"start": start, "step": step, "count": len(times), "year": year, "latitude": latitude,
+            "longitude": longitude, "orientations": orientations}
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    _log.info(f"Built solar tables with {len(times)} rows for {list(orientations)} in {directory}")
+
+
+class SolarTables(object):
+    """
+    Memory-mapped solar tables with constant time lookups by timestamp.
+
+    Timestamps outside the table's year are folded into it, since the sun's path repeats from year to year to
+    within a fraction of a degree.
+
+    Attributes:
+        meta (dict): Table metadata written by build_tables.
+        altitude (numpy.ndarray): Solar altitude per row in degrees.
+        azimuth (numpy.ndarray): Solar azimuth per row in degrees.
+        incidence (dict): Façade incidence cosine per row, keyed by orientation name.
+    """
+
+    def __init__(self, directory):
+        """
+        Memory-map the tables in a directory.
+
+        :param directory: Directory written by build_tables.
+        """
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.altitude = np.load(os.path.join(directory, "altitude.npy"), mmap_mode="r")
+        self.azimuth = np.load(os.path.join(directory, "azimuth.npy"), mmap_mode="r")
+        self.incidence = {name: np.load(os.path.join(directory, f"incidence_{name}.npy"), mmap_mode="r")
+                          for name in self.meta["orientations"]}
+
+    @classmethod
+    def load_or_build(cls, directory, year, latitude, longitude, orientations, step_minutes=5):
+        """
+        Load the tables in a directory, building them first if they are missing or were built for another site.
+
+        :return: SolarTables instance.
+        """
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if (meta.get("year"), meta.get("latitude"), meta.get("longitude"), meta.get("orientations"),
+                    meta.get("step")) == (year, latitude, longitude, orientations, step_minutes * 60):
+                return cls(directory)
+        build_tables(directory, year, latitude, longitude, orientations, step_minutes)
+        return cls(directory)
+
+    def index(self, timestamp):
+        """
+        Return the table row for a timestamp.
+
+        :param timestamp: Timezone aware datetime or UTC epoch seconds.
+        :return: Row index.
+        """
+        if isinstance(timestamp, datetime.datetime):
+            timestamp = timestamp.timestamp()
+        return int((timestamp - self.meta["start"]) // self.meta["step"]) % self.meta["count"]
+
+    def lookup(self, timestamp, orientation=None):
+        """
+        Look up the sun's position, and optionally a façade's incidence, for a timestamp.
+
+        :param timestamp: Timezone aware datetime or UTC epoch seconds.
+        :param orientation: Name of a façade orientation in the tables.
+        :return: Dictionary with "altitude", "azimuth" and, if an orientation was given, "incidence".
+        """
+        idx = self.index(timestamp)
+        result = {"altitude": float(self.altitude[idx]), "azimuth": float(self.azimuth[idx])}
+        if orientation is not None:
+            result["incidence"] = float(self.incidence[orientation][idx])
+        return result
+
+
+def main(argv=None):
+    """
+    Command line entry point to build tables ahead of time.
+    """
+    parser = argparse.ArgumentParser(description="Build solar position and façade incidence tables.")
+    parser.add_argument("directory")
+    parser.add_argument("year", type=int)
+    parser.add_argument("latitude", type=float)
+    parser.add_argument("longitude", type=float)
+    parser.add_argument("orientations", nargs="+", metavar="NAME=AZIMUTH")
+    parser.add_argument("--step-minutes", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    orientations = {name: float(azimuth) for name, azimuth in
+                    (orientation.split("=", 1) for orientation in args.orientations)}
+    build_tables(args.directory, args.year, args.latitude, args.longitude, orientations, args.step_minutes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,13 +18,27 @@
 __docformat__ = 'reStructuredText'
 
 import sys
+import functools
 import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
 import threading
 
+from ofc_simulation_server_manager.async_server import AsyncSimulationServer, create_async_server
+from ofc_simulation_server_manager.clock import SimulationClock
+from ofc_simulation_server_manager.devices import (HISTORY_SUFFIX, SimulatedActuator, SimulatedSensor, create_device,
+                                                   read_only_server_types, read_write_server_types)
+from ofc_simulation_server_manager.faults import DROP, ERROR, TIMEOUT
+from ofc_simulation_server_manager.traces import TRACE_STORE
+from ofc_simulation_server_manager.workers import ShardedSimulationHost, WorkerServerHandle
+
 # Volttron
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent, Core, RPC
+from volttron.platform.scheduling import periodic
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
@@ -32,77 +46,188 @@ _log = logging.getLogger(__name__)
 __version__ = "0.1"
 
 
-def create_read_only_server(simulated_values, port, url):
+def create_read_only_app(simulated_values, port, url, clock=None):
     """
-    Create a read-only Flask server that simulates returning values for a specific endpoint.
+    Create a read-only Flask app that simulates returning values for a specific endpoint.
 
     :param simulated_values: A list of tuples with simulated (timestamp, value) data.
-    :param port: Port number to run the server on.
+    :param port: Port number the app will be served on.
     :param url: URL route for fetching simulated data.
+    :param clock: SimulationClock driving playback, None to advance one sample per request.
+    :return: The Flask app.
     """
-    app = Flask(f"OFC Simulation Server {port}")
-    simulated_values_index = 0
-
-    def get_point():
-        """
-        Return the next simulated value and timestamp.
-        """
-        nonlocal simulated_values_index
-        timestamp, value = simulated_values[simulated_values_index]
-        simulated_values_index += 1
-        if simulated_values_index >= len(simulated_values):
-            simulated_values_index = 0
-        result = {"timestamp": timestamp, "value": value}
-        return result
-
-    app.add_url_rule(url, url, get_point)
-    app.run(debug=False, port=port, use_reloader=False)
+    return create_device_app(SimulatedSensor(simulated_values, clock), port, url)
 
 
-def create_read_write_server(port, url, value_field, default_value=-1):
+def create_read_write_app(port, url, value_field, default_value=-1):
     """
-    Create a read-write Flask server that allows retrieving and updating a value.
+    Create a read-write Flask app that allows retrieving and updating a value.
 
-    :param port: Port number to run the server on.
+    :param port: Port number the app will be served on.
     :param url: URL route for accessing the value.
     :param value_field: The field name to retrieve or update.
     :param default_value: Default value for the field if not set.
+    :return: The Flask app.
+    """
+    return create_device_app(SimulatedActuator(value_field, default_value), port, url)
+
+
+def create_device_app(device, port, url):
+    """
+    Create a Flask app serving a simulated device, with the device's injected faults applied to every request.
+
+    :param device: SimulatedSensor or SimulatedActuator.
+    :param port: Port number the app will be served on.
+    :param url: URL route of the device.
+    :return: The Flask app.
     """
     app = Flask(f"OFC Simulation Server {port}")
-    value = default_value
 
     def get_value():
         """
         Return the current value.
         """
-        return {value_field: value}
+        return device.get()
 
     def set_value():
         """
         Update the value based on a POST request containing JSON data.
         """
-        nonlocal value
-        data = request.json
-        new_value = data.get(value_field)
-        if new_value:
-            value = new_value
-            return jsonify({"message": "value updated", "value": value})
-        else:
-            return jsonify({"message": "value not provided"}), 400
+        response, status = device.set(request.json)
+        return jsonify(response), status
+
+    def get_history():
+        """
+        Return the recorded writes, filtered by the "since" and "limit" query parameters.
+        """
+        return device.write_history(request.args.get("since", type=float), request.args.get("limit", type=int))
+
+    if isinstance(device, SimulatedActuator):
+        app.add_url_rule(url, 'get_value', inject_faults(device, get_value), methods=['GET'])
+        app.add_url_rule(url, 'set_value', inject_faults(device, set_value), methods=['POST'])
+        app.add_url_rule(url + HISTORY_SUFFIX, 'get_history', get_history, methods=['GET'])
+    else:
+        app.add_url_rule(url, url, inject_faults(device, get_value))
+    return app
+
+
+def inject_faults(device, view):
+    """
+    Wrap a Flask view so the device's fault injector can delay, fail or drop its requests.
+    """
+    @functools.wraps(view)
+    def faulty_view():
+        delay, outcome = device.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if outcome == TIMEOUT:
+            time.sleep(device.faults.timeout)
+        if outcome in (TIMEOUT, DROP):
+            # Close the connection under the server, which then drops the response
+            connection = request.environ.get("werkzeug.socket")
+            if connection is not None:
+                connection.shutdown(socket.SHUT_RDWR)
+            return "", 500
+        if outcome == ERROR:
+            return jsonify({"message": "injected fault"}), device.faults.error_status
+        return view()
+
+    return faulty_view
+
+
+def create_read_only_server(simulated_values, port, url):
+    """
+    Run a read-only Flask server that simulates returning values for a specific endpoint.  Blocks until the
+    process exits.
+
+    :param simulated_values: A list of tuples with simulated (timestamp, value) data.
+    :param port: Port number to run the server on.
+    :param url: URL route for fetching simulated data.
+    """
+    create_read_only_app(simulated_values, port, url).run(debug=False, port=port, use_reloader=False)
+
 
-    # Dynamically add URL rule
-    app.add_url_rule(url, 'get_value', get_value, methods=['GET'])
-    app.add_url_rule(url, 'set_value', set_value, methods=['POST'])
-    app.run(debug=False, port=port, use_reloader=False)
+def create_read_write_server(port, url, value_field, default_value=-1):
+    """
+    Run a read-write Flask server that allows retrieving and updating a value.  Blocks until the process exits.
 
+    :param port: Port number to run the server on.
+    :param url: URL route for accessing the value.
+    :param value_field: The field name to retrieve or update.
+    :param default_value: Default value for the field if not set.
+    """
+    create_read_write_app(port, url, value_field, default_value).run(debug=False, port=port, use_reloader=False)
 
-read_only_server_types = ["Occupancy", "Glare", "Illuminance", "Solar Radiation"]
-read_write_server_types = ["Light", "Façade State"]
 
+class ServerHandle(object):
+    """
+    Runs one simulation server's Flask app in a background thread with graceful shutdown.
 
-def create_server_in_thread(endpoint, port, api_key, server_type, value_field=None, simulated_values=None, **kwargs):
+    Attributes:
+        app (Flask): The simulation server's app.
+        device (SimulatedSensor or SimulatedActuator): The device the app serves, None if unknown.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        ready (threading.Event): Set once the server is accepting requests, cleared when it stops.
+        start_latency (float): Seconds the last start took until the server was ready.
+        stop_latency (float): Seconds the last stop took until the port was released.
     """
-    Create a server (either read-only or read-write) in a separate thread.
+
+    def __init__(self, app, port, host="127.0.0.1", device=None):
+        """
+        :param app: The Flask app to serve.
+        :param port: Port to listen on.
+        :param host: Interface to listen on.
+        :param device: The device the app serves.
+        """
+        self.app = app
+        self.device = device
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.start_latency = None
+        self.stop_latency = None
+
+    def start(self, timeout=10):
+        """
+        Bind the port and serve the app, returning once the server is ready.
+
+        :param timeout: Seconds to wait for the server thread to start.
+        :raises OSError: If the port cannot be bound.
+        """
+        started = time.perf_counter()
+        self.server = make_server(self.host, self.port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self._serve, name=f"OFC simulation server {self.port}", daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            raise RuntimeError(f"Simulation server on port {self.port} did not start within {timeout}s")
+        self.start_latency = time.perf_counter() - started
+
+    def _serve(self):
+        self.ready.set()
+        self.server.serve_forever()
+
+    def stop(self):
+        """
+        Stop serving, wait for the server thread to finish and release the port.
+        """
+        if self.server is None:
+            return
+        started = time.perf_counter()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.server = None
+        self.ready.clear()
+        self.stop_latency = time.perf_counter() - started
+
+
+def create_server_in_thread(endpoint, port, api_key, server_type, value_field=None, simulated_values=None, clock=None,
+                            **kwargs):
+    """
+    Create a server (either read-only or read-write) that runs in a separate thread once started.
 
     :param endpoint: The URL endpoint to handle.
     :param port: The port number for the server.
@@ -110,19 +235,14 @@ def create_server_in_thread(endpoint, port, api_key, server_type, value_field=No
     :param server_type: Type of server to create (either read-only or read-write).
     :param value_field: Field name for the value (for read-write servers).
     :param simulated_values: Simulated data for read-only servers.
-    :return: A threading.Thread object for the server.
+    :param clock: SimulationClock driving the playback of read-only servers, None to advance one sample per request.
+    :param kwargs: Other config keys, "trace", "csv" and "csv column" locate the samples of read-only servers and
+        "faults" sets the latency and failures injected into the server's responses.
+    :return: A ServerHandle for the server, call start() to begin serving.
     """
-    t = None
-    if server_type in read_only_server_types:
-        if server_type in simulated_values:
-            simulated_values = simulated_values[server_type]
-        t = threading.Thread(target=create_read_only_server, args=(simulated_values, port, endpoint))
-    elif server_type in read_write_server_types:
-        t = threading.Thread(target=create_read_write_server, args=(port, endpoint, value_field))
-    else:
-        raise RuntimeError(f"Unsupported server type: {server_type}")
-
-    return t
+    device = create_device(server_type, value_field=value_field, simulated_values=simulated_values, clock=clock,
+                           **kwargs)
+    return ServerHandle(create_device_app(device, port, endpoint), port, device=device)
 
 
 def ofc_simulation_server_manager(config_path, **kwargs):
@@ -152,8 +272,16 @@ class OFCSimulationServerManager(Agent):
     of read-only and read-write servers based on agent configuration.
 
     Attributes:
-        server_threads (dict): Dictionary mapping server configuration names to threads.
+        server_threads (dict): Dictionary mapping server configuration names to threads, or to handles on the
+            async server.
         config (dict): The agent's configuration settings.
+        async_server (AsyncSimulationServer): Shared server hosting every simulated device, None to start a Flask
+            server thread per device.
+        server_latencies (dict): Seconds the last stop and start of each server took, keyed by configuration name.
+        clock (SimulationClock): Clock driving the playback of every read-only server, None to advance each server
+            one sample per request.
+        workers (ShardedSimulationHost): Worker processes hosting every simulated device, None to host them in the
+            agent process.
     """
 
     def __init__(self, config, **kwargs):
@@ -165,9 +293,17 @@ class OFCSimulationServerManager(Agent):
         """
         super(OFCSimulationServerManager, self).__init__(**kwargs)
         self.server_threads = {}
+        self.server_latencies = {}
 
         _log.info(f"In __init__ with config: {config} kwargs:{kwargs}")
         self.config = config
+        async_config = config.get("async_server")
+        self.async_server = AsyncSimulationServer(**async_config) if async_config is not None else None
+        clock_config = config.get("simulation_clock")
+        self.clock = SimulationClock(**clock_config) if clock_config is not None else None
+        workers_config = dict(config.get("simulation_workers") or {})
+        self.supervise_interval = workers_config.pop("supervise_interval", 10)
+        self.workers = ShardedSimulationHost(clock=self.clock, **workers_config) if workers_config else None
         self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"], pattern="config")
         self.vip.config.subscribe(self.add_server, actions=["NEW", "UPDATE"], pattern="servers/*")
         self.vip.config.subscribe(self.remove_server, actions="DELETE", pattern="servers/*")
@@ -207,8 +343,32 @@ class OFCSimulationServerManager(Agent):
         :param kwargs: Additional arguments.
         """
         _log.info(f"In onstart self.config: {self.config} sender: {sender} kwargs: {kwargs}")
+        if self.workers:
+            self.workers.start()
+            self.core.schedule(periodic(self.supervise_interval), self.supervise_workers)
         _log.info(f"Finished onstart self.config: {self.config} sender: {sender} kwargs: {kwargs}")
 
+    @Core.receiver('onstop')
+    def onstop(self, sender, **kwargs):
+        """
+        Called when the agent stops.  Shuts down the shared async server and the worker processes.
+
+        :param sender: The sender of the onstop event.
+        :param kwargs: Additional arguments.
+        """
+        if self.async_server:
+            self.async_server.stop()
+        if self.workers:
+            self.workers.stop()
+
+    def supervise_workers(self):
+        """
+        Restart simulation worker processes that have died, with their devices.
+        """
+        restarted = self.workers.supervise()
+        if restarted:
+            _log.warning(f"Restarted simulation workers {restarted}")
+
     def configure(self, config_name, action, contents):
         """
         Handle configuration updates.
@@ -217,7 +377,8 @@ class OFCSimulationServerManager(Agent):
         :param action: Action performed on the configuration (e.g., "NEW", "UPDATE").
         :param contents: The contents of the configuration.
         """
-        pass
+        if contents and "type" in contents:
+            self.add_server(config_name, action, contents)
 
     def add_server(self, config_name, action, contents):
         """
@@ -229,19 +390,45 @@ class OFCSimulationServerManager(Agent):
         """
         _log.info(f"In add_server with config_name: {config_name} action:{action}, contents: {contents}")
         try:
-            existing_server = self.server_threads.get(config_name)
-
-            if existing_server:
-                existing_server.stop()
-
-            contents["server_type"] = contents["type"]
-            t = create_server_in_thread(**contents)
-            self.server_threads[config_name] = t
-            self.server_threads[config_name].start()
+            self.rebuild_server(config_name, contents)
         except Exception as e:
             _log.error(f"Error in add_server: {e}")
         _log.info(f"Finished add_server")
 
+    def rebuild_server(self, config_name, contents):
+        """
+        Stop a server if it is running, then create and start it from its configuration.
+
+        Only touches the server's own entries, so different servers can be rebuilt from several threads at once.
+
+        :param config_name: Name of the server configuration.
+        :param contents: The configuration details for the server.
+        :return: Dictionary with the seconds the "stop" and "start" took, "stop" is None for a new server.
+        """
+        latency = {"stop": None, "start": None}
+        existing_server = self.server_threads.pop(config_name, None)
+        if existing_server:
+            existing_server.stop()
+            latency["stop"] = existing_server.stop_latency
+
+        contents = dict(contents, server_type=contents["type"])
+        if self.clock:
+            contents["clock"] = self.clock
+        if self.workers:
+            self.workers.start()
+            t = WorkerServerHandle(self.workers, config_name, contents)
+        elif self.async_server:
+            if self.async_server.loop is None:
+                self.async_server.start()
+            t = create_async_server(self.async_server, **contents)
+        else:
+            t = create_server_in_thread(**contents)
+        self.server_threads[config_name] = t
+        t.start()
+        latency["start"] = t.start_latency
+        self.server_latencies[config_name] = latency
+        return latency
+
     def remove_server(self, config_name, action, contents):
         """
         Remove an existing server.
@@ -260,9 +447,135 @@ class OFCSimulationServerManager(Agent):
     @RPC.export
     def reset_all_servers(self, *args, **kwargs):
         """
-        Reset all servers (placeholder method).
+        Rebuild every server from its stored configuration, several servers at a time.
+
+        The number of servers rebuilt at once is set by "reset_workers" in the agent config (16 by default).
+
+        :return: Dictionary with the per-server "stop" and "start" latencies under "servers", the names of servers
+            that failed to rebuild under "errors" and the wall time of the whole reset in seconds under "total".
         """
-        pass
+        started = time.perf_counter()
+        configs = {}
+        errors = {}
+        # The config store is read here, the worker threads only stop and start servers
+        for config_name in list(self.server_threads):
+            try:
+                configs[config_name] = self.vip.config.get(config_name=config_name)
+            except Exception as e:
+                errors[config_name] = str(e)
+
+        latencies = {}
+        with ThreadPoolExecutor(max_workers=self.config.get("reset_workers", 16)) as executor:
+            futures = {config_name: executor.submit(self.rebuild_server, config_name, contents)
+                       for config_name, contents in configs.items()}
+            for config_name, future in futures.items():
+                try:
+                    latencies[config_name] = future.result()
+                except Exception as e:
+                    _log.error(f"Error resetting server {config_name}: {e}")
+                    errors[config_name] = str(e)
+
+        return {"servers": latencies, "errors": errors, "total": time.perf_counter() - started}
+
+    @RPC.export
+    def seek_simulation(self, instant, speed=None):
+        """
+        RPC method to move every simulated sensor to the same instant of its trace.
+
+        :param instant: Simulated instant, epoch seconds or a timestamp string in the building data format or
+            ISO 8601.
+        :param speed: Simulated seconds per wall-clock second from now on, None to keep the current speed.
+        :return: The simulation clock's state, see get_simulation_time.
+        """
+        if self.clock is None:
+            raise RuntimeError("No simulation_clock in the agent config, servers advance one sample per request")
+        self.clock.seek(instant, speed)
+        if self.workers:
+            self.workers.sync_clock()
+        return self.clock.state()
+
+    @RPC.export
+    def get_simulation_time(self):
+        """
+        RPC method to retrieve the simulated time the sensors play back.
+
+        :return: Dictionary with the simulated "time" in ISO 8601, its "epoch" seconds and the clock's "speed", or
+            None without a simulation clock.
+        """
+        return self.clock.state() if self.clock else None
+
+    @RPC.export
+    def set_server_faults(self, server_config_name, faults=None):
+        """
+        RPC method to change the latency and failures injected into a running server's responses.
+
+        The settings last until the server is rebuilt from its configuration.
+
+        :param server_config_name: The name of the server configuration.
+        :param faults: Fault settings, see FaultInjector.configure, None or {} to turn faults off.
+        :return: The server's fault settings and counts, see get_server_faults.
+        """
+        server = self.server_threads.get(server_config_name)
+        if server is None:
+            raise KeyError(f"No running server {server_config_name}")
+        server.device.faults.configure(**(faults or {}))
+        return server.device.faults.state()
+
+    @RPC.export
+    def get_server_faults(self):
+        """
+        RPC method to retrieve the injected fault settings of every running server.
+
+        :return: Dictionary of {"settings", "counts"} keyed by server configuration name, the counts being the
+            requests each server has seen and the errors, timeouts and drops injected into them.
+        """
+        return {name: server.device.faults.state() for name, server in self.server_threads.items()
+                if getattr(server, "device", None) is not None}
+
+    @RPC.export
+    def get_write_history(self, server_config_name, since=None, limit=None):
+        """
+        RPC method to retrieve the writes a read-write server has recorded.
+
+        :param server_config_name: The name of the server configuration.
+        :param since: Only return writes recorded after this epoch time.
+        :param limit: Only return the most recent writes, up to this many.
+        :return: Dictionary with the total number of "writes", how many were "dropped" from the bounded history,
+            and the "history" entries, oldest first.
+        """
+        server = self.server_threads.get(server_config_name)
+        if server is None:
+            raise KeyError(f"No running server {server_config_name}")
+        if not hasattr(server.device, "write_history"):
+            raise ValueError(f"{server_config_name} is not a read-write server")
+        return server.device.write_history(since, limit)
+
+    @RPC.export
+    def get_worker_stats(self):
+        """
+        RPC method to retrieve the health and load of the simulation worker processes.
+
+        :return: See ShardedSimulationHost.stats, None when devices are hosted in the agent process.
+        """
+        return self.workers.stats() if self.workers else None
+
+    @RPC.export
+    def get_trace_stats(self):
+        """
+        RPC method to retrieve how many traces the simulated sensors share and the memory they use.
+
+        :return: Dictionary with the number of shared traces, their size in bytes and the store's hits and misses.
+        """
+        return TRACE_STORE.stats()
+
+    @RPC.export
+    def get_server_latencies(self):
+        """
+        RPC method to retrieve the seconds the last stop and start of each server took.
+
+        :return: Dictionary of {"stop", "start"} latencies keyed by server configuration name.
+        """
+        return dict(self.server_latencies)
 
     @RPC.export
     def stop_server(self, server_config_name: str, *args, **kwargs):
@@ -286,11 +599,13 @@ class OFCSimulationServerManager(Agent):
         :param server_config_name: The name of the server configuration to reset.
         :param args: Additional arguments.
         :param kwargs: Additional keyword arguments.
+        :return: The server's "stop" and "start" latencies in seconds, or None if the reset failed.
         """
         _log.info(f"In reset_server with server_config_name {server_config_name} args: {args} kwargs: {kwargs}")
         try:
             server_config = self.vip.config.get(config_name=server_config_name)
             self.configure(server_config_name, "UPDATE", server_config)
+            return self.server_latencies.get(server_config_name)
         except Exception as e:
             _log.error(f"Error resetting server {server_config_name}: {e}")
 
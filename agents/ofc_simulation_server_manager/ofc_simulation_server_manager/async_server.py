@@ -0,0 +1,395 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+One asyncio HTTP server hosting any number of simulated devices.
+
+Each Flask simulation server needs its own thread, so simulating many devices quickly runs out of threads.  This
+server multiplexes every simulated device onto a single event loop.  It either listens on every configured port,
+so device drivers keep their configured URLs, or routes by path on one port, where the device configured on port
+``P`` at URL ``/u`` is served at ``/P/u``.
+
+It can also run on its own with the simulation server configs::
+
+    python -m ofc_simulation_server_manager.async_server configs/simulation_servers/*.json
+"""
+
+__docformat__ = 'reStructuredText'
+
+import argparse
+import asyncio
+import http
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.parse
+
+from ofc_simulation_server_manager.clock import SimulationClock
+from ofc_simulation_server_manager.devices import HISTORY_SUFFIX, create_device
+from ofc_simulation_server_manager.faults import DROP, ERROR, OK, TIMEOUT
+
+_log = logging.getLogger(__name__)
+
+# Path of the endpoint reading many devices in one request
+BATCH_PATH = "/batch"
+
+ROUTE_BY_PORT = "port"
+ROUTE_BY_PATH = "path"
+
+
+class AsyncSimulationServer(object):
+    """
+    Serves simulated devices from one asyncio event loop running in a background thread.
+
+    Attributes:
+        host (str): Interface to listen on.
+        route_by (str): "port" to listen on each device's port, "path" to serve every device on ``port``.
+        port (int): The single port used when routing by path.
+        routes (dict): Simulated devices keyed by (configured port, URL).
+        listeners (dict): Listening asyncio servers keyed by port.
+        connections (dict): Stream writers of open connections keyed by the tasks serving them.
+    """
+
+    def __init__(self, host="127.0.0.1", route_by=ROUTE_BY_PORT, port=None):
+        """
+        :param host: Interface to listen on.
+        :param route_by: "port" or "path".
+        :param port: Port to listen on when routing by path.
+        """
+        if route_by not in (ROUTE_BY_PORT, ROUTE_BY_PATH):
+            raise ValueError(f"Unsupported route_by {route_by}")
+        if route_by == ROUTE_BY_PATH and port is None:
+            raise ValueError("A port is required when routing by path")
+        self.host = host
+        self.route_by = route_by
+        self.port = port
+        self.routes = {}
+        self.listeners = {}
+        self.connections = {}
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        """
+        Start the event loop thread, and the shared listener when routing by path.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="OFC async simulation server",
+                                       daemon=True)
+        self.thread.start()
+        if self.route_by == ROUTE_BY_PATH:
+            self._run(self._listen(self.port))
+
+    def stop(self):
+        """
+        Close every listener and stop the event loop thread.
+        """
+        if self.loop is None:
+            return
+        self._run(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def add(self, port, url, device):
+        """
+        Serve a simulated device, replacing any device already configured at the same port and URL.
+
+        :param port: Port the device is configured on.
+        :param url: URL route of the device.
+        :param device: SimulatedSensor or SimulatedActuator.
+        """
+        self._run(self._add(port, url, device))
+
+    def remove(self, port, url):
+        """
+        Stop serving a simulated device.  The port stops listening when its last device is removed.
+
+        :param port: Port the device is configured on.
+        :param url: URL route of the device.
+        """
+        self._run(self._remove(port, url))
+
+    def _run(self, coroutine):
+        """
+        Run a coroutine on the event loop thread and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _add(self, port, url, device):
+        self.routes[(port, url)] = device
+        if self.route_by == ROUTE_BY_PORT and port not in self.listeners:
+            await self._listen(port)
+
+    async def _remove(self, port, url):
+        self.routes.pop((port, url), None)
+        if self.route_by == ROUTE_BY_PORT and not any(p == port for p, _ in self.routes):
+            await self._close(port)
+
+    async def _listen(self, port):
+        self.listeners[port] = await asyncio.start_server(
+            lambda reader, writer: self._serve(reader, writer, port), self.host, port)
+        _log.info(f"Async simulation server listening on {self.host}:{port}")
+
+    async def _shutdown(self):
+        for listener in self.listeners.values():
+            listener.close()
+        # Closing the transports ends the connections' read loops, cancelling ends injected delays
+        for task, writer in self.connections.items():
+            writer.close()
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        for port in list(self.listeners):
+            await self._close(port)
+
+    async def _close(self, port):
+        listener = self.listeners.pop(port, None)
+        if listener:
+            listener.close()
+            await listener.wait_closed()
+
+    def resolve(self, listen_port, path):
+        """
+        Find the device for a request.
+
+        :param listen_port: Port the request arrived on.
+        :param path: Request path without the query string.
+        :return: The simulated device, or None.
+        """
+        if self.route_by == ROUTE_BY_PORT:
+            return self.routes.get((listen_port, path))
+        prefix, _, url = path[1:].partition("/")
+        if not prefix.isdigit():
+            return None
+        return self.routes.get((int(prefix), "/" + url))
+
+    def dispatch(self, listen_port, method, path, body, query=""):
+        """
+        Handle one request.
+
+        :param query: Query string of the request, "since" and "limit" filter a write history.
+        :return: Tuple of (HTTP status, response body).
+        """
+        device = self.resolve(listen_port, path)
+        if device is None and path.endswith(HISTORY_SUFFIX):
+            device = self.resolve(listen_port, path[:-len(HISTORY_SUFFIX)])
+            if method == "GET" and hasattr(device, "write_history"):
+                parameters = urllib.parse.parse_qs(query)
+                try:
+                    since = float(parameters["since"][0]) if "since" in parameters else None
+                    limit = int(parameters["limit"][0]) if "limit" in parameters else None
+                except ValueError:
+                    return 400, {"message": "since and limit must be numbers"}
+                return 200, device.write_history(since, limit)
+            device = None
+        if device is None:
+            return 404, {"message": "not found"}
+        if method == "GET":
+            return 200, device.get()
+        if method == "POST" and hasattr(device, "set"):
+            try:
+                data = json.loads(body or b"null")
+            except ValueError:
+                return 400, {"message": "invalid JSON"}
+            response, status = device.set(data)
+            return status, response
+        return 405, {"message": "method not allowed"}
+
+    def batch(self, body):
+        """
+        Read many devices in one request, like the bulk APIs of lighting gateways.
+
+        Each device is named by the URL it is read at on its own, e.g. ``http://localhost:52000/ems/api/...``, so
+        drivers can switch to the batch endpoint without knowing how the server routes.  A query string, such as
+        the ``?fixture=<id>`` that tells apart Enlighted fixtures sharing a URL, is kept in the point's key but does
+        not change the device it resolves to, since each simulated device serves one fixture.  Devices keep their
+        injected faults: the response waits for the slowest device, and failed devices are listed under "errors".
+
+        :param body: Request body, ``{"points": [URL, ...]}``.
+        :return: Tuple of (seconds to delay the response, HTTP status, response body with the devices' responses
+            keyed by URL under "points" and {"status", "message"} keyed by URL under "errors").
+        """
+        try:
+            points = json.loads(body or b"null")["points"]
+            if not isinstance(points, list):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            return 0.0, 400, {"message": 'expected {"points": [URL, ...]}'}
+
+        values, errors, delay = {}, {}, 0.0
+        for point in points:
+            url = urllib.parse.urlsplit(str(point))
+            try:
+                device = self.routes.get((url.port or 80, url.path))
+            except ValueError:
+                device = None
+            if device is None:
+                errors[point] = {"status": 404, "message": "not found"}
+                continue
+            device_delay, outcome = device.faults.draw()
+            if outcome == TIMEOUT:
+                device_delay += device.faults.timeout
+            delay = max(delay, device_delay)
+            if outcome == OK:
+                values[point] = device.get()
+            else:
+                status = device.faults.error_status if outcome == ERROR else 504 if outcome == TIMEOUT else 502
+                errors[point] = {"status": status, "message": f"injected {outcome}"}
+        return delay, 200, {"points": values, "errors": errors}
+
+    async def _serve(self, reader, writer, listen_port):
+        """
+        Serve the HTTP/1.1 requests of one connection, keeping it open between requests unless asked not to.
+        """
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    status, payload, keep_alive = 400, {"message": "bad request"}, False
+                else:
+                    headers = {name.strip().lower(): value.strip()
+                               for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+                    length = int(headers.get("content-length") or 0)
+                    body = await reader.readexactly(length) if length else b""
+                    path, _, query = target.partition("?")
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+
+                    if path == BATCH_PATH and method == "POST":
+                        # Faults were drawn per device, the response is ready once the delay has passed
+                        delay, status, payload = self.batch(body)
+                        outcome = None
+                    else:
+                        device = self.resolve(listen_port, path)
+                        delay, outcome = device.faults.draw() if device is not None else (0.0, OK)
+                    if delay:
+                        await asyncio.sleep(delay)
+                    if outcome == TIMEOUT:
+                        await asyncio.sleep(device.faults.timeout)
+                        break
+                    if outcome == DROP:
+                        writer.transport.abort()
+                        break
+                    if outcome == ERROR:
+                        status, payload = device.faults.error_status, {"message": "injected fault"}
+                    elif outcome == OK:
+                        status, payload = self.dispatch(listen_port, method, path, body, query)
+
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except asyncio.CancelledError:
+            # Cancelled by stop() while an injected delay was pending
+            pass
+        except Exception as e:
+            _log.error(f"Error serving simulation request on port {listen_port}: {e}")
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+
+class AsyncServerHandle(object):
+    """
+    Start/stop handle for one simulated device hosted by an AsyncSimulationServer, interchangeable with the
+    ServerHandle returned by create_server_in_thread.
+    """
+
+    def __init__(self, server, port, url, device):
+        self.server = server
+        self.port = port
+        self.url = url
+        self.device = device
+        self.ready = threading.Event()
+        self.start_latency = None
+        self.stop_latency = None
+
+    def start(self):
+        started = time.perf_counter()
+        self.server.add(self.port, self.url, self.device)
+        self.ready.set()
+        self.start_latency = time.perf_counter() - started
+
+    def stop(self):
+        started = time.perf_counter()
+        self.server.remove(self.port, self.url)
+        self.ready.clear()
+        self.stop_latency = time.perf_counter() - started
+
+
+def create_async_server(server, endpoint, port, api_key, server_type, value_field=None, simulated_values=None,
+                        **kwargs):
+    """
+    Create a handle for a simulated device on a shared async server.
+
+    Takes the same arguments as create_server_in_thread plus the server to host the device on.
+
+    :return: AsyncServerHandle, call start() to begin serving the device.
+    """
+    device = create_device(server_type, value_field=value_field, simulated_values=simulated_values, **kwargs)
+    return AsyncServerHandle(server, port, endpoint, device)
+
+
+def main(argv=None):
+    """
+    Command line entry point serving every device in a set of simulation server configs until interrupted.
+    """
+    parser = argparse.ArgumentParser(description="Serve simulated devices from one asyncio server.")
+    parser.add_argument("configs", nargs="+", help="Simulation server config files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--route-by", choices=[ROUTE_BY_PORT, ROUTE_BY_PATH], default=ROUTE_BY_PORT)
+    parser.add_argument("--port", type=int, help="Port to serve every device on when routing by path")
+    parser.add_argument("--speed", type=float,
+                        help="Play traces back by a simulation clock running this many times faster than real time")
+    parser.add_argument("--start", help="Simulated instant the clock starts from, defaults to now")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    server = AsyncSimulationServer(args.host, args.route_by, args.port)
+    server.start()
+    clock = SimulationClock(args.start, args.speed) if args.speed is not None or args.start else None
+    for path in args.configs:
+        with open(path) as f:
+            contents = json.load(f)
+        contents["server_type"] = contents["type"]
+        if clock:
+            contents["clock"] = clock
+        create_async_server(server, **contents).start()
+    _log.info(f"Serving {len(server.routes)} simulated devices")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+
+"""
+Simulation clock that drives trace playback by time rather than by request count.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import datetime
+import threading
+import time
+
+from ofc_simulation_server_manager.traces import parse_timestamps
+
+
+def to_epoch(instant):
+    """
+    Convert an instant to epoch seconds.
+
+    :param instant: Epoch seconds, or a timestamp string in the building data format or ISO 8601.
+    :return: Epoch seconds as a float, naive times are taken to be UTC.
+    """
+    if isinstance(instant, datetime.datetime):
+        instant = instant.isoformat()
+    if isinstance(instant, str):
+        return float(parse_timestamps([instant])[0])
+    return float(instant)
+
+
+class SimulationClock(object):
+    """
+    Clock running at a multiple of wall-clock speed from a chosen simulated instant.
+
+    Attributes:
+        speed (float): Simulated seconds per wall-clock second.
+        origin (float): Simulated epoch seconds at the last seek.
+        anchor (float): Wall-clock time of the last seek.
+    """
+
+    def __init__(self, start=None, speed=1.0):
+        """
+        :param start: Simulated instant to start from, see to_epoch, None for the current time.
+        :param speed: Simulated seconds per wall-clock second, e.g. 96 plays back a 15 minute sample every
+            9.375 seconds.
+        """
+        self.lock = threading.Lock()
+        self.speed = 1.0
+        self.origin = 0.0
+        self.anchor = 0.0
+        self.seek(time.time() if start is None else start, speed)
+
+    def now(self):
+        """
+        :return: Current simulated time in epoch seconds.
+        """
+        with self.lock:
+            return self.origin + (time.time() - self.anchor) * self.speed
+
+    def seek(self, instant, speed=None):
+        """
+        Move the clock to a simulated instant, optionally changing its speed.
+
+        :param instant: Simulated instant, see to_epoch.
+        :param speed: New speed, None to keep the current one.
+        """
+        origin = to_epoch(instant)
+        if speed is not None and float(speed) < 0:
+            raise ValueError("Simulation clock speed must not be negative")
+        with self.lock:
+            self.origin = origin
+            self.anchor = time.time()
+            if speed is not None:
+                self.speed = float(speed)
+
+    def snapshot(self):
+        """
+        :return: Tuple of (origin, anchor, speed) from which restore rebuilds this exact clock, e.g. in another
+            process.
+        """
+        with self.lock:
+            return self.origin, self.anchor, self.speed
+
+    def restore(self, snapshot):
+        """
+        Make the clock run exactly like the clock a snapshot was taken from.
+        """
+        with self.lock:
+            self.origin, self.anchor, self.speed = snapshot
+
+    def state(self):
+        """
+        :return: Dictionary with the simulated "time" as an ISO 8601 string, its "epoch" seconds and the "speed".
+        """
+        now = self.now()
+        return {"time": datetime.datetime.fromtimestamp(now, datetime.timezone.utc).isoformat(), "epoch": now,
+                "speed": self.speed}
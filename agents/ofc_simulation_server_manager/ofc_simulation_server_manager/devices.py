@@ -0,0 +1,194 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+State of simulated devices, shared by the per-device Flask servers and the multiplexed async server.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import time
+from collections import deque
+
+from ofc_simulation_server_manager.faults import FaultInjector
+from ofc_simulation_server_manager.traces import TRACE_STORE, Trace, cached_csv_trace
+
+read_only_server_types = ["Occupancy", "Glare", "Illuminance", "Solar Radiation"]
+read_write_server_types = ["Light", "Façade State"]
+
+# Writes each read-write server remembers unless its config sets "history_size"
+DEFAULT_HISTORY_SIZE = 1000
+# Suffix of the URL a read-write server's write history is read at
+HISTORY_SUFFIX = "/history"
+
+
+class SimulatedSensor(object):
+    """
+    Simulated sensor playing back a trace of (timestamp, value) samples.
+
+    Without a clock the sensor cycles through the trace one sample per read.  With a clock each read returns the
+    sample in effect at the clock's simulated time.
+    """
+
+    def __init__(self, simulated_values, clock=None):
+        """
+        :param simulated_values: A Trace, or a list of (timestamp, value) samples which is looked up in the shared
+            trace store.
+        :param clock: SimulationClock driving playback, None to advance one sample per read.
+        """
+        if not isinstance(simulated_values, Trace):
+            simulated_values = TRACE_STORE.from_pairs(simulated_values)
+        self.trace = simulated_values
+        self.clock = clock
+        self.index = 0
+        self.faults = FaultInjector()
+
+    def get(self):
+        """
+        Return the current simulated value and timestamp.
+        """
+        if self.clock is not None:
+            self.index = self.trace.index_at(self.clock.now())
+            timestamp, value = self.trace.sample(self.index)
+            return {"timestamp": timestamp, "value": value}
+        timestamp, value = self.trace.sample(self.index)
+        self.index += 1
+        if self.index >= len(self.trace):
+            self.index = 0
+        return {"timestamp": timestamp, "value": value}
+
+
+class SimulatedActuator(object):
+    """
+    Simulated actuator holding one value that can be read and set.
+
+    Every write is recorded in a bounded history, so tests can check what was commanded and when without polling.
+    """
+
+    def __init__(self, value_field, default_value=-1, history_size=DEFAULT_HISTORY_SIZE, clock=None):
+        """
+        :param value_field: The field name to retrieve or update.
+        :param default_value: Default value for the field if not set.
+        :param history_size: Number of most recent writes to remember.
+        :param clock: SimulationClock whose time is recorded with each write, None to record wall-clock time only.
+        """
+        self.value_field = value_field
+        self.value = default_value
+        self.faults = FaultInjector()
+        self.history = deque(maxlen=history_size)
+        self.writes = 0
+        self.clock = clock
+
+    def get(self):
+        """
+        Return the current value.
+        """
+        return {self.value_field: self.value}
+
+    def set(self, data):
+        """
+        Update the value from request JSON.
+
+        :param data: Decoded request body.
+        :return: Tuple of (response body, HTTP status).
+        """
+        new_value = (data or {}).get(self.value_field)
+        if new_value:
+            self.value = new_value
+            self._record(new_value, 200)
+            return {"message": "value updated", "value": self.value}, 200
+        self._record(new_value, 400)
+        return {"message": "value not provided"}, 400
+
+    def _record(self, value, status):
+        self.writes += 1
+        entry = {"seq": self.writes, "time": time.time(), "value": value, "status": status}
+        if self.clock is not None:
+            entry["simulated_time"] = self.clock.now()
+        self.history.append(entry)
+
+    def write_history(self, since=None, limit=None):
+        """
+        Return the recorded writes, oldest first.
+
+        :param since: Only return writes recorded after this epoch time.
+        :param limit: Only return the most recent writes, up to this many.
+        :return: Dictionary with the total number of "writes", how many were "dropped" from the full history, and
+            the "history" entries, each with its sequence number "seq", wall-clock "time", the "value" written, the
+            HTTP "status" of the write and, with a clock, the "simulated_time".
+        """
+        recorded = list(self.history)
+        writes = recorded[-1]["seq"] if recorded else 0
+        history = recorded
+        if since is not None:
+            history = [entry for entry in history if entry["time"] > since]
+        if limit is not None:
+            history = history[-limit:] if limit > 0 else []
+        return {"writes": writes, "dropped": writes - len(recorded), "history": history}
+
+
+def sensor_trace(server_type, simulated_values=None, trace=None, csv_path=None, csv_column=None):
+    """
+    Find the samples a simulated sensor plays back.
+
+    A "trace" file takes precedence over inline "simulated_values", which take precedence over a "csv" and
+    "csv column" pair.  CSV columns are converted to a trace file next to the CSV the first time they are used.
+
+    :param server_type: Type of the server.
+    :param simulated_values: Inline samples, either a list or a dictionary of lists keyed by server type.
+    :param trace: Path of a trace file.
+    :param csv_path: Path of a building-data CSV.
+    :param csv_column: Column of the CSV with the sensor's values.
+    :return: A shared Trace, or the list of inline samples.
+    """
+    if trace:
+        return TRACE_STORE.load(trace)
+    if isinstance(simulated_values, dict) and server_type in simulated_values:
+        simulated_values = simulated_values[server_type]
+    if simulated_values:
+        return simulated_values
+    if csv_path and csv_column:
+        return TRACE_STORE.load(cached_csv_trace(csv_path, csv_column))
+    raise RuntimeError(f"No simulated values, trace or csv configured for {server_type} server")
+
+
+def create_device(server_type, value_field=None, simulated_values=None, clock=None, faults=None, **kwargs):
+    """
+    Create the simulated device state for a server config.
+
+    :param server_type: Type of server to create (either read-only or read-write).
+    :param value_field: Field name for the value (for read-write servers).
+    :param simulated_values: Simulated data for read-only servers, either a list of samples or a dictionary of
+        sample lists keyed by server type.
+    :param clock: SimulationClock driving the playback of read-only servers and timing the writes of read-write
+        servers, None to advance one sample per read.
+    :param faults: Latency and failures to inject into the device's responses, see FaultInjector.configure.
+    :param kwargs: Other config keys, "trace", "csv" and "csv column" locate the samples of read-only servers and
+        "history_size" sets how many writes read-write servers remember.
+    :return: SimulatedSensor or SimulatedActuator.
+    """
+    if server_type in read_only_server_types:
+        device = SimulatedSensor(sensor_trace(server_type, simulated_values, kwargs.get("trace"), kwargs.get("csv"),
+                                              kwargs.get("csv column")), clock)
+    elif server_type in read_write_server_types:
+        device = SimulatedActuator(value_field, history_size=kwargs.get("history_size", DEFAULT_HISTORY_SIZE),
+                                   clock=clock)
+    else:
+        raise RuntimeError(f"Unsupported server type: {server_type}")
+    if faults:
+        device.faults.configure(**faults)
+    return device
@@ -0,0 +1,158 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+
+"""
+Latency and failures injected into the responses of simulated devices.
+
+A server config can set ``"faults"`` to make its device slow or unreliable, for example::
+
+    "faults": {"latency": {"distribution": "lognormal", "median": 0.05, "sigma": 0.5},
+               "error_rate": 0.01, "timeout_rate": 0.001, "timeout": 30, "drop_rate": 0.001}
+
+Every request first waits for a latency drawn from the distribution, then either succeeds, fails with
+``error_status``, hangs for ``timeout`` seconds before the connection is closed, or has its connection closed without
+a response.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import http
+import math
+import random
+import threading
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+DROP = "drop"
+
+ERROR_STATUSES = {status.value for status in http.HTTPStatus if status.value >= 400}
+
+LATENCY_DISTRIBUTIONS = {
+    "constant": lambda rng, seconds=0.0: seconds,
+    "uniform": lambda rng, low=0.0, high=0.0: rng.uniform(low, high),
+    "normal": lambda rng, mean=0.0, stddev=0.0: rng.gauss(mean, stddev),
+    "lognormal": lambda rng, median=0.0, sigma=0.0: median * math.exp(rng.gauss(0.0, sigma)),
+    "exponential": lambda rng, mean=0.0: rng.expovariate(1.0 / mean) if mean > 0 else 0.0,
+}
+
+
+class FaultInjector(object):
+    """
+    Draws the latency and outcome of each request to a simulated device.
+
+    Attributes:
+        latency (dict): Latency distribution, {"distribution": name, ...parameters}, None for no added latency.
+        error_rate (float): Fraction of requests answered with ``error_status``.
+        error_status (int): HTTP status of injected errors.
+        timeout_rate (float): Fraction of requests left unanswered for ``timeout`` seconds, then dropped.
+        timeout (float): Seconds an injected timeout hangs.
+        drop_rate (float): Fraction of requests whose connection is closed without a response.
+        counts (dict): Number of requests seen and of each injected outcome.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, error_status=503, timeout_rate=0.0, timeout=30.0,
+                 drop_rate=0.0, seed=None):
+        """
+        See configure.  ``seed`` makes the draws repeatable.
+        """
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.counts = {"requests": 0, ERROR: 0, TIMEOUT: 0, DROP: 0}
+        self.configure(latency, error_rate, error_status, timeout_rate, timeout, drop_rate)
+
+    def configure(self, latency=None, error_rate=0.0, error_status=503, timeout_rate=0.0, timeout=30.0,
+                  drop_rate=0.0):
+        """
+        Replace the fault settings, leaving out every argument turns faults off.
+
+        :param latency: Seconds added to every request, or a distribution such as {"distribution": "uniform",
+            "low": 0.01, "high": 0.2}.  Supported distributions are constant (seconds), uniform (low, high),
+            normal (mean, stddev), lognormal (median, sigma) and exponential (mean).  Negative draws count as 0.
+        :param error_rate: Fraction of requests answered with ``error_status``.
+        :param error_status: HTTP status of injected errors.
+        :param timeout_rate: Fraction of requests left unanswered for ``timeout`` seconds.
+        :param timeout: Seconds an injected timeout hangs before the connection is closed.
+        :param drop_rate: Fraction of requests whose connection is closed without a response.
+        :raises ValueError: If a setting is out of range.
+        """
+        if isinstance(latency, (int, float)):
+            latency = {"distribution": "constant", "seconds": latency}
+        if latency is not None:
+            latency = dict(latency)
+            if latency.get("distribution") not in LATENCY_DISTRIBUTIONS:
+                raise ValueError(f"Unsupported latency distribution {latency.get('distribution')}, use one of "
+                                 f"{', '.join(LATENCY_DISTRIBUTIONS)}")
+            try:
+                self._draw_latency(random.Random(0), latency)
+            except TypeError as e:
+                raise ValueError(f"Invalid {latency['distribution']} latency parameters: {e}")
+        rates = (error_rate, timeout_rate, drop_rate)
+        if any(rate < 0 for rate in rates) or sum(rates) > 1:
+            raise ValueError("Fault rates must not be negative and must add up to at most 1")
+        if int(error_status) not in ERROR_STATUSES:
+            raise ValueError(f"Injected errors need a 4xx or 5xx HTTP status, not {error_status}")
+        with self.lock:
+            self.latency = latency
+            self.error_rate = float(error_rate)
+            self.error_status = int(error_status)
+            self.timeout_rate = float(timeout_rate)
+            self.timeout = float(timeout)
+            self.drop_rate = float(drop_rate)
+            self.active = latency is not None or sum(rates) > 0
+
+    def draw(self):
+        """
+        Draw the fate of one request.
+
+        :return: Tuple of (seconds to delay the response, outcome), the outcome being OK, ERROR, TIMEOUT or DROP.
+        """
+        with self.lock:
+            self.counts["requests"] += 1
+            if not self.active:
+                return 0.0, OK
+            delay = 0.0
+            if self.latency is not None:
+                delay = max(self._draw_latency(self.random, self.latency), 0.0)
+            roll = self.random.random()
+            for outcome, rate in ((DROP, self.drop_rate), (TIMEOUT, self.timeout_rate), (ERROR, self.error_rate)):
+                if roll < rate:
+                    self.counts[outcome] += 1
+                    return delay, outcome
+                roll -= rate
+            return delay, OK
+
+    @staticmethod
+    def _draw_latency(rng, latency):
+        parameters = {key: value for key, value in latency.items() if key != "distribution"}
+        return LATENCY_DISTRIBUTIONS[latency["distribution"]](rng, **parameters)
+
+    def settings(self):
+        """
+        :return: The current settings, in the form configure takes them.
+        """
+        return {"latency": self.latency, "error_rate": self.error_rate, "error_status": self.error_status,
+                "timeout_rate": self.timeout_rate, "timeout": self.timeout, "drop_rate": self.drop_rate}
+
+    def state(self):
+        """
+        :return: Dictionary of the current "settings" and the "counts" of requests and injected faults.
+        """
+        with self.lock:
+            counts = dict(self.counts)
+        return {"settings": self.settings(), "counts": counts}
@@ -0,0 +1,354 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+
+"""
+Synthetic simulated sites of any size.
+
+Generates diurnal glare, illuminance, occupancy and solar radiation traces with noise for a number of rooms, and
+writes them as trace files along with the matching simulation server, device driver and area controller configs::
+
+    python -m ofc_simulation_server_manager.generate /home/ubuntu/ofc/generated --rooms 1000 --seed 1
+
+The output directory holds ``traces/``, ``simulation_servers/``, ``drivers/``, ``registers/`` and ``areas/``, and a
+``store-configs`` script that stores every config with ``vctl``.  Generation is seeded, so the same template, seed
+and room count always give the same site.  A JSON template passed with ``--template`` overrides any of the
+DEFAULT_TEMPLATE settings.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import argparse
+import copy
+import json
+import logging
+import os
+import shlex
+import sys
+import time
+
+import numpy as np
+
+from ofc_simulation_server_manager.traces import TRACE_DTYPE, parse_timestamps
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = {
+    "campus": "SIM",
+    "building": "B1",
+    # Where the simulated devices listen, each room uses five consecutive ports after the solar radiation server
+    "host": "localhost",
+    "base_port": 20000,
+    # Length and resolution of the traces
+    "start": "2021-01-01T00:00:00",
+    "days": 365,
+    "interval": 900,
+    # Number of distinct rooms, rooms beyond it reuse their traces, which the simulation servers then share.  None
+    # makes every room distinct, at about 1.2 MB of traces per room and year.
+    "profiles": 16,
+    # Daylight hours at the equinox swing by "season_hours" over the year, rooms face the sun up to
+    # "orientation_hours" earlier or later, and each day's clearness drops by up to "cloudiness"
+    "daylight_hours": 12.0,
+    "season_hours": 3.0,
+    "orientation_hours": 2.0,
+    "cloudiness": 0.6,
+    "sensors": {
+        "Solar Radiation": {"peak": 900.0, "noise": 0.05},
+        "Illuminance": {"peak": 275.0, "gain": [0.6, 1.2], "noise": 0.05},
+        "Glare": {"base": 0.184, "peak": 0.234, "noise": 0.002},
+        "Occupancy": {"arrival": 8.0, "departure": 18.0, "jitter": 1.0, "probability": 0.9, "weekends": False},
+    },
+    "driver": {"interval": 10, "timezone": "US/Pacific", "api_key": "6"},
+    "control_options": {"Algorithms": ["OFC General Use"], "Control Frequency": 30.0},
+    # Config store identities, every room is an "areas/<room>" config of the one area controller
+    "identities": {"driver": "platform.driver", "simulation": "ofc.simulation_server_manager",
+                   "area_controller": "ofc.controller"},
+}
+
+# Devices of each room: server type, driver name, driver type, registry file, point name, endpoint, value field
+ROOM_DEVICES = [
+    ("Glare", "enlighted_glare", "ofc_enlightened_glare_driver", "enlighted_glare_registers.json", "glare",
+     "/ems/api/org/fixture/v1/op/dim/abs", None),
+    ("Illuminance", "hunter_douglas_illuminance", "ofc_hunter_douglas_workplane_illuminance_driver",
+     "hunter_douglas_illuminance_registers.json", "illuminance", "/api/shade/5", None),
+    ("Occupancy", "cree_occupancy", "ofc_cree_occupancy_driver", "cree_occupancy_registers.json", "occupancy",
+     "/smartcast-api/v1/spaces/2/actuator", None),
+    ("Light", "cree_light", "ofc_cree_light_driver", "cree_light_registers.json", "light level",
+     "/smartcast-api/v1/spaces/11/actuator", "light_level"),
+    ("Façade State", "enlighted_facade", "ofc_enlightened_facade_state_driver", "enlighted_facade_registers.json",
+     "facade state", "/ems/api/org/fixture/v1/op/dim/abs", "state"),
+]
+
+# The building's solar radiation sensor, read with the generic illuminance driver
+SOLAR_DEVICE = ("Solar Radiation", "solar_radiation", "ofc_hunter_douglas_workplane_illuminance_driver",
+                "solar_radiation_registers.json", "solar radiation", "/api/shade/7", None)
+SOLAR_REGISTERS = [{"id": 7, "Writable": "false", "Point Name": "Solar radiation", "Volttron Point Name":
+                    "solar radiation", "Units": "W/m2", "Sensor Reading Min": 0, "Sensor Reading Max": 1400,
+                    "Starting Value": 0, "Type": "Float", "Notes": "Generated"}]
+
+
+def merge_template(template):
+    """
+    Overlay a template on DEFAULT_TEMPLATE, merging the nested dictionaries one level deep.
+    """
+    merged = copy.deepcopy(DEFAULT_TEMPLATE)
+    for key, value in (template or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            for name, setting in value.items():
+                if isinstance(setting, dict) and isinstance(merged[key].get(name), dict):
+                    merged[key][name].update(setting)
+                else:
+                    merged[key][name] = setting
+        else:
+            merged[key] = value
+    return merged
+
+
+class SiteGenerator(object):
+    """
+    Generates the traces of a synthetic site.
+
+    Every trace is computed over the whole time axis at once.  Random draws come from generators seeded with the
+    site seed and the room's profile, so a room's traces do not depend on how many rooms are generated.
+
+    Attributes:
+        template (dict): Settings, see DEFAULT_TEMPLATE.
+        seed (int): Seed of every random draw.
+        timestamps (numpy.ndarray): int64 epoch seconds of the samples.
+    """
+
+    def __init__(self, template=None, seed=0):
+        self.template = merge_template(template)
+        self.seed = seed
+        interval = int(self.template["interval"])
+        start = int(parse_timestamps([self.template["start"]])[0])
+        self.timestamps = start + interval * np.arange(int(self.template["days"] * 86400 // interval),
+                                                       dtype=np.int64)
+        self.day = (self.timestamps - start) // 86400
+        self.days = int(self.day[-1]) + 1 if len(self.day) else 0
+        self.hour = (self.timestamps % 86400) / 3600.0
+        # 1 January 1970 was a Thursday
+        self.weekday = ((self.timestamps // 86400 + 3) % 7) < 5
+        day_of_year = (self.timestamps // 86400) % 365.25
+        self.day_length = (self.template["daylight_hours"] +
+                           self.template["season_hours"] * np.sin(2 * np.pi * (day_of_year - 80) / 365.0))
+        weather = np.random.default_rng([seed, 0])
+        self.clearness = 1.0 - self.template["cloudiness"] * weather.beta(2.0, 2.0, self.days)
+
+    def sun(self, offset=0.0):
+        """
+        :param offset: Hours the facade faces the sun later than noon.
+        :return: Relative daylight of every sample, 0 at night and up to 1 when the facade faces the sun.
+        """
+        sunrise = 12.0 + offset - self.day_length / 2
+        return np.clip(np.sin(np.pi * (self.hour - sunrise) / self.day_length), 0.0, None)
+
+    def noise(self, rng, scale):
+        """
+        :return: Normal noise of every sample, or 0 if scale is 0.
+        """
+        return rng.normal(0.0, scale, len(self.timestamps)) if scale else 0.0
+
+    def solar_radiation(self):
+        """
+        :return: Solar radiation of every sample, in W/m2.
+        """
+        settings = self.template["sensors"]["Solar Radiation"]
+        rng = np.random.default_rng([self.seed, 1])
+        clear = self.sun() * self.clearness[self.day]
+        return np.clip(settings["peak"] * clear * (1 + self.noise(rng, settings["noise"])), 0.0, None)
+
+    def room(self, profile):
+        """
+        :param profile: Index of the room profile.
+        :return: Dictionary of value arrays keyed by sensor type.
+        """
+        sensors = self.template["sensors"]
+        rng = np.random.default_rng([self.seed, 2, profile])
+        orientation = self.template["orientation_hours"]
+        sun = self.sun(rng.uniform(-orientation, orientation)) * self.clearness[self.day]
+
+        illuminance = sensors["Illuminance"]
+        gain = rng.uniform(*illuminance["gain"])
+        glare = sensors["Glare"]
+        occupancy = sensors["Occupancy"]
+        jitter = occupancy["jitter"]
+        arrival = occupancy["arrival"] + rng.uniform(-jitter, jitter, self.days)
+        departure = occupancy["departure"] + rng.uniform(-jitter, jitter, self.days)
+        present = (self.hour >= arrival[self.day]) & (self.hour < departure[self.day])
+        if not occupancy["weekends"]:
+            present &= self.weekday
+        present &= rng.random(len(self.timestamps)) < occupancy["probability"]
+
+        return {
+            "Illuminance": np.clip(illuminance["peak"] * gain * sun * (1 + self.noise(rng, illuminance["noise"])),
+                                   0.0, None),
+            "Glare": np.clip(glare["base"] + (glare["peak"] - glare["base"]) * sun ** 2 +
+                             self.noise(rng, glare["noise"]), 0.0, 1.0),
+            "Occupancy": present.astype(np.float32),
+        }
+
+    def save(self, path, values):
+        """
+        Write a trace file of the generated samples.
+        """
+        records = np.empty(len(self.timestamps), dtype=TRACE_DTYPE)
+        records["timestamp"] = self.timestamps
+        records["value"] = values
+        np.save(path, records)
+
+
+def file_name(name):
+    return name.replace(" ", "_")
+
+
+def generate_site(out_dir, rooms, template=None, seed=0):
+    """
+    Write the traces and configs of a synthetic site.
+
+    :param out_dir: Output directory, created if needed.
+    :param rooms: Number of rooms.
+    :param template: Settings overriding DEFAULT_TEMPLATE.
+    :param seed: Seed of every random draw.
+    :return: Dictionary with the number of "rooms", "traces", "servers" and "drivers" written.
+    """
+    generator = SiteGenerator(template, seed)
+    template = generator.template
+    out_dir = os.path.abspath(out_dir)
+    directories = {name: os.path.join(out_dir, name)
+                   for name in ("traces", "simulation_servers", "drivers", "registers", "areas")}
+    for directory in directories.values():
+        os.makedirs(directory, exist_ok=True)
+    base_port = int(template["base_port"])
+    last_port = base_port + len(ROOM_DEVICES) * rooms
+    if last_port > 65535:
+        raise ValueError(f"{rooms} rooms from port {base_port} need ports up to {last_port}")
+    site = f"{template['campus']}/{template['building']}"
+    driver = template["driver"]
+    identities = template["identities"]
+    profiles = min(template["profiles"] or rooms, rooms)
+    commands = []
+    counts = {"rooms": rooms, "traces": 0, "servers": 0, "drivers": 0}
+
+    def write_json(path, contents):
+        with open(path, "w") as f:
+            json.dump(contents, f, indent=2, ensure_ascii=False)
+
+    def store(identity, name, path):
+        commands.append(f"vctl config store {identity} {shlex.quote(name)} {path}")
+
+    def save_trace(name, values):
+        path = os.path.join(directories["traces"], f"{name}.npy")
+        generator.save(path, values)
+        counts["traces"] += 1
+
+    def trace_path(name):
+        return os.path.join(directories["traces"], f"{name}.npy")
+
+    def add_device(device, port, topic, trace=None):
+        server_type, driver_name, driver_type, registers, point, endpoint, value_field = device
+        server = {"endpoint": endpoint, "port": port, "api_key": driver["api_key"], "type": server_type}
+        if value_field:
+            server["value_field"] = value_field
+        if trace:
+            server["trace"] = trace
+        server_name = f"simulated_{file_name(server_type)}_server_port_{port}_config.json"
+        server_path = os.path.join(directories["simulation_servers"], server_name)
+        write_json(server_path, server)
+        store(identities["simulation"], f"servers/{server_name}", shlex.quote(server_path))
+
+        driver_path = os.path.join(directories["drivers"], f"{topic.replace('/', '_')}_{driver_name}.config")
+        write_json(driver_path, {
+            "driver_config": {"host_name": f"http://{template['host']}:{port}", "api_key": driver["api_key"]},
+            "registry_config": f"config://{registers}",
+            "interval": driver["interval"],
+            "timezone": driver["timezone"],
+            "heart_beat_point": "Heartbeat",
+            "driver_type": driver_type,
+            "publish_breadth_first_all": False,
+            "publish_depth_first": False,
+            "publish_breadth_first": False
+        })
+        store(identities["driver"], f"devices/{topic}/{driver_name}", shlex.quote(driver_path))
+        counts["servers"] += 1
+        counts["drivers"] += 1
+        return f"{topic}/{driver_name}/{point}"
+
+    started = time.perf_counter()
+    for registers in sorted({device[3] for device in ROOM_DEVICES}):
+        store(identities["driver"], registers, f'"$OFC_CONFIGS/{registers}"')
+    solar_registers = os.path.join(directories["registers"], SOLAR_DEVICE[3])
+    write_json(solar_registers, SOLAR_REGISTERS)
+    store(identities["driver"], SOLAR_DEVICE[3], shlex.quote(solar_registers))
+
+    save_trace("solar_radiation", generator.solar_radiation())
+    solar_endpoint = add_device(SOLAR_DEVICE, base_port, site, trace_path("solar_radiation"))
+
+    for room in range(rooms):
+        profile = room % profiles
+        if room < profiles:
+            for server_type, values in generator.room(profile).items():
+                save_trace(f"{file_name(server_type.lower())}_{profile}", values)
+
+        unit = f"R{room:04d}"
+        devices = []
+        for index, device in enumerate(ROOM_DEVICES):
+            trace = None
+            if device[0] in ("Glare", "Illuminance", "Occupancy"):
+                trace = trace_path(f"{file_name(device[0].lower())}_{profile}")
+            port = base_port + 1 + len(ROOM_DEVICES) * room + index
+            devices.append({"Type": device[0], "VOLTTRON Endpoint": add_device(device, port, f"{site}/{unit}", trace)})
+        devices.append({"Type": "Solar Radiation", "VOLTTRON Endpoint": solar_endpoint})
+
+        area_path = os.path.join(directories["areas"], f"{unit}.config")
+        write_json(area_path, {"Area": f"{site}/{unit}/", "Control Options": template["control_options"],
+                               "Devices": devices})
+        store(identities["area_controller"], f"areas/{unit}", shlex.quote(area_path))
+
+    script = os.path.join(out_dir, "store-configs")
+    with open(script, "w") as f:
+        f.write("#!/usr/bin/env bash\n\n")
+        f.write(f"# Stores the configs of {rooms} generated rooms, each room is an areas/<room> config of the area\n")
+        f.write(f"# controller installed with the identity {identities['area_controller']}\n")
+        f.write('OFC_CONFIGS="${OFC_CONFIGS:-ofc/configs}"\n\n')
+        f.write("\n".join(commands) + "\n")
+    os.chmod(script, 0o755)
+    _log.info(f"Generated {rooms} rooms and {counts['traces']} traces in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    """
+    Command line entry point generating a synthetic site.
+    """
+    parser = argparse.ArgumentParser(description="Generate the traces and configs of a synthetic simulated site.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--rooms", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--template", help="JSON file overriding settings of the default template")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    template = None
+    if args.template:
+        with open(args.template) as f:
+            template = json.load(f)
+    print(json.dumps(generate_site(args.out_dir, args.rooms, template, args.seed)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
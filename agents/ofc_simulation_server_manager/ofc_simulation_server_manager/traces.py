@@ -0,0 +1,421 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+Compact storage for simulated sensor traces.
+
+Simulation server configs list their samples as ``[timestamp string, value]`` pairs.  Held as Python lists that costs
+well over a hundred bytes per sample, so traces are parsed once into an int64 array of epoch seconds and a float32
+array of values, twelve bytes per sample, and the original strings are rebuilt only for the sample being served.
+
+Traces can also live outside the config store in ``.npy`` files that are memory-mapped when a server starts.  Convert
+a building-data CSV, or the inline traces of existing configs, once with::
+
+    python -m ofc_simulation_server_manager.traces csv Building_Data_Int-Predictive.csv traces/ dgps_0_A
+    python -m ofc_simulation_server_manager.traces config configs/simulation_servers/*.json --trace-dir traces/
+"""
+
+__docformat__ = 'reStructuredText'
+
+import argparse
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+TRACE_DTYPE = np.dtype([("timestamp", "<i8"), ("value", "<f4")])
+
+# Timestamp format of the building data exported for the simulation configs, e.g. "1/1/2021 0:15"
+BUILDING_DATA_PATTERN = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4}) (\d{1,2}):(\d{2})$")
+
+
+def parse_building_data_timestamps(strings):
+    """
+    Parse "month/day/year hour:minute" timestamps in one vectorized pass.
+
+    :param strings: Sequence of timestamp strings.
+    :return: int64 array of epoch seconds (UTC), or None if any string has another format.
+    """
+    if not all(BUILDING_DATA_PATTERN.match(string) for string in strings):
+        return None
+    fields = np.array(re.findall(r"\d+", " ".join(strings)), dtype=np.int64).reshape(-1, 5)
+    month, day, year, hour, minute = fields.T
+    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (day - 1)
+    return days.astype(np.int64) * 86400 + hour * 3600 + minute * 60
+
+
+def format_building_data_timestamp(epoch):
+    """
+    Format epoch seconds the way the building data writes timestamps.
+    """
+    t = datetime.datetime.fromtimestamp(int(epoch), datetime.timezone.utc)
+    return f"{t.month}/{t.day}/{t.year} {t.hour}:{t.minute:02d}"
+
+
+class Trace(object):
+    """
+    A simulated sensor trace held in typed arrays.
+
+    Timestamps in the building data format are stored as epoch seconds and formatted back on playback.  Traces with
+    any other timestamp format keep their timestamp strings.
+
+    Attributes:
+        timestamps (numpy.ndarray): int64 epoch seconds, or an object array of the original strings.
+        values (numpy.ndarray): float32 values, NaN for missing values.
+        integer (bool): True if every value was an integer, so playback returns ints.
+    """
+
+    def __init__(self, timestamps, values, integer=False):
+        """
+        :param timestamps: int64 epoch seconds, or an object array of timestamp strings.
+        :param values: float32 values.
+        :param integer: True to play values back as ints.
+        """
+        if len(timestamps) != len(values):
+            raise ValueError("A trace needs one value per timestamp")
+        self.timestamps = timestamps
+        self.values = values
+        self.integer = integer
+        self._index = None
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Build a trace from ``[timestamp string, value]`` pairs.
+
+        :param pairs: List of pairs as found in the ``simulated_values`` of a simulation server config.
+        :return: Trace.
+        """
+        strings = [pair[0] for pair in pairs]
+        raw_values = [pair[1] for pair in pairs]
+        timestamps = parse_building_data_timestamps(strings)
+        if timestamps is None:
+            timestamps = np.array(strings, dtype=object)
+        values = np.array([np.nan if value is None else value for value in raw_values], dtype=np.float32)
+        integer = all(isinstance(value, int) and not isinstance(value, bool) for value in raw_values
+                      if value is not None)
+        return cls(timestamps, values, integer and bool(raw_values))
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes used by the trace's arrays.
+        """
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def timestamp(self, index):
+        """
+        :return: The timestamp string of a sample.
+        """
+        timestamp = self.timestamps[index]
+        if self.timestamps.dtype == object:
+            return timestamp
+        return format_building_data_timestamp(timestamp)
+
+    def value(self, index):
+        """
+        :return: The value of a sample as a Python number, or None if it is missing.
+        """
+        value = self.values[index]
+        if np.isnan(value):
+            return None
+        if self.integer:
+            return int(value)
+        # float32 keeps about 7 significant digits, drop the binary noise beyond them
+        return float(f"{value:.7g}")
+
+    def sample(self, index):
+        """
+        :return: Tuple of (timestamp string, value) of a sample.
+        """
+        return self.timestamp(index), self.value(index)
+
+    def index_at(self, epoch):
+        """
+        Find the sample in effect at an instant, the last one at or before it.
+
+        The trace repeats, its period running from the first timestamp to one sampling interval past the last, so
+        every instant falls on a sample.
+
+        :param epoch: Epoch seconds.
+        :return: Index of the sample.
+        """
+        if self.timestamps.dtype == object:
+            raise ValueError("Only traces with building data or ISO 8601 timestamps can be played back by time")
+        if self._index is None:
+            self._index = self._build_index()
+        order, ordered, period = self._index
+        position = int(np.searchsorted(ordered, ordered[0] + (int(epoch) - ordered[0]) % period, side="right")) - 1
+        return position if order is None else int(order[position])
+
+    def _build_index(self):
+        timestamps = np.asarray(self.timestamps)
+        order = None
+        if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps = timestamps[order]
+        interval = int(timestamps[1] - timestamps[0]) if len(timestamps) > 1 else 0
+        return order, timestamps, max(int(timestamps[-1] - timestamps[0]) + interval, 1)
+
+
+class TraceStore(object):
+    """
+    Shares one read-only Trace between every simulated sensor playing back the same samples.
+
+    Inline traces are keyed by a SHA-256 hash of their samples, so byte-identical ``simulated_values`` in different
+    configs are only parsed and stored once.  Trace files are keyed by their path, size and modification time, as the
+    memory-mapped pages are already shared through the OS page cache.  Each sensor keeps its own playback position.
+    Traces are dropped once no sensor uses them.
+
+    Attributes:
+        traces (weakref.WeakValueDictionary): Traces in use, keyed by content key.
+        hits (int): Number of lookups served by an existing trace.
+        misses (int): Number of traces built.
+    """
+
+    def __init__(self):
+        self.traces = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def from_pairs(self, pairs):
+        """
+        Return the shared trace for a list of ``[timestamp string, value]`` pairs.
+        """
+        digest = hashlib.sha256(json.dumps(pairs, separators=(",", ":")).encode("utf-8")).hexdigest()
+        return self._get(f"sha256:{digest}", lambda: Trace.from_pairs(pairs))
+
+    def load(self, path):
+        """
+        Return the shared memory-mapped trace for a trace file.
+        """
+        stat = os.stat(path)
+        return self._get(f"file:{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}", lambda: load_trace(path))
+
+    def _get(self, key, build):
+        with self.lock:
+            trace = self.traces.get(key)
+            if trace is not None:
+                self.hits += 1
+                return trace
+            self.misses += 1
+            trace = build()
+            for array in (trace.timestamps, trace.values):
+                if array.flags.writeable:
+                    array.flags.writeable = False
+            self.traces[key] = trace
+            return trace
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of shared traces, the bytes they hold and the lookup hits and misses.
+        """
+        traces = list(self.traces.values())
+        return {"traces": len(traces), "bytes": sum(trace.nbytes for trace in traces), "hits": self.hits,
+                "misses": self.misses}
+
+
+# Store shared by every simulated sensor in the process
+TRACE_STORE = TraceStore()
+
+
+def parse_timestamps(strings):
+    """
+    Parse timestamp strings to epoch seconds, in the building data format or ISO 8601.
+
+    :param strings: Sequence of timestamp strings.
+    :return: int64 array of epoch seconds, naive times are taken to be UTC.
+    """
+    timestamps = parse_building_data_timestamps(strings)
+    if timestamps is not None:
+        return timestamps
+    parsed = []
+    for string in strings:
+        t = datetime.datetime.fromisoformat(string)
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=datetime.timezone.utc)
+        parsed.append(int(t.timestamp()))
+    return np.array(parsed, dtype=np.int64)
+
+
+def save_trace(path, trace):
+    """
+    Save a trace to an ``.npy`` file of (timestamp, value) records.
+
+    :param path: File to write.
+    :param trace: Trace with epoch second timestamps.
+    """
+    if trace.timestamps.dtype == object:
+        raise ValueError("Only traces with building data timestamps can be saved")
+    records = np.empty(len(trace), dtype=TRACE_DTYPE)
+    records["timestamp"] = trace.timestamps
+    records["value"] = trace.values
+    np.save(path, records)
+
+
+def load_trace(path):
+    """
+    Memory-map a trace file.  Samples are only read from disk when they are served.
+
+    :param path: ``.npy`` file written by save_trace or convert_csv.
+    :return: Trace backed by the file.
+    """
+    records = np.load(path, mmap_mode="r")
+    if records.dtype != TRACE_DTYPE:
+        raise ValueError(f"{path} is not a trace file")
+    return Trace(records["timestamp"], records["value"])
+
+
+def convert_csv(csv_path, columns, out_dir, timestamp_column=None, chunk_size=100000):
+    """
+    Stream a building-data CSV into one trace file per column, without loading the whole file.
+
+    :param csv_path: Path to the CSV file.
+    :param columns: Names of the value columns to convert.
+    :param out_dir: Directory for the ``<column>.npy`` trace files, created if needed.
+    :param timestamp_column: Name of the timestamp column, defaults to the first column.
+    :param chunk_size: Number of rows parsed at a time.
+    :return: Dictionary mapping column names to the trace files written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise RuntimeError(f"Columns {missing} not found in {csv_path}")
+        time_idx = header.index(timestamp_column) if timestamp_column else 0
+        indices = {column: header.index(column) for column in columns}
+
+        # Append each chunk to raw record files, the row count is only known at the end
+        raw_files = {column: tempfile.TemporaryFile(dir=out_dir) for column in columns}
+        rows_written = 0
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                break
+            records = np.empty(len(rows), dtype=TRACE_DTYPE)
+            records["timestamp"] = parse_timestamps([row[time_idx].strip() for row in rows])
+            for column, idx in indices.items():
+                records["value"] = [float(row[idx]) if idx < len(row) and row[idx].strip() else np.nan
+                                    for row in rows]
+                records.tofile(raw_files[column])
+            rows_written += len(rows)
+
+    paths = {}
+    for column, raw in raw_files.items():
+        path = os.path.join(out_dir, f"{column}.npy")
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=TRACE_DTYPE, shape=(rows_written,))
+        raw.seek(0)
+        for start in range(0, rows_written, chunk_size):
+            block = np.fromfile(raw, dtype=TRACE_DTYPE, count=min(chunk_size, rows_written - start))
+            out[start:start + len(block)] = block
+        out.flush()
+        del out
+        raw.close()
+        paths[column] = path
+    _log.info(f"Converted {rows_written} rows of {list(columns)} from {csv_path} to {out_dir}")
+    return paths
+
+
+def cached_csv_trace(csv_path, column):
+    """
+    Return the trace file for one column of a CSV, converting the CSV the first time it is needed.
+
+    The trace file is kept next to the CSV and rebuilt when the CSV is newer.
+
+    :param csv_path: Path to the building-data CSV.
+    :param column: Name of the value column.
+    :return: Path of the trace file.
+    """
+    out_dir = f"{csv_path}.traces"
+    path = os.path.join(out_dir, f"{column}.npy")
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+        convert_csv(csv_path, [column], out_dir)
+    return path
+
+
+def convert_config(config_path, trace_dir):
+    """
+    Move a simulation server config's inline trace to a trace file and drop it from the config.
+
+    :param config_path: Simulation server config file, rewritten in place.
+    :param trace_dir: Directory for the trace file, created if needed.
+    :return: Path of the trace file, or None if the config has no inline trace.
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+    simulated_values = config.pop("simulated_values", None)
+    if not simulated_values:
+        return None
+    if isinstance(simulated_values, dict):
+        simulated_values = simulated_values.get(config["type"], [])
+
+    os.makedirs(trace_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(config_path))[0]
+    path = os.path.abspath(os.path.join(trace_dir, f"{name}.npy"))
+    save_trace(path, Trace.from_pairs(simulated_values))
+    config["trace"] = path
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+def main(argv=None):
+    """
+    Command line entry point converting CSV columns or config files to trace files.
+    """
+    parser = argparse.ArgumentParser(description="Convert simulated traces to memory-mappable trace files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    csv_parser = subparsers.add_parser("csv", help="Convert columns of a building-data CSV")
+    csv_parser.add_argument("csv")
+    csv_parser.add_argument("out_dir")
+    csv_parser.add_argument("columns", nargs="+")
+    csv_parser.add_argument("--timestamp-column")
+    config_parser = subparsers.add_parser("config", help="Move the inline traces of configs to trace files")
+    config_parser.add_argument("configs", nargs="+")
+    config_parser.add_argument("--trace-dir", required=True)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "csv":
+        for column, path in convert_csv(args.csv, args.columns, args.out_dir, args.timestamp_column).items():
+            print(f"{column}: {path}")
+    else:
+        for config_path in args.configs:
+            print(f"{config_path}: {convert_config(config_path, args.trace_dir)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+
+"""
+Simulated devices spread over worker processes.
+
+Simulation servers running as threads in the manager agent share its GIL with the VOLTTRON message loop.  With
+``"simulation_workers"`` set in the manager's agent config, devices are instead hosted by that many worker processes,
+each serving its share of the devices from its own AsyncSimulationServer.  Devices are assigned to workers by port,
+so every device configured on a port is served by the same worker, and the manager restarts workers that die.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+import multiprocessing
+import threading
+import time
+
+from ofc_simulation_server_manager.async_server import AsyncSimulationServer, create_async_server
+from ofc_simulation_server_manager.clock import SimulationClock
+
+_log = logging.getLogger(__name__)
+
+# Seconds to wait for a worker to answer a command
+COMMAND_TIMEOUT = 60
+
+
+def worker_main(connection, host, clock_snapshot):
+    """
+    Entry point of a worker process, serving devices and answering commands from the manager until told to stop.
+
+    :param connection: Pipe to the manager.
+    :param host: Interface the devices listen on.
+    :param clock_snapshot: Snapshot of the manager's simulation clock, None to advance one sample per request.
+    """
+    logging.basicConfig(level=logging.INFO)
+    server = AsyncSimulationServer(host)
+    server.start()
+    clock = None
+    if clock_snapshot is not None:
+        clock = SimulationClock()
+        clock.restore(clock_snapshot)
+    handles = {}
+
+    def add(config_name, contents):
+        existing = handles.pop(config_name, None)
+        if existing:
+            existing.stop()
+        handle = create_async_server(server, clock=clock, **contents)
+        handle.start()
+        handles[config_name] = handle
+
+    def remove(config_name):
+        handle = handles.pop(config_name, None)
+        if handle:
+            handle.stop()
+
+    def stats():
+        requests = sum(handle.device.faults.counts["requests"] for handle in handles.values())
+        return {"devices": len(handles), "requests": requests, "connections": len(server.connections)}
+
+    commands = {
+        "add": add,
+        "remove": remove,
+        "set_faults": lambda config_name, faults: handles[config_name].device.faults.configure(**faults),
+        "faults": lambda config_name: handles[config_name].device.faults.state(),
+        "history": lambda config_name, since, limit: handles[config_name].device.write_history(since, limit),
+        "clock": lambda snapshot: clock.restore(snapshot) if clock else None,
+        "stats": stats,
+    }
+    while True:
+        try:
+            command, args = connection.recv()
+        except (EOFError, OSError):
+            break
+        if command == "stop":
+            break
+        try:
+            connection.send((True, commands[command](*args)))
+        except Exception as e:
+            connection.send((False, f"{type(e).__name__}: {e}"))
+    server.stop()
+    connection.close()
+
+
+class SimulationWorker(object):
+    """
+    The manager's side of one worker process.
+
+    Attributes:
+        index (int): Position of the worker in its host.
+        process (multiprocessing.Process): The worker process.
+        restarts (int): Number of times the worker was restarted after dying.
+    """
+
+    def __init__(self, index, host, context):
+        self.index = index
+        self.host = host
+        self.context = context
+        self.process = None
+        self.connection = None
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.last_requests = None
+
+    def start(self, clock_snapshot=None):
+        self.connection, child = self.context.Pipe()
+        self.process = self.context.Process(target=worker_main, args=(child, self.host, clock_snapshot),
+                                            name=f"OFC simulation worker {self.index}", daemon=True)
+        self.process.start()
+        child.close()
+        self.last_requests = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def call(self, command, *args, timeout=COMMAND_TIMEOUT):
+        """
+        Run a command in the worker and return its result.
+
+        A worker that does not answer in time is terminated, since a late answer would be read as the answer to
+        the next command, and is restarted by ShardedSimulationHost.supervise.
+
+        :raises RuntimeError: If the worker is not running, fails the command or does not answer in time.
+        """
+        with self.lock:
+            if not self.alive:
+                raise RuntimeError(f"Simulation worker {self.index} is not running")
+            self.connection.send((command, args))
+            if not self.connection.poll(timeout):
+                self.process.terminate()
+                self.process.join()
+                raise RuntimeError(f"Simulation worker {self.index} did not answer {command} within {timeout}s, "
+                                   f"terminated it")
+            ok, result = self.connection.recv()
+        if not ok:
+            raise RuntimeError(f"Simulation worker {self.index} failed {command}: {result}")
+        return result
+
+    def stop(self, timeout=10):
+        if self.process is None:
+            return
+        with self.lock:
+            if self.process.is_alive():
+                try:
+                    self.connection.send(("stop", ()))
+                except OSError:
+                    pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.connection.close()
+        self.process = None
+
+
+class ShardedSimulationHost(object):
+    """
+    Hosts simulated devices in a pool of worker processes.
+
+    Attributes:
+        workers (list): SimulationWorker per process.
+        devices (dict): Server configuration of every hosted device keyed by configuration name, kept to restore the
+            devices of a worker that is restarted.
+        clock (SimulationClock): The manager's simulation clock, mirrored in every worker.
+    """
+
+    def __init__(self, workers=2, host="127.0.0.1", clock=None):
+        """
+        :param workers: Number of worker processes.
+        :param host: Interface the devices listen on.
+        :param clock: Simulation clock driving playback, None to advance one sample per request.
+        """
+        if workers < 1:
+            raise ValueError("At least one simulation worker is required")
+        # Workers are spawned, forking the gevent-based agent process is not safe
+        context = multiprocessing.get_context("spawn")
+        self.workers = [SimulationWorker(index, host, context) for index in range(workers)]
+        self.devices = {}
+        self.clock = clock
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker processes unless they are already running.
+        """
+        with self.lock:
+            if self.started:
+                return
+            snapshot = self.clock.snapshot() if self.clock else None
+            for worker in self.workers:
+                worker.start(snapshot)
+            self.started = True
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        self.started = False
+
+    def shard(self, contents):
+        """
+        :return: The worker hosting a device, chosen by the port it is configured on.
+        """
+        return self.workers[int(contents["port"]) % len(self.workers)]
+
+    def add(self, config_name, contents):
+        """
+        Serve a device, replacing any device with the same configuration name.
+
+        :param config_name: Name of the server configuration.
+        :param contents: Arguments of create_async_server, without the server and clock.
+        """
+        self.remove(config_name)
+        self.shard(contents).call("add", config_name, contents)
+        self.devices[config_name] = contents
+
+    def remove(self, config_name):
+        contents = self.devices.pop(config_name, None)
+        if contents is not None:
+            self.shard(contents).call("remove", config_name)
+
+    def set_faults(self, config_name, faults):
+        return self.shard(self.devices[config_name]).call("set_faults", config_name, faults)
+
+    def fault_state(self, config_name):
+        return self.shard(self.devices[config_name]).call("faults", config_name)
+
+    def write_history(self, config_name, since=None, limit=None):
+        return self.shard(self.devices[config_name]).call("history", config_name, since, limit)
+
+    def sync_clock(self):
+        """
+        Copy the manager's simulation clock to every worker, e.g. after a seek.
+        """
+        snapshot = self.clock.snapshot()
+        for worker in self.workers:
+            worker.call("clock", snapshot)
+
+    def supervise(self):
+        """
+        Restart workers that have died and restore their devices.
+
+        :return: Indexes of the restarted workers.
+        """
+        restarted = []
+        for worker in self.workers:
+            if not self.started or worker.alive:
+                continue
+            _log.error(f"Simulation worker {worker.index} exited with {worker.process.exitcode}, restarting it")
+            worker.stop()
+            worker.start(self.clock.snapshot() if self.clock else None)
+            worker.restarts += 1
+            for config_name, contents in self.devices.items():
+                if self.shard(contents) is worker:
+                    try:
+                        worker.call("add", config_name, contents)
+                    except Exception as e:
+                        _log.error(f"Error restoring simulation server {config_name}: {e}")
+            restarted.append(worker.index)
+        return restarted
+
+    def stats(self):
+        """
+        Collect the health and load of every worker.
+
+        :return: Dictionary with a list of per-worker "workers" stats, each with the worker's "pid", whether it is
+            "alive", its "restarts", "devices", open "connections", total "requests" and "requests_per_second"
+            since the previous call, and the "devices" and "requests_per_second" totals.
+        """
+        workers = []
+        for worker in self.workers:
+            entry = {"index": worker.index, "pid": worker.process.pid if worker.process else None,
+                     "alive": worker.alive, "restarts": worker.restarts, "devices": 0, "connections": 0,
+                     "requests": None, "requests_per_second": None}
+            try:
+                entry.update(worker.call("stats", timeout=5))
+            except RuntimeError as e:
+                _log.error(f"Error collecting simulation worker stats: {e}")
+            now = time.monotonic()
+            if entry["requests"] is not None:
+                if worker.last_requests is not None:
+                    then, requests = worker.last_requests
+                    # Removed devices take their counts with them
+                    entry["requests_per_second"] = max(entry["requests"] - requests, 0) / max(now - then, 1e-9)
+                worker.last_requests = (now, entry["requests"])
+            workers.append(entry)
+        return {"workers": workers, "devices": sum(entry["devices"] for entry in workers),
+                "requests_per_second": sum(entry["requests_per_second"] or 0 for entry in workers)}
+
+
+class RemoteFaults(object):
+    """
+    Stands in for the FaultInjector of a device hosted by a worker process.
+    """
+
+    def __init__(self, host, config_name):
+        self.host = host
+        self.config_name = config_name
+
+    def configure(self, **faults):
+        self.host.set_faults(self.config_name, faults)
+
+    def state(self):
+        return self.host.fault_state(self.config_name)
+
+
+class RemoteDevice(object):
+    """
+    Stands in for a device hosted by a worker process.
+    """
+
+    def __init__(self, host, config_name):
+        self.host = host
+        self.config_name = config_name
+        self.faults = RemoteFaults(host, config_name)
+
+    def write_history(self, since=None, limit=None):
+        return self.host.write_history(self.config_name, since, limit)
+
+
+class WorkerServerHandle(object):
+    """
+    Start/stop handle for one simulated device hosted by a ShardedSimulationHost, interchangeable with the
+    ServerHandle returned by create_server_in_thread.
+    """
+
+    def __init__(self, host, config_name, contents):
+        self.host = host
+        self.config_name = config_name
+        self.contents = {key: value for key, value in contents.items() if key != "clock"}
+        self.device = RemoteDevice(host, config_name)
+        self.ready = threading.Event()
+        self.start_latency = None
+        self.stop_latency = None
+
+    def start(self):
+        started = time.perf_counter()
+        self.host.add(self.config_name, self.contents)
+        self.ready.set()
+        self.start_latency = time.perf_counter() - started
+
+    def stop(self):
+        started = time.perf_counter()
+        self.host.remove(self.config_name)
+        self.ready.clear()
+        self.stop_latency = time.perf_counter() - started
@@ -18,7 +18,7 @@ setup(
     author="",
     author_email="",
     description="",
-    install_requires=['volttron'],
+    install_requires=['volttron', 'numpy'],
     packages=packages,
     entry_points={
         'setuptools.installation': [
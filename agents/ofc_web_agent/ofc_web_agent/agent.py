@@ -31,6 +31,9 @@ utils.setup_logging()
 _log = logging.getLogger(__name__)
 __version__ = '0.1'
 
+# Names of the negative rule IDs control algorithms publish in structured analysis records
+RULE_NAMES = {-1: "Default", -2: "Optimized", -3: "Least violating"}
+
 MY_PATH = os.path.dirname(__file__)
 WEBROOT = os.path.join(MY_PATH, "webroot")
 
@@ -278,14 +281,86 @@ class OFCWebAgent(Agent):
         action_data = self.get_topic_data_from_historian(action_topic)
         reason_data = self.get_topic_data_from_historian(reason_topic)
 
-        action_values = {ts: v for ts, v in action_data.get("values")}
-        reason_values = {ts: v for ts, v in reason_data.get("values")}
+        if not action_data and not reason_data:
+            return self.get_structured_analysis(path[1:])
+
+        action_values = {ts: v for ts, v in (action_data or {}).get("values", [])}
+        reason_values = {ts: v for ts, v in (reason_data or {}).get("values", [])}
 
         all_timestamps = sorted(set(action_values.keys()).union(reason_values.keys()))
 
         return [{"timestamp": ts, "action": action_values.get(ts), "reason": reason_values.get(ts)} for ts in
                 all_timestamps]
 
+    def get_structured_analysis(self, topic):
+        """
+        Retrieve analysis rows published in the structured or batched formats.
+
+        Batched records (``<topic>/batch``) are expanded into one row per area.  Structured per-area records are
+        read from their numeric points, which share the timestamp of the message they were published in.
+
+        :param topic: The analysis topic without the leading slash.
+        :return: A list of rows with numeric fields plus display action and reason strings.
+        """
+        rows = []
+        batch_data = self.get_topic_data_from_historian(f"{topic}/batch")
+        for ts, batch in (batch_data or {}).get("values", []):
+            if isinstance(batch, str):
+                batch = json.loads(batch)
+            stale = batch.get("stale") or [0] * len(batch.get("areas", []))
+            for idx, area in enumerate(batch.get("areas", [])):
+                rows.append(analysis_row(ts, area, batch["light_level"][idx], batch["facade_state"][idx],
+                                         batch["light_rule"][idx], batch["facade_rule"][idx], stale[idx]))
+        if rows:
+            return sorted(rows, key=lambda row: row["timestamp"])
+
+        # Structured records are published to ofc_analysis/<identity>/<area>, and area names may contain slashes
+        area = topic.split("/", 2)[2] if topic.startswith("ofc_analysis/") and topic.count("/") >= 2 else topic
+        fields = ["light_level", "facade_state", "light_rule", "facade_rule", "stale"]
+        values = {}
+        for field in fields:
+            field_data = self.get_topic_data_from_historian(f"{topic}/{field}")
+            values[field] = {ts: v for ts, v in (field_data or {}).get("values", [])}
+
+        return [analysis_row(ts, area, *[values[field].get(ts) for field in fields])
+                for ts in sorted(values["light_level"])]
+
+
+def analysis_row(timestamp, area, light_level, facade_state, light_rule, facade_rule, stale=0):
+    """
+    Build an analysis log row from a structured analysis record.
+
+    :param timestamp: Timestamp of the record.
+    :param area: Name of the area.
+    :param light_level: Light level set by the algorithm.
+    :param facade_state: Façade state set by the algorithm.
+    :param light_rule: Index of the rule that set the light level, negative for the entries in RULE_NAMES.
+    :param facade_rule: Index of the rule that set the façade state, negative for the entries in RULE_NAMES.
+    :param stale: 1 if the algorithm reused a previous decision because input data was missing.
+    :return: Dictionary with the numeric fields and display strings for the UI.
+    """
+
+    def rule_name(rule):
+        if rule is None or rule < 0:
+            return RULE_NAMES.get(rule, "Default")
+        return f"Rule {rule}"
+
+    reason = f"Light level reason: {rule_name(light_rule)}, Façade state reason: {rule_name(facade_rule)}"
+    if stale:
+        reason = f"Stale, input data unavailable. Previous {reason}"
+
+    return {
+        "timestamp": timestamp,
+        "area": area,
+        "light_level": light_level,
+        "facade_state": facade_state,
+        "light_rule": light_rule,
+        "facade_rule": facade_rule,
+        "stale": stale,
+        "action": f"Set light level: {light_level}, Façade state: {facade_state}",
+        "reason": reason
+    }
+
 
 def main():
     """
@@ -15,9 +15,8 @@
 # Software to reproduce, distribute copies to the public, prepare derivative 
 # works, and perform publicly and display publicly, and to permit others to do so.
 
-from platform_driver.interfaces.ofc_generic_driver_base import OFCGenericInterface, OFCGenericRegister
+from platform_driver.interfaces.ofc_generic_driver_base import OFCGenericInterface, OFCGenericRegister, http_request
 import logging
-import requests
 import random
 
 _log = logging.getLogger(__name__)
@@ -44,7 +43,7 @@ def post_cree(host, device_id, api_key, val):
     _log.info('Sending url {}\n\theaders = {}\n\tjson = {}'.format(url, headers, content))
 
     try:
-        response = requests.post(url=url, headers=headers, json=content, verify=False)
+        response = http_request("POST", url, headers=headers, json=content, verify=False)
         _log.info("Got response: {response}")
     except Exception as e:
         _log.error(f"Error attempting to set Cree light host: {host} device id: {device_id} error: {e}")
@@ -62,7 +61,7 @@ def get_cree(host, device_id, api_key):
     _log.info(f"Making get request to: {url}")
 
     try:
-        response = requests.get(url=url, headers=headers)
+        response = http_request("GET", url, headers=headers)
         _log.debug(f"Got response {response}")
         response = response.json()
         value = response.get("light_level")
@@ -83,6 +82,9 @@ class Interface(OFCGenericInterface):
         _log.info("registry_config_str:\t {v}\n".format(v=registry_config_str))
 
         self.host_name = config_dict.get("host_name")
+        self.configure_batch(config_dict)
+        self.configure_session(config_dict)
+        self.configure_scrape(config_dict)
         self.api_key = config_dict.get("api_key")
         self.parse_registers(registry_config_str)
         self.post_config()
@@ -119,7 +121,9 @@ class Interface(OFCGenericInterface):
                 get_request_function=get_request_function,
                 post_request_function=post_request_function,
                 default_value=default_value,
-                description=description)
+                description=description,
+                batch_point="{}/smartcast-api/v1/spaces/{}/actuator".format(self.host_name, register_id),
+                batch_field="light_level")
 
             if default_value is not None:
                 self.set_default(point_name, register.value)
@@ -15,9 +15,8 @@
 # Software to reproduce, distribute copies to the public, prepare derivative 
 # works, and perform publicly and display publicly, and to permit others to do so.
 
-from platform_driver.interfaces.ofc_generic_driver_base import OFCGenericInterface, OFCGenericRegister
+from platform_driver.interfaces.ofc_generic_driver_base import OFCGenericInterface, OFCGenericRegister, http_request
 import logging
-import requests
 import random
 import csv
 
@@ -43,7 +42,7 @@ def get_enlighted(host, device_id, api_key):
     _log.info(f"Making get request to: {url}")
 
     try:
-        response = requests.get(url=url, headers=headers)
+        response = http_request("GET", url, headers=headers)
         _log.debug(f"Got response {response}")
         response = response.json()
         value = response.get("state")
@@ -57,8 +56,11 @@ def post_enlighted(host, device_id, val):
 
     _log.info('Sending url={}\n\tjson = {}'.format(url, content))
 
-    response = requests.post(url=url, json=content, verify=False)
-    _log.info("Got response: {response}")
+    try:
+        response = http_request("POST", url, json=content, verify=False)
+        _log.info(f"Got response: {response}")
+    except Exception as e:
+        _log.error(f"Error attempting to set Enlighted facade host: {host} device id: {device_id} error: {e}")
 
 
 class Interface(OFCGenericInterface):
@@ -73,6 +75,9 @@ class Interface(OFCGenericInterface):
         _log.info("registry_config_str:\t {v}\n".format(v=registry_config_str))
 
         self.host_name = config_dict.get("host_name")
+        self.configure_batch(config_dict)
+        self.configure_session(config_dict)
+        self.configure_scrape(config_dict)
         self.parse_registers(registry_config_str)
         self.post_config()
 
@@ -119,7 +124,11 @@ class Interface(OFCGenericInterface):
                 get_request_function=get_function,
                 post_request_function=post_request_function,
                 default_value=default_value,
-                description=description)
+                description=description,
+                # Fixtures share the URL and are told apart by the APPID header, so the batch point names the fixture
+                batch_point=(f"{self.host_name}/ems/api/org/fixture/v1/op/dim/abs?fixture={register_id}"
+                             if csv_path is None else None),
+                batch_field="state")
 
             if default_value is not None:
                 self.set_default(point_name, register.value)
@@ -15,18 +15,253 @@
 # Software to reproduce, distribute copies to the public, prepare derivative 
 # works, and perform publicly and display publicly, and to permit others to do so.
 
-from volttron.platform.messaging.health import STATUS_GOOD
+from volttron.platform.messaging.health import STATUS_BAD, STATUS_GOOD
 from platform_driver.interfaces import BaseInterface, BaseRegister, BasicRevert
 from volttron.platform.agent import utils
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from gevent.lock import BoundedSemaphore
+import gevent
+import json
 import logging
+import requests
+import threading
+import time
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
+DEFAULT_BATCH_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 4
+DEFAULT_SCRAPE_CONCURRENCY = DEFAULT_POOL_SIZE
+DEFAULT_SCRAPE_TIMEOUT = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+# One session, circuit breaker and pair of timeouts per scheme and host, shared by every driver talking to that host
+_sessions = {}
+_breakers = {}
+_timeouts = {}
+_sessions_lock = threading.Lock()
+# Points of each host that were stale in their device's last scrape, and the health last reported for the platform
+# driver, which every driver shares
+_stale_points = {}
+_reported_health = None
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of making a request to a host whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Fails requests to a host fast after repeated errors.
+
+    The breaker opens after failure_threshold consecutive errors and then rejects requests for reset_timeout
+    seconds.  After that it is half open and lets one probe request through, which closes the breaker if it succeeds
+    and opens it again if it fails.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.errors = 0
+        self.requests = 0
+        self.rejected = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self):
+        """
+        :return: True if a request may be made now, counting it, False if it is rejected.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                self.rejected += 1
+                return False
+            self.probing = True
+        self.requests += 1
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.errors += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def status(self):
+        """
+        :return: Dictionary of the breaker's state, consecutive failures and counts of requests, errors and
+            rejected requests.
+        """
+        return {"state": self.state, "failures": self.failures, "requests": self.requests, "errors": self.errors,
+                "rejected": self.rejected}
+
+
+def host_key(url):
+    parts = urlsplit(url)
+    return parts.scheme, parts.netloc
+
+
+def get_session(url, pool_size=None):
+    """
+    Get the shared session for the host of a URL.
+
+    Connections made through the session stay open between scrapes, so requests to a host skip the TCP and TLS
+    handshakes of all but its first connections.  At most pool_size connections are kept per host, requests beyond them
+    wait for a free connection.
+
+    :param url: URL, or scheme and host, of the requests.
+    :param pool_size: Connections to keep to the host, None to keep the session's current limit or
+        DEFAULT_POOL_SIZE for a new session.
+    :return: requests.Session
+    """
+    key = host_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None or (pool_size is not None and session.pool_size != pool_size):
+            if session is not None:
+                session.close()
+            session = requests.Session()
+            session.pool_size = pool_size or DEFAULT_POOL_SIZE
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=session.pool_size, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def get_breaker(url, failure_threshold=None, reset_timeout=None):
+    """
+    Get the circuit breaker of the host of a URL, optionally changing its settings.
+
+    :param url: URL, or scheme and host, of the requests.
+    :param failure_threshold: Consecutive errors opening the breaker, None to keep the current setting.
+    :param reset_timeout: Seconds before an open breaker lets a probe request through, None to keep the current
+        setting.
+    :return: CircuitBreaker
+    """
+    key = host_key(url)
+    with _sessions_lock:
+        breaker = _breakers.setdefault(key, CircuitBreaker())
+        if failure_threshold is not None:
+            breaker.failure_threshold = failure_threshold
+        if reset_timeout is not None:
+            breaker.reset_timeout = reset_timeout
+        return breaker
+
+
+def set_timeouts(url, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+    """
+    Set the seconds requests to the host of a URL wait to connect and for each read of the response.
+    """
+    _timeouts[host_key(url)] = (connect_timeout, read_timeout)
+
+
+def http_request(method, url, **kwargs):
+    """
+    Make a request through the shared session of the URL's host.
+
+    The request times out after the host's timeouts unless given its own, and is rejected right away while the
+    host's circuit breaker is open.  Errors and 5xx responses count as failures of the host.
+
+    :param method: HTTP method, e.g. "GET".
+    :param url: Request URL.
+    :param kwargs: Other arguments of requests.request.
+    :return: requests.Response
+    :raises CircuitOpenError: If the host's circuit breaker is open.
+    """
+    key = host_key(url)
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Not requesting {url}, {key[1]} failed {breaker.failures} times in a row")
+    kwargs.setdefault("timeout", _timeouts.get(key, (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)))
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def close_sessions():
+    """
+    Close every shared session and its connections, and forget the hosts' breakers, timeouts and health.
+    """
+    global _reported_health
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _breakers.clear()
+        _timeouts.clear()
+        _stale_points.clear()
+        _reported_health = None
+
+
+def health_summary():
+    """
+    Summarize the health of every host the drivers talk to.
+
+    :return: Tuple of the status, bad while any host's circuit breaker is not closed, and a context with the
+        "circuit_breakers" status of each host and the "stale_points" of each host that has any, keyed by
+        "scheme://host".
+    """
+    with _sessions_lock:
+        breakers = {f"{scheme}://{netloc}": breaker.status() for (scheme, netloc), breaker in _breakers.items()}
+        stale = {f"{scheme}://{netloc}": sorted(points) for (scheme, netloc), points in _stale_points.items()
+                 if points}
+    closed = all(breaker["state"] == CircuitBreaker.CLOSED for breaker in breakers.values())
+    return STATUS_GOOD if closed else STATUS_BAD, {"circuit_breakers": breakers, "stale_points": stale}
+
+
+def fetch_batch(batch_url, points, headers=None, timeout=DEFAULT_BATCH_TIMEOUT):
+    """
+    Read many points from a gateway's batch endpoint in one request.
+
+    :param batch_url: URL of the batch endpoint.
+    :param points: URLs the points are read at one by one.
+    :param headers: Request headers, e.g. the API key.
+    :param timeout: Seconds to wait for the response.
+    :return: Dictionary mapping each point URL that could be read to its response body.
+    """
+    response = http_request("POST", batch_url, json={"points": points}, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    response = response.json()
+    for point, error in response.get("errors", {}).items():
+        _log.error(f"Error reading {point} from batch endpoint {batch_url}: {error}")
+    return response.get("points", {})
+
 
 class OFCGenericRegister(BaseRegister):
     def __init__(self, read_only, point_name, units, reg_type, get_request_function, post_request_function=lambda x: x,
-                 default_value=None, description=''):
+                 default_value=None, description='', batch_point=None, batch_field="value"):
         super(OFCGenericRegister, self).__init__("byte", read_only, point_name, units, description='')
 
         _log.info('OFCWebRegister init. locals:\n\t{v}\n'.format(v=locals()))
@@ -36,6 +271,9 @@ class OFCGenericRegister(BaseRegister):
         self.python_type = reg_type
         self.get_request_f = get_request_function
         self.post_request_f = post_request_function
+        # URL the point is read at, which identifies it to a batch endpoint, and the response field with its value
+        self.batch_point = batch_point
+        self.batch_field = batch_field
 
         if default_value is None:
             self._value = self.get_request_f()
@@ -59,6 +297,48 @@ class OFCGenericRegister(BaseRegister):
 class OFCGenericInterface(BasicRevert, BaseInterface):
     def __init__(self, **kwargs):
         super(OFCGenericInterface, self).__init__(**kwargs)
+        self.batch_url = None
+        self.batch_headers = None
+        self.batch_timeout = DEFAULT_BATCH_TIMEOUT
+        self.scrape_slots = BoundedSemaphore(DEFAULT_SCRAPE_CONCURRENCY)
+        self.scrape_timeout = DEFAULT_SCRAPE_TIMEOUT
+        # Last value read of each point, and the reads still running after their scrape's deadline
+        self.last_values = {}
+        self.pending_reads = {}
+        self.stale_points = set()
+        self.session_host = None
+
+    def configure_batch(self, config_dict):
+        """
+        Read the optional batch settings of a driver config.  With "batch_url" set, scrapes read every register
+        that has a batch point in one request to that URL.
+        """
+        self.batch_url = config_dict.get("batch_url")
+        self.batch_timeout = config_dict.get("batch_timeout", DEFAULT_BATCH_TIMEOUT)
+        api_key = config_dict.get("api_key")
+        self.batch_headers = {'APIKEY': str(api_key)} if api_key is not None else None
+
+    def configure_session(self, config_dict):
+        """
+        Read the optional connection settings of a driver config: "pool_size", the number of connections kept to
+        its host, "connect_timeout" and "read_timeout", in seconds, and "failure_threshold" and "reset_timeout" of the
+        host's circuit breaker, see CircuitBreaker.  Drivers sharing a host share these settings, the last one
+        configured sets them.
+        """
+        self.session_host = config_dict.get("host_name")
+        if self.session_host:
+            get_session(self.session_host, config_dict.get("pool_size"))
+            get_breaker(self.session_host, config_dict.get("failure_threshold"), config_dict.get("reset_timeout"))
+            set_timeouts(self.session_host, config_dict.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                         config_dict.get("read_timeout", DEFAULT_READ_TIMEOUT))
+
+    def configure_scrape(self, config_dict):
+        """
+        Read the optional scrape settings of a driver config, "scrape_concurrency" registers are read at a time and
+        a scrape waits at most "scrape_timeout" seconds for them.
+        """
+        self.scrape_slots = BoundedSemaphore(config_dict.get("scrape_concurrency", DEFAULT_SCRAPE_CONCURRENCY))
+        self.scrape_timeout = config_dict.get("scrape_timeout", DEFAULT_SCRAPE_TIMEOUT)
 
     def get_point(self, point_name):
         register = self.get_register_by_name(point_name)
@@ -75,11 +355,90 @@ class OFCGenericInterface(BasicRevert, BaseInterface):
 
     def _scrape_all(self):
         result = {}
+        registers = list(self.point_map.values())
 
-        for register in self.point_map.values():
-            result[register.point_name] = register.value
+        batched = [register for register in registers if getattr(register, "batch_point", None)]
+        if self.batch_url and batched:
+            try:
+                result.update(self._scrape_batch(batched))
+                registers = [register for register in registers if register not in batched]
+            except Exception as e:
+                _log.error(f"Error reading batch from {self.batch_url}, reading points one by one: {e}")
 
+        result.update(self._scrape_registers(registers))
         _log.info("_scrape_all result {r}".format(r=result))
+        self.update_health()
+        return result
+
+    def update_health(self):
+        """
+        Record the stale points of the last scrape and report the health of every host in the platform driver's
+        health status, see health_summary.  Every driver shares the status, so it is only set when the status, a
+        host's breaker state or the stale points change.
+        """
+        global _reported_health
+        if not self.session_host:
+            return
+        with _sessions_lock:
+            points = _stale_points.setdefault(host_key(self.session_host), set())
+            points.difference_update(self.point_map)
+            points.update(self.stale_points)
+        status, context = health_summary()
+        health = (status, {host: breaker["state"] for host, breaker in context["circuit_breakers"].items()},
+                  context["stale_points"])
+        if health != _reported_health:
+            _reported_health = health
+            self.vip.health.set_status(status, json.dumps(context))
+
+    def _scrape_registers(self, registers):
+        """
+        Read registers concurrently, waiting at most scrape_timeout seconds.
+
+        Registers whose read, or wait for one of the scrape_concurrency read slots, misses the deadline are stale.
+        They are reported with their last value read, or None, and their read carries on in the background.  A stale
+        register is not read again until that read finishes.
+
+        :param registers: Registers to read.
+        :return: Dictionary mapping each register's point name to its value.
+        """
+        reads = {}
+        for register in registers:
+            if register.point_name not in self.pending_reads:
+                read = gevent.spawn(self._read_register, register)
+                self.pending_reads[register.point_name] = read
+                reads[register.point_name] = read
+        gevent.joinall(list(reads.values()), timeout=self.scrape_timeout)
+
+        result = {}
+        stale = set()
+        for register in registers:
+            read = reads.get(register.point_name)
+            if read is not None and read.ready():
+                result[register.point_name] = read.value
+            else:
+                stale.add(register.point_name)
+                result[register.point_name] = self.last_values.get(register.point_name)
+        if stale:
+            _log.warning(f"Reporting stale values of {sorted(stale)}, their reads took over {self.scrape_timeout}s")
+        self.stale_points = stale
+        return result
+
+    def _read_register(self, register):
+        try:
+            with self.scrape_slots:
+                value = register.value
+            self.last_values[register.point_name] = value
+            return value
+        finally:
+            self.pending_reads.pop(register.point_name, None)
+
+    def _scrape_batch(self, registers):
+        bodies = fetch_batch(self.batch_url, [register.batch_point for register in registers], self.batch_headers,
+                             self.batch_timeout)
+        result = {}
+        for register in registers:
+            body = bodies.get(register.batch_point)
+            result[register.point_name] = body.get(register.batch_field) if body is not None else None
         return result
 
     def post_config(self):
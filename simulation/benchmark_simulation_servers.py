@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# *** Copyright Notice ***
+#
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+#
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+#
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+"""
+Throughput of the per-device Flask simulation servers against the multiplexed async server, reading one device per
+request and every device per request through the async server's batch endpoint.
+
+Run from the VOLTTRON environment the simulation server manager agent is installed in::
+
+    python simulation/benchmark_simulation_servers.py --devices 15 --requests 3000 --clients 16
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ofc_simulation_server_manager.agent import create_server_in_thread
+from ofc_simulation_server_manager.async_server import BATCH_PATH, AsyncSimulationServer, create_async_server
+
+URL = "/ems/api/org/fixture/v1/op/dim/abs"
+SIMULATED_VALUES = {"Glare": [["1/1/2021 0:00", 0.184], ["1/1/2021 0:15", 0.2]]}
+
+
+def free_ports(count):
+    """
+    Ask the OS for ports that are currently free.
+    """
+    sockets = [socket.socket() for _ in range(count)]
+    for sock in sockets:
+        sock.bind(("127.0.0.1", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+def wait_for_ports(ports, timeout=10):
+    """
+    Wait until every port accepts connections.
+    """
+    deadline = time.time() + timeout
+    for port in ports:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Server on port {port} did not start")
+                time.sleep(0.05)
+
+
+def fetch(port):
+    """
+    Read one simulated value on a new connection, as the device drivers do, and return the latency in seconds.
+    """
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("GET", URL)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"Port {port} returned {response.status}")
+    return time.perf_counter() - start
+
+
+def fetch_batch(port, points):
+    """
+    Read every device in one batch request on a new connection and return the latency in seconds.
+    """
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("POST", BATCH_PATH, json.dumps({"points": points}), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    if response.status != 200 or body["errors"]:
+        raise RuntimeError(f"Batch returned {response.status} {body.get('errors')}")
+    return time.perf_counter() - start
+
+
+def drive(ports, requests, clients):
+    """
+    Spread requests over the ports from a pool of client threads.
+
+    :return: Dictionary with the throughput and latency percentiles.
+    """
+    targets = [ports[i % len(ports)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = sorted(executor.map(fetch, targets))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation servers.")
+    parser.add_argument("--devices", type=int, default=15)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--clients", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    ports = free_ports(2 * args.devices)
+    flask_ports, async_ports = ports[:args.devices], ports[args.devices:]
+    handles = [create_server_in_thread(URL, port, None, "Glare", simulated_values=SIMULATED_VALUES)
+               for port in flask_ports]
+    for handle in handles:
+        handle.start()
+    wait_for_ports(flask_ports)
+    flask_result = drive(flask_ports, args.requests, args.clients)
+    for handle in handles:
+        handle.stop()
+
+    server = AsyncSimulationServer()
+    server.start()
+    for port in async_ports:
+        create_async_server(server, URL, port, None, "Glare", simulated_values=SIMULATED_VALUES).start()
+    wait_for_ports(async_ports)
+    async_result = drive(async_ports, args.requests, args.clients)
+
+    # The same number of device reads, every device read in each request
+    points = [f"http://127.0.0.1:{port}{URL}" for port in async_ports]
+    batches = max(args.requests // args.devices, 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        latencies = sorted(executor.map(lambda port: fetch_batch(port, points),
+                                        [async_ports[i % len(async_ports)] for i in range(batches)]))
+    elapsed = time.perf_counter() - start
+    batch_result = {
+        "reads_per_second": batches * args.devices / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000
+    }
+    server.stop()
+
+    json.dump({"devices": args.devices, "requests": args.requests, "clients": args.clients,
+               "flask_threads": flask_result, "async": async_result, "async_batch": batch_result,
+               "speedup": async_result["requests_per_second"] / flask_result["requests_per_second"]},
+              sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
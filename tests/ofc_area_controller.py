@@ -0,0 +1,105 @@
+# *** Copyright Notice ***
+# 
+# OpenFacadeControl (OFC) Copyright (c) 2024, The Regents of the University
+# of California, through Lawrence Berkeley National Laboratory (subject to receipt
+# of any required approvals from the U.S. Dept. of Energy). All rights reserved.
+# 
+# If you have questions about your rights to use or distribute this software,
+# please contact Berkeley Lab's Intellectual Property Office at
+# IPO@lbl.gov.
+# 
+# NOTICE.  This Software was developed under funding from the U.S. Department
+# of Energy and the U.S. Government consequently retains certain rights.  As
+# such, the U.S. Government has been granted for itself and others acting on
+# its behalf a paid-up, nonexclusive, irrevocable, worldwide license in the
+# Software to reproduce, distribute copies to the public, prepare derivative 
+# works, and perform publicly and display publicly, and to permit others to do so.
+
+import inspect
+import pytest
+from unittest.mock import patch
+from ofc_area_controller import OFCController
+from ofc_area_controller.priority import ROUTINE, URGENT
+import ofc_area_controller.priority
+import ofc_generic_control_algorithm.priority
+
+
+@pytest.fixture
+def agent():
+    """
+    Fixture to initialize the OFCController agent with an occupancy-adaptive cadence and two areas, one of them
+    without occupancy sensors.
+    """
+    agent = OFCController({"cadence": {"vacancy_timeout": 900, "vacant_interval": 300}})
+    with patch("time.time", return_value=0):
+        agent.add_area("areas/A", "NEW", {"Devices": [
+            {"Type": "Occupancy", "VOLTTRON Endpoint": "LBNL/71T/A/cree_occupancy/occupancy"},
+            {"Type": "Light", "VOLTTRON Endpoint": "LBNL/71T/A/cree_light/light level"}]})
+        agent.add_area("areas/B", "NEW", {"Devices": [
+            {"Type": "Light", "VOLTTRON Endpoint": "LBNL/71T/B/cree_light/light level"}]})
+    return agent
+
+
+def requested_areas(agent):
+    return [call.args[3]["area"] for call in agent.vip.pubsub.publish.call_args_list]
+
+
+def test_vacant_areas_are_requested_less_often(agent):
+    """
+    Test that areas vacant for longer than the vacancy timeout are only requested once every vacant interval.
+    """
+    with patch("time.time", return_value=800):
+        agent.start_control_loop()
+    assert requested_areas(agent) == ["areas/A", "areas/B"]
+
+    agent.vip.pubsub.publish.reset_mock()
+    with patch("time.time", return_value=1000):
+        assert agent.is_vacant("areas/A")
+        agent.start_control_loop()
+    assert requested_areas(agent) == ["areas/B"]
+
+    agent.vip.pubsub.publish.reset_mock()
+    with patch("time.time", return_value=800 + 300):
+        agent.start_control_loop()
+    assert requested_areas(agent) == ["areas/A", "areas/B"]
+
+
+def test_areas_without_occupancy_sensors_are_never_vacant(agent):
+    """
+    Test that areas without occupancy sensors are requested every cycle.
+    """
+    for now in (1000, 1010, 100000):
+        agent.vip.pubsub.publish.reset_mock()
+        with patch("time.time", return_value=now):
+            assert not agent.is_vacant("areas/B")
+            agent.start_control_loop()
+        assert "areas/B" in requested_areas(agent)
+
+
+def test_returning_occupancy_requests_urgent_control(agent):
+    """
+    Test that occupancy in a vacant area requests control for it at once with urgent priority, and that
+    occupancy in an occupied area does not.
+    """
+    with patch("time.time", return_value=1000):
+        agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/cree_occupancy/all", {},
+                                     [{"occupancy": 1}, {}])
+    agent.vip.pubsub.publish.assert_called_once()
+    message = agent.vip.pubsub.publish.call_args.args[3]
+    assert (message["area"], message["priority"]) == ("areas/A", URGENT)
+    assert not agent.is_vacant("areas/A", 1000)
+
+    agent.vip.pubsub.publish.reset_mock()
+    with patch("time.time", return_value=1100):
+        agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/cree_occupancy/all", {},
+                                     [{"occupancy": 1}, {}])
+        agent.start_control_loop()
+    assert [call.args[3]["priority"] for call in agent.vip.pubsub.publish.call_args_list] == [ROUTINE, ROUTINE]
+
+
+def test_priority_module_matches_canonical_copy():
+    """
+    Test that the area controller's priority lanes are an exact copy of the control algorithm's.
+    """
+    assert (inspect.getsource(ofc_area_controller.priority) ==
+            inspect.getsource(ofc_generic_control_algorithm.priority))
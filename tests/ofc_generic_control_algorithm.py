@@ -16,10 +16,18 @@
 # works, and perform publicly and display publicly, and to permit others to do so.
 
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 from volttron.platform.agent import utils
 from volttron.platform.vip.agent import Agent
 from ofc_generic_control_algorithm import OFCGenericControlAlgorithm, ofc_generic_control_algorithm
+from ofc_generic_control_algorithm.partition import AreaPartitioner
+from ofc_generic_control_algorithm.backtest import InputAverager, evaluate_rules, replay, replay_csv
+from ofc_generic_control_algorithm.optimizer import GridSearchOptimizer
+from ofc_generic_control_algorithm.priority import PriorityLanes, URGENT
+from ofc_generic_control_algorithm.resample import Resampler, resample_series
+from ofc_generic_control_algorithm.solar import SolarTables, solar_position
+import datetime
+import numpy as np
 
 
 @pytest.fixture
@@ -133,7 +141,7 @@ def test_handle_area_control_request(mock_rpc, mock_publish, mock_calculate_stat
     agent._handle_area_control_request(None, None, None, "agent/ofc_generic_control_algorithm", None, message)
 
     # Check that the control logic was executed and messages were published
-    mock_get_data.assert_called_once_with({"Illuminance": ["topic1"]})
+    mock_get_data.assert_called_once_with({"Illuminance": ["topic1"]}, deadline=ANY, missing=[])
     mock_publish.assert_called_once()
     mock_rpc.assert_called_once_with(None, "do_control", "test_area", 0.5, 0)
 
@@ -152,6 +160,527 @@ def test_get_topic_data_from_historian(mock_get_data, agent):
     mock_get_data.assert_called_once_with('platform.historian', 'query', topic=topic, count=10, order="LAST_TO_FIRST")
 
 
+def test_partitioner_assigns_each_area_to_one_member():
+    """
+    Test that every area is owned by exactly one member and only moved areas change owner on join.
+    """
+    areas = [f"areas/room_{i}" for i in range(200)]
+    partitioners = {m: AreaPartitioner(m) for m in ["alg.a", "alg.b", "alg.c"]}
+    for partitioner in partitioners.values():
+        for member in partitioners:
+            partitioner.heartbeat(member, now=100)
+
+    before = {}
+    for area in areas:
+        owners = [m for m, p in partitioners.items() if p.owns(area, now=100)]
+        assert len(owners) == 1
+        before[area] = owners[0]
+
+    partitioners["alg.a"].heartbeat("alg.d", now=100)
+    after = {area: partitioners["alg.a"].owner(area, now=100) for area in areas}
+    moved = [area for area in areas if before[area] != after[area]]
+    assert moved
+    assert all(after[area] == "alg.d" for area in moved)
+
+
+def test_partitioner_rebalances_when_member_times_out():
+    """
+    Test that areas owned by a silent member are taken over by the remaining members.
+    """
+    partitioner = AreaPartitioner("alg.a", member_timeout=15)
+    partitioner.heartbeat("alg.b", now=100)
+    assert partitioner.live_members(now=110) == ["alg.a", "alg.b"]
+    assert partitioner.live_members(now=120) == ["alg.a"]
+    assert all(partitioner.owns(f"area_{i}", now=120) for i in range(20))
+
+
+def test_handle_area_control_request_skips_unowned_area(agent):
+    """
+    Test that a partitioned agent ignores requests for areas owned by another pool member.
+    """
+    agent.partitioner = MagicMock()
+    agent.partitioner.owns.return_value = False
+    agent.get_all_input_data = MagicMock()
+
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       {"area": "test_area", "endpoints": {}})
+
+    agent.get_all_input_data.assert_not_called()
+
+
+def test_calculate_state_reports_rule_ids(agent):
+    """
+    Test that `calculate_state` reports which rule set each output.
+    """
+    agent.algorithm_params = [
+        {"Inputs": [{"Type": "Glare", "Threshold": 0.0}], "Outputs": [{"Type": "Light", "Setting": 0.6}]},
+        {"Inputs": [{"Type": "Glare", "Threshold": 0.2}], "Outputs": [{"Type": "Façade State", "Setting": 2}]}
+    ]
+
+    result = agent.calculate_state({"Glare": 0.5})
+    assert result["Light"]["rule"] == 0
+    assert result["Façade State"]["rule"] == 1
+
+    result = agent.calculate_state({"Glare": 0.1})
+    assert result["Façade State"]["rule"] == -1
+
+
+def test_publish_analysis_structured(agent):
+    """
+    Test that the structured format publishes numeric fields on a per-area topic.
+    """
+    agent.analysis_config = {"format": "structured"}
+    states = {"Light": {"value": 0.8, "reason": "Glare: 0.3 >= 0.2", "rule": 1},
+              "Façade State": {"value": 2, "reason": "Glare: 0.3 >= 0.2", "rule": 1}}
+
+    agent.publish_analysis("areas/room_a", states)
+
+    _, topic, _, msg = agent.vip.pubsub.publish.call_args[0]
+    assert topic == f"analysis/ofc_analysis/{agent.core.identity}/areas/room_a"
+    assert msg == {"light_level": 0.8, "facade_state": 2, "light_rule": 1, "facade_rule": 1, "stale": 0}
+
+
+def test_collect_analysis_publishes_one_batch_per_cycle(agent):
+    """
+    Test that batched analysis records are published once every request of the cycle has been seen.
+    """
+    agent.analysis_config = {"batch": True}
+    states = {"Light": {"value": 0.6, "reason": "", "rule": 0}, "Façade State": {"value": 1, "reason": "", "rule": 0}}
+
+    agent.collect_analysis("ofc.controller", {"cycle": 3, "cycle_size": 3}, agent.analysis_record("a", states))
+    agent.collect_analysis("ofc.controller", {"cycle": 3, "cycle_size": 3})
+    agent.vip.pubsub.publish.assert_not_called()
+    agent.collect_analysis("ofc.controller", {"cycle": 3, "cycle_size": 3}, agent.analysis_record("c", states))
+
+    agent.vip.pubsub.publish.assert_called_once()
+    msg = agent.vip.pubsub.publish.call_args[0][3]
+    assert msg["batch"]["areas"] == ["a", "c"]
+    assert msg["batch"]["light_level"] == [0.6, 0.6]
+    assert msg["batch"]["cycle"] == 3
+    assert agent.analysis_batches == {}
+
+
+def test_backtest_matches_calculate_state(agent):
+    """
+    Test that the vectorized replay picks the same states as `calculate_state` row by row.
+    """
+    agent.algorithm_params = [
+        {"Inputs": [{"Type": "Glare", "Threshold": 0.0}],
+         "Outputs": [{"Type": "Light", "Setting": 0.6}, {"Type": "Façade State", "Setting": 1}]},
+        {"Inputs": [{"Type": "Glare", "Threshold": 0.2}, {"Type": "Occupancy", "Threshold": 1}],
+         "Outputs": [{"Type": "Façade State", "Setting": 2}]}
+    ]
+    glare = np.array([0.1, 0.25, 0.3, 0.05])
+    occupancy = np.array([1, 1, 0, 1])
+
+    states = evaluate_rules(agent.algorithm_params, {"Glare": glare, "Occupancy": occupancy}, 4)
+
+    for i in range(4):
+        expected = agent.calculate_state({"Glare": glare[i], "Occupancy": occupancy[i]})
+        for output_type in ["Light", "Façade State"]:
+            assert states[output_type][0][i] == expected[output_type]["value"]
+            assert states[output_type][1][i] == expected[output_type]["rule"]
+
+
+def test_backtest_input_averager_spans_chunks():
+    """
+    Test that the trailing average carries samples across chunks and skips missing values.
+    """
+    averager = InputAverager(window=2)
+    first = averager.update({"Glare": np.array([0.2, np.nan])})
+    second = averager.update({"Glare": np.array([0.4, np.nan, np.nan])})
+
+    assert list(first["Glare"]) == [0.2, 0.2]
+    assert list(second["Glare"]) == [0.4, 0.4, 0.0]
+
+
+def test_backtest_replay_metrics():
+    """
+    Test that the replay counts actuations, glare exceedances and light energy per rule set.
+    """
+    rules = [{"Inputs": [{"Type": "Glare", "Threshold": 0.3}],
+              "Outputs": [{"Type": "Light", "Setting": 0.5}, {"Type": "Façade State", "Setting": 1}]}]
+    chunks = [{"Glare": np.array([0.1, 0.5])}, {"Glare": np.array([0.5, 0.1])}]
+
+    result, no_rules = replay(chunks, [rules, []], glare_limit=0.4, light_power=100.0, interval_minutes=60)
+
+    assert result["rows"] == 4
+    assert result["actuations"] == {"Light": 2, "Façade State": 2}
+    assert result["glare_exceedances"] == 0
+    assert result["light_energy_wh"] == pytest.approx(120.0)
+    assert no_rules["glare_exceedances"] == 2
+
+
+def test_backtest_replay_csv_times_parsing_and_evaluation(tmp_path):
+    """
+    Test that a CSV replay reads empty cells as NaN and reports the time spent parsing and evaluating separately.
+    """
+    csv_path = tmp_path / "building.csv"
+    csv_path.write_text("time, dgps_0_A\n0,0.1\n1,\n2,0.5\n")
+    rules = [{"Inputs": [{"Type": "Glare", "Threshold": 0.3}], "Outputs": [{"Type": "Façade State", "Setting": 1}]}]
+    timings = {}
+
+    result, = replay_csv(csv_path, [rules], {"Glare": "dgps_0_A"}, chunk_size=2, timings=timings)
+
+    assert result["rows"] == 3
+    assert set(timings) == {"parse_seconds", "evaluate_seconds"}
+    assert all(seconds > 0 for seconds in timings.values())
+
+
+OPTIMIZER_PARAMS = {
+    "light_levels": [0.0, 0.5, 1.0],
+    "facade_states": [0, 1, 2],
+    "glare_response": [1.0, 0.5, 0.1],
+    "daylight_response": [1.0, 0.5, 0.1],
+    "light_illuminance": 400.0,
+    "glare_limit": 0.35,
+    "illuminance_target": 500.0,
+    "facade_cost": [0.0, 0.1, 0.3]
+}
+
+
+def test_optimizer_picks_cheapest_feasible_candidate():
+    """
+    Test that the optimizer closes the façade only as far as glare requires and tops up with electric light.
+    """
+    optimizer = GridSearchOptimizer(OPTIMIZER_PARAMS)
+
+    # Bright and glary: half closed removes the glare and keeps enough daylight
+    result = optimizer.calculate_state({"Glare": 0.5, "Illuminance": 1200, "Occupancy": 1})
+    assert result["Façade State"]["value"] == 1
+    assert result["Light"]["value"] == 0.0
+
+    # Dim with no glare: open façade, lights make up the shortfall
+    result = optimizer.calculate_state({"Glare": 0.1, "Illuminance": 200, "Occupancy": 1})
+    assert result["Façade State"]["value"] == 0
+    assert result["Light"]["value"] == 1.0
+
+    # Unoccupied: no illuminance target
+    result = optimizer.calculate_state({"Glare": 0.1, "Illuminance": 0, "Occupancy": 0})
+    assert result["Light"]["value"] == 0.0
+
+
+def test_optimizer_evaluate_many_matches_single_area():
+    """
+    Test that evaluating many areas at once gives the same choices as one area at a time.
+    """
+    optimizer = GridSearchOptimizer(OPTIMIZER_PARAMS)
+    glare = np.array([0.05, 0.5, 5.0, 0.3])
+    illuminance = np.array([100, 1200, 3000, 600])
+    occupancy = np.array([1, 1, 1, 0])
+
+    facade_idx, light_idx, feasible = optimizer.evaluate_many(glare, illuminance, occupancy)
+
+    for i in range(len(glare)):
+        single = optimizer.evaluate_many(glare[i:i + 1], illuminance[i:i + 1], occupancy[i:i + 1])
+        assert (facade_idx[i], light_idx[i], feasible[i]) == (single[0][0], single[1][0], single[2][0])
+    assert not feasible[2]
+
+
+def test_calculate_area_state_uses_optimizer_when_selected(agent):
+    """
+    Test that areas selecting "OFC Grid Search" are handled by the optimizer.
+    """
+    agent.algorithm_params = []
+    agent.configure_optimizer("optimizer", "NEW", OPTIMIZER_PARAMS)
+    input_data = {"Glare": 0.5, "Illuminance": 1200, "Occupancy": 1}
+
+    optimized = agent.calculate_area_state(input_data, {"Algorithms": ["OFC Grid Search"]})
+    rules = agent.calculate_area_state(input_data, {"Algorithms": ["OFC General Use"]})
+
+    assert optimized["Façade State"]["rule"] == -2
+    assert rules["Façade State"]["rule"] == -1
+
+
+def test_solar_position_at_solstice_noon():
+    """
+    Test the solar position against the sun's altitude at solar noon on the June solstice in Berkeley.
+    """
+    noon = datetime.datetime(2025, 6, 21, 20, 10, tzinfo=datetime.timezone.utc).timestamp()
+    altitude, azimuth = solar_position([noon], 37.87, -122.27)
+    assert altitude[0] == pytest.approx(90 - 37.87 + 23.44, abs=0.5)
+    assert azimuth[0] == pytest.approx(180, abs=2)
+
+
+def test_solar_tables_lookup(tmp_path):
+    """
+    Test that tables are built once, memory-mapped and looked up by timestamp.
+    """
+    tables = SolarTables.load_or_build(str(tmp_path), 2025, 37.87, -122.27, {"south": 180, "north": 0})
+    assert isinstance(tables.altitude, np.memmap)
+
+    noon = datetime.datetime(2025, 6, 21, 20, 10, tzinfo=datetime.timezone.utc)
+    south = tables.lookup(noon, "south")
+    assert south["incidence"] > 0
+    assert tables.lookup(noon, "north")["incidence"] == 0
+    # Timestamps from another year fold into the table year
+    assert tables.lookup(noon.replace(year=2026))["altitude"] == pytest.approx(south["altitude"], abs=1)
+
+
+def test_solar_inputs(agent):
+    """
+    Test that areas with a façade orientation get solar altitude and incidence inputs.
+    """
+    assert agent.solar_inputs({"Façade Orientation": "south"}) == {}
+
+    agent.solar_tables = MagicMock()
+    agent.solar_tables.incidence = {"south": None}
+    agent.solar_tables.lookup.return_value = {"altitude": 40.0, "azimuth": 180.0, "incidence": 0.7}
+
+    assert agent.solar_inputs({"Façade Orientation": "south"}, timestamp=0) == {"Solar Altitude": 40.0,
+                                                                                "Solar Incidence": 0.7}
+    agent.solar_tables.lookup.assert_called_once_with(0, "south")
+
+
+def test_get_all_input_data_abandons_slow_queries(agent):
+    """
+    Test that queries still pending at the deadline are abandoned and reported as missing.
+    """
+    fast = MagicMock()
+    fast.get.return_value = {"values": [("2024-01-01T00:00:00", 0.3)]}
+    slow = MagicMock()
+    slow.get.side_effect = TimeoutError()
+    agent.query_historian = MagicMock(side_effect=[fast, slow])
+    missing = []
+
+    result = agent.get_all_input_data({"Glare": ["glare"], "Illuminance": ["illuminance"]}, deadline=0,
+                                      missing=missing)
+
+    assert result == {"Glare": {"glare": [("2024-01-01T00:00:00", 0.3)]}, "Illuminance": {"illuminance": []}}
+    assert missing == ["illuminance"]
+    slow.get.assert_called_once_with(timeout=0)
+
+
+def test_handle_area_control_request_falls_back_to_last_decision(agent):
+    """
+    Test that an area whose inputs time out reuses its last good decision, tagged as stale.
+    """
+    agent.algorithm_params = []
+    previous = {"Light": {"value": 0.8, "reason": "Glare: 0.3 >= 0.2", "rule": 1},
+                "Façade State": {"value": 2, "reason": "Glare: 0.3 >= 0.2", "rule": 1}}
+    agent.last_decisions["test_area"] = previous
+    agent.analysis_config = {"format": "structured"}
+
+    def get_all_input_data(inputs, deadline=None, missing=None):
+        missing.append("glare")
+        return {"Glare": {"glare": []}}
+
+    agent.get_all_input_data = get_all_input_data
+    message = {"area": "test_area", "endpoints": {"Glare": ["glare"]}}
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       message)
+
+    assert agent.vip.pubsub.publish.call_args[0][3]["stale"] == 1
+    agent.vip.rpc.call.assert_called_with("ofc.controller", "do_control", "test_area", 0.8, 2)
+    assert agent.get_stats() == {"requests": 1, "historian_timeouts": 1, "fallbacks": 1, "skipped": 0,
+                                 "stale_inputs": 0, "triggers": 0,
+                                 "suppressed_transitions": 0}
+
+    del agent.last_decisions["test_area"]
+    agent.vip.rpc.call.reset_mock()
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       message)
+    agent.vip.rpc.call.assert_not_called()
+    assert agent.get_stats()["skipped"] == 1
+
+
+def test_resample_series():
+    """
+    Test forward fill, linear interpolation and the maximum sample age.
+    """
+    times = np.array([0.0, 60.0, 300.0])
+    values = np.array([1.0, 2.0, 5.0])
+    grid = np.array([-30.0, 30.0, 120.0, 400.0])
+
+    ffill = resample_series(times, values, grid, "ffill", max_age=90)
+    assert np.isnan(ffill[0])
+    assert list(ffill[1:3]) == [1.0, 2.0]
+    assert np.isnan(ffill[3])
+
+    linear = resample_series(times, values, grid, "linear")
+    assert list(linear[1:]) == [1.5, 2.75, 5.0]
+
+
+def test_process_input_data_resampled(agent):
+    """
+    Test that resampled inputs are averaged over a common grid and stale topics are ignored.
+    """
+    agent.resampler = Resampler(step=60, points=3, method="ffill", max_age=120)
+    input_data = {
+        "Illuminance": {"fast": [("1970-01-01T00:10:00+00:00", 300), ("1970-01-01T00:09:00+00:00", 100)],
+                        "stale": [("1970-01-01T00:00:00+00:00", 1000)]},
+        "Glare": {"glare": [("1970-01-01T00:00:00", 0.5)]}
+    }
+
+    averages = agent.process_input_data(input_data, now=630)
+    # Grid is 00:08, 00:09 and 00:10, 00:08 has no sample yet
+    assert averages == {"Illuminance": 200, "Glare": 0}
+    assert agent.get_stats()["stale_inputs"] == 1
+
+
+def test_process_input_data_resampled_ignores_unconfigured_types(agent):
+    """
+    Test that input types without topics in the area are averaged to 0 without being counted as stale.
+    """
+    agent.resampler = Resampler(step=60, points=3, method="ffill", max_age=120)
+    input_data = {"Glare": {"glare": [("1970-01-01T00:10:00+00:00", 0.5)]}, "Occupancy": {}, "Illuminance": {}}
+
+    for now in (630, 690):
+        assert agent.process_input_data(input_data, now=now) == {"Glare": 0.5, "Occupancy": 0, "Illuminance": 0}
+    assert agent.get_stats()["stale_inputs"] == 0
+
+
+def test_device_publish_triggers_area_on_threshold_crossing(agent):
+    """
+    Test that a threshold crossing schedules one debounced evaluation of the areas fed by the point.
+    """
+    agent.event_config = {"enabled": True, "debounce": 1}
+    agent.algorithm_params = [{"Inputs": [{"Type": "Glare", "Threshold": 0.2}],
+                               "Outputs": [{"Type": "Façade State", "Setting": 2}]}]
+    agent.remember_area_request("ofc.controller", {"area": "A", "endpoints": {"Glare": ["LBNL/71T/A/glare/glare"]}})
+    headers = {"Date": "2024-01-01T00:00:00+00:00"}
+
+    agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers, [{"glare": 0.1}, {}])
+    agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers, [{"glare": 0.15}, {}])
+    agent.core.schedule.assert_not_called()
+
+    agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers, [{"glare": 0.3}, {}])
+    agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers, [{"glare": 0.1}, {}])
+    agent.core.schedule.assert_called_once()
+    assert agent.pending_triggers["A"]["value"] == 0.3
+
+
+def test_device_publish_ignores_rules_without_threshold_and_non_numeric_values(agent):
+    """
+    Test that rule inputs without a threshold and point values that are not numbers do not break crossing detection.
+    """
+    agent.event_config = {"enabled": True, "debounce": 1}
+    agent.algorithm_params = [{"Inputs": [{"Type": "Glare"}], "Outputs": [{"Type": "Light", "Setting": 0.5}]},
+                              {"Inputs": [{"Type": "Glare", "Threshold": 0.2}],
+                               "Outputs": [{"Type": "Façade State", "Setting": 2}]}]
+    agent.remember_area_request("ofc.controller", {"area": "A", "endpoints": {"Glare": ["LBNL/71T/A/glare/glare"]}})
+    headers = {"Date": "2024-01-01T00:00:00+00:00"}
+
+    assert agent.rule_thresholds("Glare") == {0.2}
+    for value in (0.1, "Error reading glare", None, 0.15):
+        agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers,
+                                     [{"glare": value}, {}])
+    agent.core.schedule.assert_not_called()
+    assert agent.event_samples["LBNL/71T/A/glare/glare"][1] == 0.15
+
+    agent._handle_device_publish(None, None, None, "devices/LBNL/71T/A/glare/all", headers, [{"glare": 0.3}, {}])
+    agent.core.schedule.assert_called_once()
+
+
+def test_evaluate_triggered_area(agent):
+    """
+    Test that a triggered evaluation uses the published sample ahead of the historian data and records its latency.
+    """
+    message = {"area": "A", "endpoints": {"Glare": ["glare"]}}
+    agent.area_requests["A"] = ("ofc.controller", message)
+    agent.pending_triggers["A"] = {"area": "A", "topic": "glare", "value": 0.3, "published": 0}
+    agent.event_samples = {"glare": ("2024-01-01T00:01:00+00:00", 0.3)}
+    agent.get_all_input_data = MagicMock(return_value={"Glare": {"glare": [("2024-01-01T00:00:00+00:00", 0.1)]}})
+    agent.algorithm_params = [{"Inputs": [{"Type": "Glare", "Threshold": 0.15}],
+                               "Outputs": [{"Type": "Façade State", "Setting": 2}]}]
+
+    agent.evaluate_triggered_area("A")
+
+    # Average of the published sample and the older historian sample
+    agent.vip.rpc.call.assert_called_with("ofc.controller", "do_control", "A", 0.1, 2, priority="urgent")
+    assert agent.get_stats()["triggers"] == 1
+    assert agent.get_trigger_latencies()[0]["latency"] > 0
+    assert agent.pending_triggers == {}
+
+
+def test_priority_lanes_weighted_order():
+    """
+    Test that lanes are served by weight without starving the routine lane, and that lane stats are kept.
+    """
+    lanes = PriorityLanes({"urgent": 2, "routine": 1})
+    for i in range(3):
+        lanes.submit("routine", print, f"r{i}")
+    for i in range(4):
+        lanes.submit("urgent", print, f"u{i}")
+    lanes.submit("unknown", print, "r3")
+
+    order = []
+    while True:
+        task = lanes.take()
+        if task is None:
+            break
+        order.append(task[2][0])
+
+    assert order == ["u0", "u1", "r0", "u2", "u3", "r1", "r2", "r3"]
+    stats = lanes.stats()
+    assert stats["urgent"]["processed"] == 4
+    assert stats["routine"]["max_depth"] == 4
+    assert stats["routine"]["depth"] == 0
+
+
+def test_handle_area_control_request_uses_priority_lane(agent):
+    """
+    Test that requests are queued in the lane named by their priority when priority lanes are enabled.
+    """
+    agent.lanes = PriorityLanes()
+    message = {"area": "A", "endpoints": {}, "priority": "urgent"}
+
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       message)
+
+    assert agent.get_lane_stats()["urgent"]["depth"] == 1
+    lane, func, args, _ = agent.lanes.take()
+    assert (lane, func, args) == ("urgent", agent.control_area, ("ofc.controller", message, None, None, "urgent"))
+
+
+def test_request_priority_reaches_do_control(agent):
+    """
+    Test that the priority of an area request is passed on to the area controller, with and without lanes.
+    """
+    message = {"area": "A", "endpoints": {}, "priority": URGENT}
+    agent.get_all_input_data = MagicMock(return_value={})
+    agent.algorithm_params = []
+
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       message)
+    agent.vip.rpc.call.assert_called_with("ofc.controller", "do_control", "A", 0.1, 0, priority=URGENT)
+
+    agent.vip.rpc.call.reset_mock()
+    agent.lanes = PriorityLanes()
+    agent._handle_area_control_request(None, "ofc.controller", None, "agent/ofc_generic_control_algorithm", None,
+                                       message)
+    _, func, args, _ = agent.lanes.take()
+    func(*args)
+    agent.vip.rpc.call.assert_called_with("ofc.controller", "do_control", "A", 0.1, 0, priority=URGENT)
+
+
+def test_hysteresis_deadband_and_dwell(agent):
+    """
+    Test that a glare value hovering around a threshold does not flip the façade, and that the minimum dwell time
+    holds a state that the rules want to leave early.
+    """
+    agent.algorithm_params = [{"Inputs": [{"Type": "Glare", "Threshold": 0.2}],
+                               "Outputs": [{"Type": "Façade State", "Setting": 2}]}]
+    agent.hysteresis_config = {"deadband": {"Glare": 0.05}, "min_dwell": {"Light": 0, "Façade State": 300}}
+
+    with patch("time.time", return_value=0):
+        assert agent.calculate_area_state({"Glare": 0.1}, {}, "A")["Façade State"]["value"] == 0
+    with patch("time.time", return_value=400):
+        assert agent.calculate_area_state({"Glare": 0.21}, {}, "A")["Façade State"]["value"] == 2
+    with patch("time.time", return_value=500):
+        # Below the deadband but within the minimum dwell time
+        state = agent.calculate_area_state({"Glare": 0.1}, {}, "A")["Façade State"]
+        assert state["value"] == 2
+        assert state["reason"].startswith("Held for minimum dwell")
+    with patch("time.time", return_value=800):
+        # Within the deadband the rule stays latched
+        assert agent.calculate_area_state({"Glare": 0.18}, {}, "A")["Façade State"]["value"] == 2
+    with patch("time.time", return_value=900):
+        assert agent.calculate_area_state({"Glare": 0.1}, {}, "A")["Façade State"]["value"] == 0
+    assert agent.get_stats()["suppressed_transitions"] == 2
+    assert agent.state_machines["A"].suppressed == {"Façade State": 2}
+
+
 def test_main(mocker):
     """
     Test the main entry point to ensure the agent is started correctly.
@@ -18,6 +18,20 @@
 import pytest
 from unittest.mock import patch, MagicMock
 from ofc_simulation_server_manager import OFCSimulationServerManager, create_read_only_server, create_read_write_server
+from ofc_simulation_server_manager.agent import create_server_in_thread
+from ofc_simulation_server_manager.clock import SimulationClock
+from ofc_simulation_server_manager.devices import create_device
+from ofc_simulation_server_manager.faults import FaultInjector
+from ofc_simulation_server_manager.generate import generate_site
+from ofc_simulation_server_manager.traces import (Trace, TraceStore, convert_config, convert_csv, load_trace,
+                                                 save_trace)
+from ofc_simulation_server_manager.async_server import AsyncSimulationServer, create_async_server
+import http.client
+import json
+import numpy as np
+import socket
+import urllib.error
+import urllib.request
 
 @pytest.fixture
 def agent():
@@ -186,6 +200,437 @@ def test_reset_server(agent, mocker):
     mock_configure.assert_called_once_with("test_server", "UPDATE", mock_config)
 
 
+def test_async_server_routes_by_path():
+    """
+    Test that one async server serves read-only and read-write devices configured on different ports.
+    """
+    server = AsyncSimulationServer(route_by="path", port=0)
+    server.start()
+    try:
+        create_async_server(server, "/glare", 52000, None, "Glare",
+                            simulated_values={"Glare": [["1/1/2021 0:00", 0.1], ["1/1/2021 0:15", 0.2]]}).start()
+        create_async_server(server, "/facade", 52400, None, "Façade State", value_field="state").start()
+        port = server.listeners[0].sockets[0].getsockname()[1]
+        base = f"http://127.0.0.1:{port}"
+
+        values = [json.load(urllib.request.urlopen(f"{base}/52000/glare"))["value"] for _ in range(3)]
+        assert values == [0.1, 0.2, 0.1]
+
+        post = urllib.request.Request(f"{base}/52400/facade", data=json.dumps({"state": 2}).encode(),
+                                      headers={"Content-Type": "application/json"})
+        assert json.load(urllib.request.urlopen(post)) == {"message": "value updated", "value": 2}
+        assert json.load(urllib.request.urlopen(f"{base}/52400/facade")) == {"state": 2}
+        assert server.dispatch(port, "GET", "/52001/glare", b"") == (404, {"message": "not found"})
+    finally:
+        server.stop()
+
+
+@patch('ofc_simulation_server_manager.agent.create_async_server')
+def test_add_server_async(mock_create_server):
+    """
+    Test that servers are hosted on the shared async server when it is configured.
+    """
+    agent = OFCSimulationServerManager({"async_server": {"route_by": "path", "port": 52000}})
+    agent.async_server = MagicMock()
+    contents = {"type": "Light", "port": 5000, "endpoint": "/test", "value_field": "light_level"}
+
+    agent.add_server("test_server", action="NEW", contents=contents)
+
+    mock_create_server.assert_called_once_with(agent.async_server, type="Light", port=5000, endpoint="/test",
+                                               value_field="light_level", server_type="Light")
+    mock_create_server.return_value.start.assert_called_once()
+
+
+def test_server_handle_releases_port():
+    """
+    Test that a Flask server handle is ready after start, and that stop releases the port for a restart.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    for value in (0.1, 0.2):
+        handle = create_server_in_thread("/glare", port, None, "Glare",
+                                         simulated_values={"Glare": [["1/1/2021 0:00", value]]})
+        handle.start()
+        assert handle.ready.is_set()
+        assert json.load(urllib.request.urlopen(f"http://127.0.0.1:{port}/glare"))["value"] == value
+        handle.stop()
+        assert not handle.ready.is_set()
+        assert handle.start_latency > 0 and handle.stop_latency > 0
+
+
+def test_reset_all_servers(agent):
+    """
+    Test that every server is rebuilt from the config store and its latencies are reported.
+    """
+    old_servers = {name: MagicMock(stop_latency=0.5) for name in ("servers/a", "servers/b")}
+    agent.server_threads = dict(old_servers)
+    agent.vip.config.get.side_effect = lambda config_name: {"type": "Light", "port": 5000, "endpoint": "/test"}
+
+    with patch('ofc_simulation_server_manager.agent.create_server_in_thread') as mock_create_server:
+        mock_create_server.return_value.start_latency = 0.25
+        result = agent.reset_all_servers()
+
+    assert result["servers"] == {"servers/a": {"stop": 0.5, "start": 0.25},
+                                 "servers/b": {"stop": 0.5, "start": 0.25}}
+    assert result["errors"] == {}
+    for server in old_servers.values():
+        server.stop.assert_called_once()
+    assert agent.get_server_latencies() == result["servers"]
+
+
+def test_trace_playback_matches_pairs():
+    """
+    Test that a trace stores typed arrays and plays back the samples it was built from.
+    """
+    pairs = [["1/1/2021 0:00", 0.184], ["12/31/2021 23:45", 0.25], ["1/2/2021 9:05", None]]
+    trace = Trace.from_pairs(pairs)
+
+    assert trace.timestamps.dtype == np.int64
+    assert trace.values.dtype == np.float32
+    assert [list(trace.sample(i)) for i in range(len(trace))] == pairs
+    assert trace.nbytes == 3 * 12
+
+    other = Trace.from_pairs([["2021-01-01T00:00:00", 1], ["2021-01-01T00:15:00", 0]])
+    assert other.sample(0) == ("2021-01-01T00:00:00", 1)
+
+
+def test_convert_csv_to_memory_mapped_traces(tmp_path):
+    """
+    Test that CSV columns are streamed into trace files that servers memory-map and play back.
+    """
+    csv_path = tmp_path / "building.csv"
+    csv_path.write_text("time,dgps_0_A,lux\n1/1/2021 0:00,0.184,10\n1/1/2021 0:15,0.5,\n1/1/2021 0:30,0.25,30\n")
+
+    paths = convert_csv(str(csv_path), ["dgps_0_A", "lux"], str(tmp_path / "traces"), chunk_size=2)
+    trace = load_trace(paths["dgps_0_A"])
+    assert isinstance(trace.values, np.memmap)
+    assert [trace.sample(i) for i in range(len(trace))] == [("1/1/2021 0:00", 0.184), ("1/1/2021 0:15", 0.5),
+                                                            ("1/1/2021 0:30", 0.25)]
+    assert load_trace(paths["lux"]).value(1) is None
+
+    # Configs can point at the CSV directly, it is converted on first use
+    sensor = create_device("Glare", **{"csv": str(csv_path), "csv column": "dgps_0_A"})
+    assert [sensor.get()["value"] for _ in range(2)] == [0.184, 0.5]
+
+
+def test_convert_config_moves_inline_trace(tmp_path):
+    """
+    Test that a config's inline trace is moved to a trace file that the server plays back the same way.
+    """
+    config_path = tmp_path / "simulated_Glare_server_port_52000_config.json"
+    pairs = [["1/1/2021 0:00", 0.184], ["1/1/2021 0:15", 0.2]]
+    config_path.write_text(json.dumps({"endpoint": "/g", "port": 52000, "type": "Glare",
+                                       "simulated_values": {"Glare": pairs}}))
+
+    trace_path = convert_config(str(config_path), str(tmp_path / "traces"))
+    config = json.loads(config_path.read_text())
+    assert "simulated_values" not in config
+    assert config["trace"] == trace_path
+
+    sensor = create_device("Glare", **config)
+    assert [list(sensor.get().values()) for _ in range(3)] == pairs + pairs[:1]
+
+
+def test_identical_traces_share_one_buffer(tmp_path):
+    """
+    Test that sensors with identical traces share one read-only trace while keeping their own playback position.
+    """
+    pairs = [["1/1/2021 0:00", 0.184], ["1/1/2021 0:15", 0.2]]
+    first = create_device("Glare", simulated_values={"Glare": pairs})
+    second = create_device("Glare", simulated_values={"Glare": [list(pair) for pair in pairs]})
+    other = create_device("Glare", simulated_values={"Glare": pairs[:1]})
+
+    assert first.trace is second.trace
+    assert other.trace is not first.trace
+    assert not first.trace.values.flags.writeable
+    assert first.get()["value"] == 0.184
+    assert first.get()["value"] == 0.2
+    assert second.get()["value"] == 0.184
+
+    store = TraceStore()
+    trace_path = str(tmp_path / "glare.npy")
+    save_trace(trace_path, Trace.from_pairs(pairs))
+    trace = store.load(trace_path)
+    assert store.load(trace_path) is trace
+    assert store.stats() == {"traces": 1, "bytes": 24, "hits": 1, "misses": 1}
+
+    # Traces no sensor uses any more are dropped
+    del trace
+    assert store.stats()["traces"] == 0
+
+
+def test_clock_driven_playback_and_seek():
+    """
+    Test that sensors driven by a simulation clock return the sample in effect at the simulated time, however often
+    they are read, and wrap around at the end of their trace.
+    """
+    pairs = [["1/1/2021 0:00", 1], ["1/1/2021 0:30", 3], ["1/1/2021 0:15", 2], ["1/1/2021 0:45", 4]]
+    clock = SimulationClock("2021-01-01T00:20:00", speed=0)
+    first = create_device("Occupancy", simulated_values={"Occupancy": pairs}, clock=clock)
+    second = create_device("Occupancy", simulated_values={"Occupancy": pairs}, clock=clock)
+
+    assert [first.get()["value"] for _ in range(3)] == [2, 2, 2]
+    assert second.get() == {"timestamp": "1/1/2021 0:15", "value": 2}
+
+    clock.seek("1/1/2021 0:59")
+    assert first.get()["value"] == 4
+    clock.seek("2021-01-01T01:05:00")
+    assert first.get()["value"] == 1
+
+    clock.seek(0, speed=3600)
+    assert clock.speed == 3600
+    assert 0 < clock.now() < 3600
+
+
+def test_seek_simulation(agent):
+    """
+    Test that the seek RPC moves the manager's simulation clock, and is refused without one.
+    """
+    with pytest.raises(RuntimeError):
+        agent.seek_simulation("2021-06-01T12:00:00")
+    assert agent.get_simulation_time() is None
+
+    agent = OFCSimulationServerManager({"simulation_clock": {"start": "2021-01-01T00:00:00", "speed": 0}})
+    state = agent.seek_simulation("6/1/2021 12:00", speed=0)
+    assert state == {"time": "2021-06-01T12:00:00+00:00", "epoch": 1622548800.0, "speed": 0.0}
+    assert agent.get_simulation_time() == state
+
+
+def test_fault_injector_draws():
+    """
+    Test that injected outcomes follow the configured rates and latencies, and that bad settings are refused.
+    """
+    faults = FaultInjector(latency={"distribution": "uniform", "low": 0.01, "high": 0.02}, error_rate=0.2,
+                           drop_rate=0.1, seed=1)
+    draws = [faults.draw() for _ in range(2000)]
+    assert all(0.01 <= delay <= 0.02 for delay, _ in draws)
+    counts = faults.state()["counts"]
+    assert counts["requests"] == 2000 and counts["timeout"] == 0
+    assert 300 < counts["error"] < 500 and 130 < counts["drop"] < 270
+
+    faults.configure()
+    assert faults.draw() == (0.0, "ok")
+    faults.configure(latency=0.5)
+    assert faults.settings()["latency"] == {"distribution": "constant", "seconds": 0.5}
+    for settings in ({"error_rate": 0.6, "drop_rate": 0.6}, {"latency": {"distribution": "pareto"}},
+                     {"latency": {"distribution": "uniform", "mean": 1}}, {"error_rate": 0.1, "error_status": 200}):
+        with pytest.raises(ValueError):
+            faults.configure(**settings)
+
+
+def test_injected_faults_on_both_servers():
+    """
+    Test that the Flask and async servers answer injected errors with the configured status and drop connections
+    without a response.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        flask_port = sock.getsockname()[1]
+    handle = create_server_in_thread("/light", flask_port, None, "Light", value_field="level",
+                                     faults={"error_rate": 1, "error_status": 504})
+    server = AsyncSimulationServer(route_by="path", port=0)
+    server.start()
+    handle.start()
+    try:
+        device = create_async_server(server, "/light", 52200, None, "Light", value_field="level",
+                                     faults={"error_rate": 1, "error_status": 504})
+        device.start()
+        async_port = server.listeners[0].sockets[0].getsockname()[1]
+
+        for url, faults in ((f"http://127.0.0.1:{flask_port}/light", handle.device.faults),
+                            (f"http://127.0.0.1:{async_port}/52200/light", device.device.faults)):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(url)
+            assert error.value.code == 504
+
+            faults.configure(drop_rate=1)
+            with pytest.raises((http.client.RemoteDisconnected, ConnectionError, urllib.error.URLError)):
+                urllib.request.urlopen(url)
+
+            faults.configure()
+            assert json.load(urllib.request.urlopen(url)) == {"level": -1}
+            assert faults.state()["counts"] == {"requests": 3, "error": 1, "timeout": 0, "drop": 1}
+    finally:
+        handle.stop()
+        server.stop()
+
+
+def test_async_server_batch_reads():
+    """
+    Test that the batch endpoint reads devices by the URLs they are read at one by one, and reports failed and
+    unknown devices separately.
+    """
+    server = AsyncSimulationServer(route_by="path", port=0)
+    server.start()
+    try:
+        create_async_server(server, "/glare", 52000, None, "Glare",
+                            simulated_values={"Glare": [["1/1/2021 0:00", 0.1], ["1/1/2021 0:15", 0.2]]}).start()
+        create_async_server(server, "/light", 52300, None, "Light", value_field="light_level").start()
+        create_async_server(server, "/light", 52301, None, "Light", value_field="light_level",
+                            faults={"error_rate": 1}).start()
+        port = server.listeners[0].sockets[0].getsockname()[1]
+
+        points = ["http://localhost:52000/glare", "http://localhost:52300/light", "http://localhost:52301/light",
+                  "http://localhost:52302/light"]
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/batch", data=json.dumps({"points": points}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        assert json.load(urllib.request.urlopen(request)) == {
+            "points": {points[0]: {"timestamp": "1/1/2021 0:00", "value": 0.1}, points[1]: {"light_level": -1}},
+            "errors": {points[2]: {"status": 503, "message": "injected error"},
+                       points[3]: {"status": 404, "message": "not found"}}}
+        assert server.batch(b'{"points": "http://localhost:52000/glare"}')[1] == 400
+        fixtures = ["http://localhost:52000/glare?fixture=1", "http://localhost:52000/glare?fixture=2"]
+        assert list(server.batch(json.dumps({"points": fixtures}).encode())[2]["points"]) == fixtures
+    finally:
+        server.stop()
+
+
+def test_write_history():
+    """
+    Test that read-write servers record their writes in a bounded history served over HTTP and RPC.
+    """
+    light = create_device("Light", value_field="level", history_size=3,
+                          clock=SimulationClock("2021-01-01T00:00:00", speed=0))
+    for value in (10, None, 30, 40):
+        light.set({"level": value})
+    history = light.write_history()
+    assert history["writes"] == 4 and history["dropped"] == 1
+    assert [(entry["seq"], entry["value"], entry["status"]) for entry in history["history"]] == [
+        (2, None, 400), (3, 30, 200), (4, 40, 200)]
+    assert history["history"][0]["simulated_time"] == 1609459200.0
+    assert [entry["value"] for entry in light.write_history(limit=1)["history"]] == [40]
+    assert light.write_history(since=history["history"][-1]["time"])["history"] == []
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        flask_port = sock.getsockname()[1]
+    handle = create_server_in_thread("/light", flask_port, None, "Light", value_field="level")
+    server = AsyncSimulationServer(route_by="path", port=0)
+    server.start()
+    handle.start()
+    try:
+        create_async_server(server, "/light", 52300, None, "Light", value_field="level").start()
+        async_port = server.listeners[0].sockets[0].getsockname()[1]
+        for url in (f"http://127.0.0.1:{flask_port}/light", f"http://127.0.0.1:{async_port}/52300/light"):
+            for value in (1, 2):
+                urllib.request.urlopen(urllib.request.Request(url, data=json.dumps({"level": value}).encode(),
+                                                              headers={"Content-Type": "application/json"}))
+            history = json.load(urllib.request.urlopen(f"{url}/history?limit=1"))
+            assert history["writes"] == 2 and [entry["value"] for entry in history["history"]] == [2]
+    finally:
+        handle.stop()
+        server.stop()
+
+    agent = OFCSimulationServerManager({})
+    agent.server_threads = {"servers/light": handle,
+                            "servers/glare": create_server_in_thread("/glare", 5000, None, "Glare",
+                                                                     simulated_values=[["1/1/2021 0:00", 1]])}
+    assert agent.get_write_history("servers/light")["writes"] == 2
+    with pytest.raises(ValueError):
+        agent.get_write_history("servers/glare")
+
+
+def test_generate_site(tmp_path):
+    """
+    Test that generated sites are reproducible, plausible and playable by the simulated servers.
+    """
+    template = {"days": 7, "profiles": 2, "sensors": {"Occupancy": {"probability": 1.0}}}
+    counts = generate_site(tmp_path / "a", 3, template, seed=5)
+    assert counts == {"rooms": 3, "traces": 7, "servers": 16, "drivers": 16}
+    generate_site(tmp_path / "b", 3, template, seed=5)
+    generate_site(tmp_path / "c", 3, template, seed=6)
+    glare = np.load(tmp_path / "a" / "traces" / "glare_1.npy")
+    assert len(glare) == 7 * 96 and np.array_equal(glare, np.load(tmp_path / "b" / "traces" / "glare_1.npy"))
+    assert not np.array_equal(glare, np.load(tmp_path / "c" / "traces" / "glare_1.npy"))
+    assert 0.15 < glare["value"].min() and glare["value"].max() < 0.26
+
+    occupancy = np.load(tmp_path / "a" / "traces" / "occupancy_0.npy")
+    hours = (occupancy["timestamp"] % 86400) // 3600
+    assert set(occupancy["value"]) == {0.0, 1.0}
+    assert not occupancy["value"][hours < 7].any() and occupancy["value"][hours == 12][:3].all()
+    solar = np.load(tmp_path / "a" / "traces" / "solar_radiation.npy")["value"]
+    assert solar[hours == 0].max() == 0 and solar.max() > 100
+
+    area = json.load(open(tmp_path / "a" / "areas" / "R0002.config"))
+    assert area["Area"] == "SIM/B1/R0002/"
+    assert {"Type": "Glare", "VOLTTRON Endpoint": "SIM/B1/R0002/enlighted_glare/glare"} in area["Devices"]
+    driver = json.load(open(tmp_path / "a" / "drivers" / "SIM_B1_R0002_cree_light.config"))
+    assert driver["driver_config"]["host_name"] == "http://localhost:20014"
+    server = json.load(open(tmp_path / "a" / "simulation_servers" / "simulated_Glare_server_port_20011_config.json"))
+    assert server["trace"].endswith("glare_0.npy")
+    device = create_device(server.pop("type"), clock=SimulationClock("2021-01-01T06:00:00", speed=0), **server)
+    assert device.get()["value"] == pytest.approx(float(np.load(server["trace"])["value"][24]))
+    store_configs = open(tmp_path / "a" / "store-configs").read()
+    area_path = tmp_path / "a" / "areas" / "R0002.config"
+    assert f"vctl config store ofc.controller areas/R0002 {area_path}\n" in store_configs
+
+    with pytest.raises(ValueError):
+        generate_site(tmp_path / "d", 20000, template)
+
+    # Rooms reuse the traces of 16 profiles by default, and have their own without profiles
+    assert generate_site(tmp_path / "e", 20, {"days": 1})["traces"] == 1 + 3 * 16
+    assert generate_site(tmp_path / "f", 20, {"days": 1, "profiles": None})["traces"] == 1 + 3 * 20
+
+
+def test_set_server_faults(agent):
+    """
+    Test that the fault RPC methods change and report the faults of a running server.
+    """
+    agent.server_threads["servers/light"] = create_server_in_thread("/light", 5000, None, "Light",
+                                                                     value_field="level")
+    state = agent.set_server_faults("servers/light", {"latency": 0.1, "timeout_rate": 0.5, "timeout": 4})
+    assert state["settings"]["timeout"] == 4.0
+    assert agent.get_server_faults() == {"servers/light": state}
+    with pytest.raises(KeyError):
+        agent.set_server_faults("servers/missing", {})
+
+
+def test_sharded_simulation_host():
+    """
+    Test that devices served by worker processes are read over HTTP, reported in the worker stats and restored when
+    their worker is restarted after dying or failing to answer.
+    """
+    with socket.socket() as first, socket.socket() as second:
+        first.bind(("127.0.0.1", 0))
+        second.bind(("127.0.0.1", 0))
+        ports = [first.getsockname()[1], second.getsockname()[1]]
+
+    agent = OFCSimulationServerManager({"simulation_workers": {"workers": 2}})
+    try:
+        for port in ports:
+            agent.add_server(f"servers/{port}", "NEW", {"type": "Glare", "port": port, "endpoint": "/glare",
+                                                        "api_key": None,
+                                                        "simulated_values": {"Glare": [["1/1/2021 0:00", 0.1]]}})
+        for port in ports:
+            assert json.load(urllib.request.urlopen(f"http://127.0.0.1:{port}/glare"))["value"] == 0.1
+
+        stats = agent.get_worker_stats()
+        assert stats["devices"] == 2 and all(worker["alive"] for worker in stats["workers"])
+        assert agent.set_server_faults(f"servers/{ports[0]}", {"error_rate": 1})["counts"]["requests"] == 1
+
+        worker = agent.workers.shard({"port": ports[0]})
+        worker.process.kill()
+        worker.process.join()
+        assert agent.workers.supervise() == [worker.index]
+        assert worker.restarts == 1
+        assert json.load(urllib.request.urlopen(f"http://127.0.0.1:{ports[0]}/glare"))["value"] == 0.1
+
+        # A worker that answers late is terminated rather than left to answer the next command
+        with patch.object(worker.connection, "poll", return_value=False), pytest.raises(RuntimeError):
+            worker.call("stats")
+        assert not worker.alive
+        assert agent.workers.supervise() == [worker.index]
+        assert worker.call("stats")["devices"] == sum(agent.workers.shard({"port": port}) is worker for port in ports)
+        assert json.load(urllib.request.urlopen(f"http://127.0.0.1:{ports[0]}/glare"))["value"] == 0.1
+
+        agent.remove_server(f"servers/{ports[1]}", "DELETE", None)
+        assert agent.get_worker_stats()["devices"] == 1
+    finally:
+        agent.workers.stop()
+
+
 def test_main(mocker):
     """
     Test the main entry point to ensure the agent is started correctly.
@@ -143,6 +143,36 @@ def test_algorithm_output_topics_endpoint(mock_get_topic_data, agent):
     assert result == [{"timestamp": 1, "action": "action_value", "reason": "reason_value"}]
 
 
+@patch('ofc_web_agent.OFCWebAgent.get_topic_data_from_historian')
+def test_algorithm_output_topics_endpoint_batch(mock_get_topic_data, agent):
+    """
+    Test that batched analysis records are expanded into one row per area.
+    """
+    batch = {"areas": ["a", "b"], "light_level": [0.6, 0.8], "facade_state": [1, 2], "light_rule": [0, 1],
+             "facade_rule": [0, -1]}
+    mock_get_topic_data.side_effect = [None, None, {"values": [(1, batch)]}]
+
+    result = agent.algorithm_output_topics_endpoint(path="/ofc_analysis/some_path")
+
+    assert [row["area"] for row in result] == ["a", "b"]
+    assert result[1]["light_level"] == 0.8
+    assert result[1]["reason"] == "Light level reason: Rule 1, Façade state reason: Default"
+
+
+@patch('ofc_web_agent.OFCWebAgent.get_topic_data_from_historian')
+def test_algorithm_output_topics_endpoint_structured(mock_get_topic_data, agent):
+    """
+    Test that structured records keep the whole area name, slashes included.
+    """
+    fields = {"light_level": 0.6, "facade_state": 1, "light_rule": 0, "facade_rule": -1, "stale": 0}
+    mock_get_topic_data.side_effect = lambda topic: (
+        {"values": [(1, fields[topic.rsplit("/", 1)[1]])]} if topic.rsplit("/", 1)[1] in fields else None)
+
+    result = agent.algorithm_output_topics_endpoint(path="/ofc_analysis/ofc.algorithm/SIM/B1/R0001/")
+
+    assert [(row["area"], row["light_level"]) for row in result] == [("SIM/B1/R0001/", 0.6)]
+
+
 @patch('ofc_web_agent.OFCWebAgent.vip')
 def test_config_files_no_path(mock_vip, agent):
     """